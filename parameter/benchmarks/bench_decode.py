@@ -0,0 +1,97 @@
+"""
+大きな立ち絵のデコード時間とピークメモリ（RSS）を測るベンチマーク
+
+    python benchmarks/bench_decode.py [--width 4000 --height 6000]
+
+JPEG と PNG のそれぞれについて、従来の全解像度デコードと縮小デコードを
+別プロセスで実行し、所要時間・ピーク RSS・出力画像の差（PSNR）を表示する
+"""
+import argparse
+import io
+import json
+import math
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+PARAMETER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PARAMETER_DIR)
+
+def make_sample(path, fmt, width, height):
+    from PIL import Image, ImageFilter
+
+    # 写真に近い滑らかな模様（ノイズを拡大してぼかしたもの）
+    noise = Image.effect_noise((width // 16, height // 16), 64).convert("RGB")
+    image = noise.resize((width, height), Image.Resampling.BICUBIC).filter(ImageFilter.GaussianBlur(2))
+    image.save(path, fmt, **({"quality": 90} if fmt == "JPEG" else {}))
+
+def run_case(path, reduced):
+    """
+    子プロセスの中で1回だけ前処理を行い、結果を JSON で返す
+    """
+    import resource
+
+    from parameter_render.portrait import PORTRAIT_BOXES, PortraitCache
+
+    with open(path, "rb") as fp:
+        data = fp.read()
+    cache = PortraitCache(reduced_decode=reduced)
+    started = time.perf_counter()
+    for box in PORTRAIT_BOXES:
+        cache.get(data, box)
+    elapsed = time.perf_counter() - started
+    output = io.BytesIO()
+    cache.get(data, PORTRAIT_BOXES[0]).save(output, "PNG")
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss  # Linux では KiB
+    return {"seconds": elapsed, "peak_rss_mib": peak_rss / 1024, "png": output.getvalue().hex()}
+
+def psnr(png_a, png_b):
+    from PIL import Image, ImageChops, ImageStat
+
+    image_a = Image.open(io.BytesIO(bytes.fromhex(png_a))).convert("RGB")
+    image_b = Image.open(io.BytesIO(bytes.fromhex(png_b))).convert("RGB")
+    mse = sum(value ** 2 for value in ImageStat.Stat(ImageChops.difference(image_a, image_b)).rms) / 3
+    return float("inf") if mse == 0 else 10 * math.log10(255 ** 2 / mse)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--width", type=int, default=4000)
+    parser.add_argument("--height", type=int, default=6000)
+    parser.add_argument("--case", nargs=2, metavar=("PATH", "REDUCED"), help=argparse.SUPPRESS)
+    parser.add_argument("--make", nargs=2, metavar=("PATH", "FORMAT"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.case:
+        print(json.dumps(run_case(args.case[0], args.case[1] == "1")))
+        return
+    if args.make:
+        make_sample(args.make[0], args.make[1], args.width, args.height)
+        return
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        print(f"{'format':<6} {'size MB':>8} {'mode':<8} {'time ms':>9} {'peak RSS MiB':>13} {'PSNR dB':>8}")
+        for fmt, ext in (("JPEG", ".jpg"), ("PNG", ".png")):
+            path = os.path.join(tmp_dir, f"sample{ext}")
+            # ピーク RSS は fork 時に親プロセスから引き継がれるため、サンプル生成も別プロセスで行う
+            subprocess.run(
+                [sys.executable, __file__, "--make", path, fmt, "--width", str(args.width), "--height", str(args.height)],
+                check=True
+            )
+            results = {}
+            for mode, flag in (("full", "0"), ("reduced", "1")):
+                completed = subprocess.run(
+                    [sys.executable, __file__, "--case", path, flag],
+                    check=True, capture_output=True, text=True
+                )
+                results[mode] = json.loads(completed.stdout)
+            for mode, result in results.items():
+                quality = psnr(results["full"]["png"], result["png"])
+                print(
+                    f"{fmt:<6} {os.path.getsize(path) / 1e6:8.1f} {mode:<8} {result['seconds'] * 1000:9.1f} "
+                    f"{result['peak_rss_mib']:13.1f} {quality:8.1f}"
+                )
+
+if __name__ == "__main__":
+    main()
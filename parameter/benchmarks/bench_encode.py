@@ -0,0 +1,65 @@
+"""
+出力形式ごとの書き出し時間とサイズを比べるベンチマーク
+
+    python benchmarks/bench_encode.py [-n 5] [--scale 0.5] [--formats png,webp]
+
+立ち絵なし・立ち絵ありの能力値画像を各形式で書き出し、
+書き出し時間（中央値）とバイト数を表示する
+"""
+import argparse
+import io
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from parameter_render import (  # noqa: E402
+    LOCAL_FONTS,
+    RenderSpec,
+    available_encoders,
+    default_font_scale,
+    encode_report,
+    render_image,
+)
+
+def sample_portrait():
+    from PIL import Image
+
+    # 写真に近い（色数の多い）立ち絵の代わり
+    image = Image.merge("RGB", [Image.effect_noise((900, 1400), sigma) for sigma in (40, 60, 80)])
+    image_bytes = io.BytesIO()
+    image.save(image_bytes, format="JPEG", quality=90)
+    return image_bytes.getvalue()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("-n", "--repeat", type=int, default=5)
+    parser.add_argument("--scale", type=float, default=1.0)
+    parser.add_argument("--formats", default=None, help="カンマ区切りの形式名 (既定: 使える形式すべて)")
+    args = parser.parse_args()
+
+    formats = args.formats.split(",") if args.formats else available_encoders()
+    font_name, font_path = next(iter(LOCAL_FONTS.items()), (None, None))
+    base_spec = RenderSpec(
+        values=("3", "2", "4", "1"),
+        checks=tuple(index % 3 == 0 for index in range(20)),
+        filename="ベンチマーク",
+        font_path=font_path,
+        font_scale=default_font_scale(font_name) if font_name else 1.0,
+    )
+    cases = [
+        ("立ち絵なし", base_spec),
+        ("立ち絵あり", base_spec.replace(portrait=sample_portrait())),
+    ]
+
+    print(f"{'case':<10} {'format':<12} {'encode ms':>10} {'bytes':>10} {'vs png':>8}")
+    for case_name, spec in cases:
+        img = render_image(spec, args.scale)
+        report = encode_report(img, formats, repeat=args.repeat)
+        png_bytes = next((row["bytes"] for row in report if row["format"] == "png"), None)
+        for row in report:
+            ratio = f"{row['bytes'] / png_bytes:8.1%}" if png_bytes else f"{'-':>8}"
+            print(f"{case_name:<10} {row['format']:<12} {row['encode_ms']:10.2f} {row['bytes']:10d} {ratio}")
+
+if __name__ == "__main__":
+    main()
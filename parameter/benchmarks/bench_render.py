@@ -0,0 +1,216 @@
+"""
+create_image のベンチマーク
+
+    python benchmarks/bench_render.py [-n 20] [--fonts DotGothic16-Regular,...] [-o results.json]
+    python benchmarks/bench_render.py --compare benchmarks/results/render-<前のコミット>.json
+
+assets/fonts の全フォント × 立ち絵（なし / 小 / 10MB）× 左右入れ替え（なし / あり）×
+キャッシュ（cold: 毎回フォント・下地・立ち絵のキャッシュを空にする / warm: 1回目の後）の組み合わせごとに、
+所要時間のパーセンタイル、tracemalloc で測ったピークメモリ、出力のバイト数を記録し、
+コミット ID などの実行環境と合わせて JSON に保存する（既定は benchmarks/results/render-<コミット>.json）
+--compare を指定すると、以前の結果と中央値を比べ、閾値を超えて遅くなった組み合わせがあれば終了コード 1 を返す
+"""
+import argparse
+import datetime
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_DIR)
+
+from parameter_render import (  # noqa: E402
+    FONT_POOL,
+    LOCAL_FONTS,
+    PORTRAIT_CACHE,
+    create_image,
+    default_font_scale,
+    get_font_height,
+)
+from parameter_render.image import TEMPLATE_CACHE  # noqa: E402
+from parameter_render.timing import percentile  # noqa: E402
+
+RESULTS_DIR = os.path.join(APP_DIR, "benchmarks", "results")
+PERCENTILES = (50, 90, 95, 99)
+RESULT_FORMAT_VERSION = 1
+
+def sample_portraits():
+    """
+    立ち絵の種類 → バイト列（Pillow のノイズ画像。同じ環境なら毎回同じ内容になる）
+    """
+    from PIL import Image
+
+    def noise(size, sigmas):
+        return Image.merge("RGB", [Image.effect_noise(size, sigma) for sigma in sigmas])
+
+    small = io.BytesIO()
+    noise((600, 900), (40, 60, 80)).save(small, format="JPEG", quality=90)
+    # 圧縮の効かない写真相当の PNG で、アップロード上限付近（約 10MB）にする
+    large = io.BytesIO()
+    noise((1900, 1850), (90, 100, 110)).save(large, format="PNG", compress_level=1)
+    return {"none": None, "small": small.getvalue(), "10mb": large.getvalue()}
+
+def clear_render_caches():
+    FONT_POOL.clear()
+    TEMPLATE_CACHE.clear()
+    PORTRAIT_CACHE.clear()
+    get_font_height.cache_clear()
+
+def git_commit():
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=APP_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+        dirty = bool(subprocess.run(
+            ["git", "status", "--porcelain", "--untracked-files=no"], cwd=APP_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip())
+    except (OSError, subprocess.CalledProcessError):
+        return None, False
+    return commit, dirty
+
+def environment():
+    import PIL
+
+    commit, dirty = git_commit()
+    return {
+        "format": RESULT_FORMAT_VERSION,
+        "commit": commit,
+        "dirty": dirty,
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "pillow": PIL.__version__,
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+    }
+
+def run_case(font_name, font_path, portrait, swap_layout, cache, repeat):
+    values = {"u": "3", "v": "2", "w": "4", "x": "1"}
+    checks = {key: index % 3 == 0 for index, key in enumerate("abcdefghijklmnopqrst")}
+    style = {
+        "font_path": font_path,
+        "font_scale": default_font_scale(font_name),
+        "swap_layout": swap_layout,
+    }
+
+    def render():
+        uploaded_file = io.BytesIO(portrait) if portrait else None
+        img_bytes, _ = create_image(values, checks, "ベンチマーク", False, uploaded_file, **style)
+        return img_bytes.getbuffer().nbytes
+
+    if cache == "warm":
+        clear_render_caches()
+        render()
+
+    timings = []
+    for _ in range(repeat):
+        if cache == "cold":
+            clear_render_caches()
+        started = time.perf_counter()
+        output_bytes = render()
+        timings.append((time.perf_counter() - started) * 1000)
+
+    # ピークメモリは計測の負荷が大きいため、時間とは別の1回で測る
+    # （tracemalloc が数えるのは Python のメモリ確保だけで、Pillow の画像バッファは含まれない）
+    if cache == "cold":
+        clear_render_caches()
+    tracemalloc.start()
+    try:
+        render()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    timings.sort()
+    result = {
+        "n": repeat,
+        "mean_ms": statistics.fmean(timings),
+        "min_ms": timings[0],
+        "max_ms": timings[-1],
+        "peak_kib": peak / 1024,
+        "bytes": output_bytes,
+    }
+    for percent in PERCENTILES:
+        result[f"p{percent}_ms"] = percentile(timings, percent)
+    return result
+
+def case_key(case):
+    return f"{case['font']}/{case['portrait']}/{'swap' if case['swap_layout'] else 'normal'}/{case['cache']}"
+
+def compare(previous, current, threshold):
+    """
+    中央値を比べた表を表示し、threshold（0.1 = 10%）を超えて遅くなった件数を返す
+    """
+    previous_cases = {case_key(case): case for case in previous["cases"]}
+    print(f"\n比較対象: {previous['environment'].get('commit')} → {current['environment'].get('commit')}")
+    regressions = 0
+    for case in current["cases"]:
+        key = case_key(case)
+        before = previous_cases.get(key)
+        if before is None:
+            continue
+        ratio = case["p50_ms"] / before["p50_ms"] if before["p50_ms"] else 1.0
+        mark = ""
+        if ratio > 1 + threshold:
+            mark = "  ⚠️ 遅くなりました"
+            regressions += 1
+        elif ratio < 1 - threshold:
+            mark = "  ✅"
+        print(f"{key:<50} {before['p50_ms']:9.2f} → {case['p50_ms']:9.2f} ms ({ratio - 1:+7.1%}){mark}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-n", "--repeat", type=int, default=20)
+    parser.add_argument("--fonts", default=None, help="カンマ区切りのフォント名 (既定: assets/fonts のすべて)")
+    parser.add_argument("--portraits", default="none,small,10mb", help="カンマ区切りの立ち絵の種類 (none, small, 10mb)")
+    parser.add_argument("-o", "--output", default=None, help="結果の JSON の保存先")
+    parser.add_argument("--compare", default=None, help="比較する以前の結果の JSON")
+    parser.add_argument("--threshold", type=float, default=0.1, help="遅くなったと判定する中央値の増加率 (既定 0.1)")
+    args = parser.parse_args()
+
+    fonts = LOCAL_FONTS
+    if args.fonts:
+        fonts = {name: LOCAL_FONTS[name] for name in args.fonts.split(",")}
+    portraits = sample_portraits()
+    portrait_names = args.portraits.split(",")
+
+    env = environment()
+    cases = []
+    print(f"{'font':<24} {'portrait':<8} {'layout':<7} {'cache':<5} {'p50 ms':>8} {'p95 ms':>8} {'peak KiB':>10} {'bytes':>9}")
+    for font_name, font_path in fonts.items():
+        for portrait_name in portrait_names:
+            for swap_layout in (False, True):
+                for cache in ("cold", "warm"):
+                    result = run_case(font_name, font_path, portraits[portrait_name], swap_layout, cache, args.repeat)
+                    case = {"font": font_name, "portrait": portrait_name, "swap_layout": swap_layout, "cache": cache, **result}
+                    cases.append(case)
+                    print(
+                        f"{font_name:<24} {portrait_name:<8} {'swap' if swap_layout else 'normal':<7} {cache:<5} "
+                        f"{case['p50_ms']:8.2f} {case['p95_ms']:8.2f} {case['peak_kib']:10.0f} {case['bytes']:9d}"
+                    )
+
+    results = {"environment": env, "repeat": args.repeat, "cases": cases}
+    output = args.output
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, f"render-{(env['commit'] or 'unknown')[:12]}{'-dirty' if env['dirty'] else ''}.json")
+    with open(output, "w", encoding="utf-8") as output_file:
+        json.dump(results, output_file, ensure_ascii=False, indent=1)
+        output_file.write("\n")
+    print(f"\n結果を {output} に保存しました")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as previous_file:
+            previous = json.load(previous_file)
+        if compare(previous, results, args.threshold):
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
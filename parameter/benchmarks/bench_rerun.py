@@ -0,0 +1,117 @@
+"""
+入力欄を変更した時の再実行の所要時間を測るベンチマーク
+
+    python benchmarks/bench_rerun.py [-n 80] [--port 8599] [--app parameter_streamlit_app_cached.py]
+
+アプリを streamlit run で起動し、ブラウザと同じ WebSocket 経由で能力値（身体）を
+書き換えながら、変更の送信から再実行の完了通知（script_finished）までの時間を計測する
+入力欄がフラグメントの中にあれば、ブラウザと同様にそのフラグメントだけを再実行させる
+"""
+import argparse
+import asyncio
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+async def _receive_until_finished(websocket, deltas):
+    from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+
+    while True:
+        message = ForwardMsg()
+        message.ParseFromString(await websocket.recv())
+        message_type = message.WhichOneof("type")
+        if message_type == "delta":
+            deltas.append(message)
+        elif message_type == "script_finished":
+            return
+
+def _find_widget(deltas, key):
+    """
+    ウィジェットの ID と、それを含むフラグメントの ID を探す
+    """
+    for message in deltas:
+        if message.delta.WhichOneof("type") != "new_element":
+            continue
+        element = message.delta.new_element
+        widget = getattr(element, element.WhichOneof("type"))
+        widget_id = getattr(widget, "id", "")
+        if widget_id.endswith(f"-{key}"):
+            return widget_id, message.delta.fragment_id
+    raise LookupError(f"ウィジェット {key} が見つかりません")
+
+async def measure(port, iterations, warmup=5):
+    import websockets
+    from streamlit.proto.BackMsg_pb2 import BackMsg
+
+    async with websockets.connect(
+        f"ws://127.0.0.1:{port}/_stcore/stream", subprotocols=["streamlit"], max_size=None
+    ) as websocket:
+        first_run = BackMsg()
+        first_run.rerun_script.query_string = ""
+        await websocket.send(first_run.SerializeToString())
+        deltas = []
+        await _receive_until_finished(websocket, deltas)
+        widget_id, fragment_id = _find_widget(deltas, "u")
+
+        timings = []
+        delta_counts = []
+        for index in range(warmup + iterations):
+            rerun = BackMsg()
+            widget_state = rerun.rerun_script.widget_states.widgets.add()
+            widget_state.id = widget_id
+            widget_state.string_value = str(index % 5 + 1)
+            if fragment_id:
+                rerun.rerun_script.fragment_id = fragment_id
+            started = time.perf_counter()
+            await websocket.send(rerun.SerializeToString())
+            deltas = []
+            await _receive_until_finished(websocket, deltas)
+            if index >= warmup:
+                timings.append((time.perf_counter() - started) * 1000)
+                delta_counts.append(len(deltas))
+        return timings, delta_counts, fragment_id
+
+def _wait_for_port(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), 0.2).close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise TimeoutError("アプリが起動しませんでした")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("-n", "--iterations", type=int, default=80)
+    parser.add_argument("--port", type=int, default=8599)
+    parser.add_argument("--app", default="parameter_streamlit_app_cached.py")
+    args = parser.parse_args()
+
+    server = subprocess.Popen(
+        [sys.executable, "-m", "streamlit", "run", args.app,
+         "--server.port", str(args.port), "--server.headless", "true"],
+        cwd=APP_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        _wait_for_port(args.port)
+        timings, delta_counts, fragment_id = asyncio.run(measure(args.port, args.iterations))
+    finally:
+        server.terminate()
+        server.wait()
+
+    timings.sort()
+    print(f"再実行の範囲: {'フラグメント ' + fragment_id if fragment_id else 'ページ全体'}")
+    print(f"送信される要素数: {statistics.median(delta_counts):.0f}")
+    print(
+        f"所要時間: 中央値 {statistics.median(timings):.1f} ms, "
+        f"p95 {timings[int(len(timings) * 0.95)]:.1f} ms"
+    )
+
+if __name__ == "__main__":
+    main()
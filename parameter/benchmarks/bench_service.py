@@ -0,0 +1,135 @@
+"""
+描画サービス（parameter_render.server）の負荷試験
+
+    python benchmarks/bench_service.py [--url http://127.0.0.1:8600] [-c 8] [-n 400] [--distinct 50] [--portrait small]
+    python benchmarks/bench_service.py --start [--workers 4]   # サービスもこのスクリプトから起動する
+
+-c 本の Keep-Alive 接続から合計 -n 件の POST /render を送り、スループットと応答時間のパーセンタイル、
+ステータス別の件数（混雑時の 503 など）を表示する
+--distinct で名前の種類数を指定すると、それを超えた分はキャッシュから返る（1 なら全件同じ仕様）
+"""
+import argparse
+import base64
+import http.client
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from collections import Counter
+from urllib.parse import urlsplit
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_DIR)
+
+from bench_render import sample_portraits  # noqa: E402
+from parameter_render.timing import percentile  # noqa: E402
+
+PERCENTILES = (50, 90, 95, 99)
+
+def request_bodies(distinct, portrait):
+    rows = []
+    for index in range(distinct):
+        row = {
+            "name": f"負荷試験{index}",
+            "u": str(index % 9), "v": "2", "w": "4", "x": "1",
+            "font": "DotGothic16-Regular",
+        }
+        for key_index, key in enumerate("abcdefghijklmnopqrst"):
+            row[key] = (index + key_index) % 3 == 0
+        if portrait:
+            row["portrait_base64"] = base64.b64encode(portrait).decode("ascii")
+        rows.append(json.dumps(row, ensure_ascii=False).encode("utf-8"))
+    return rows
+
+def wait_until_ready(host, port, timeout=30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            connection = http.client.HTTPConnection(host, port, timeout=1)
+            connection.request("GET", "/healthz")
+            if connection.getresponse().status == 200:
+                return True
+        except OSError:
+            time.sleep(0.2)
+    return False
+
+def run_client(host, port, path, bodies, count, offset, results, lock):
+    connection = http.client.HTTPConnection(host, port, timeout=60)
+    timings = []
+    statuses = Counter()
+    for index in range(count):
+        body = bodies[(offset + index) % len(bodies)]
+        started = time.perf_counter()
+        try:
+            connection.request("POST", path, body=body, headers={"Content-Type": "application/json"})
+            response = connection.getresponse()
+            response.read()
+            status = response.status
+            if response.will_close:
+                connection.close()
+        except (OSError, http.client.HTTPException):
+            status = "error"
+            connection.close()
+        timings.append((time.perf_counter() - started) * 1000)
+        statuses[status] += 1
+    connection.close()
+    with lock:
+        results["timings"].extend(timings)
+        results["statuses"].update(statuses)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://127.0.0.1:8600", help="サービスの URL (既定: http://127.0.0.1:8600)")
+    parser.add_argument("-c", "--concurrency", type=int, default=8, help="同時接続数 (既定 8)")
+    parser.add_argument("-n", "--requests", type=int, default=400, help="リクエストの総数 (既定 400)")
+    parser.add_argument("--distinct", type=int, default=50, help="仕様の種類数 (既定 50)")
+    parser.add_argument("--portrait", default="none", choices=("none", "small", "10mb"), help="立ち絵の種類 (既定 none)")
+    parser.add_argument("--format", default="png", help="出力形式 (既定 png)")
+    parser.add_argument("--start", action="store_true", help="サービスをこのスクリプトから起動する")
+    parser.add_argument("--workers", type=int, default=None, help="--start の時の描画スレッド数")
+    args = parser.parse_args()
+
+    url = urlsplit(args.url)
+    host, port = url.hostname, url.port or 80
+    server = None
+    if args.start:
+        command = [sys.executable, "-m", "parameter_render.server", "--host", host, "--port", str(port)]
+        if args.workers:
+            command += ["--workers", str(args.workers)]
+        server = subprocess.Popen(command, cwd=APP_DIR)
+    try:
+        if not wait_until_ready(host, port):
+            print(f"⚠️ {args.url} に接続できません", file=sys.stderr)
+            sys.exit(1)
+        bodies = request_bodies(args.distinct, sample_portraits()[args.portrait])
+        path = f"/render?format={args.format}"
+        results = {"timings": [], "statuses": Counter()}
+        lock = threading.Lock()
+        per_client, remainder = divmod(args.requests, args.concurrency)
+        threads = [
+            threading.Thread(
+                target=run_client,
+                args=(host, port, path, bodies, per_client + (index < remainder), index * per_client, results, lock)
+            )
+            for index in range(args.concurrency)
+        ]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    timings = sorted(results["timings"])
+    print(f"{len(timings)} 件 / {elapsed:.2f} 秒 = {len(timings) / elapsed:.1f} 件/秒（同時接続 {args.concurrency}）")
+    print("  ".join(f"p{percent} {percentile(timings, percent):.1f} ms" for percent in PERCENTILES))
+    print("ステータス: " + ", ".join(f"{status} × {count}" for status, count in sorted(results["statuses"].items(), key=str)))
+
+if __name__ == "__main__":
+    main()
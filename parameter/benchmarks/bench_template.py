@@ -0,0 +1,47 @@
+"""
+下地テンプレートの効果を測るベンチマーク
+
+    python benchmarks/bench_template.py [-n 200]
+
+テンプレートを毎回作り直す場合（コールド）と再利用する場合（ウォーム）で
+render_image の1回あたりの所要時間を比較する
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from parameter_render import LOCAL_FONTS, RenderSpec, default_font_scale, render_image  # noqa: E402
+from parameter_render.image import TEMPLATE_CACHE  # noqa: E402
+
+def measure(spec, iterations, cold):
+    timings = []
+    render_image(spec)  # フォントの読み込みを計測から除く
+    for i in range(iterations):
+        if cold:
+            TEMPLATE_CACHE.clear()
+        # 値を変えながら描画する（キャラごとに異なる入力を想定）
+        values = tuple(str((i + offset) % 6) for offset in range(4))
+        checks = tuple((i + index) % 3 == 0 for index in range(20))
+        started = time.perf_counter()
+        render_image(spec.replace(values=values, checks=checks, filename=f"キャラ{i}"))
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings) * 1000
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("-n", "--iterations", type=int, default=200)
+    args = parser.parse_args()
+
+    print(f"{'font':<26} {'cold ms':>9} {'warm ms':>9} {'saving':>8}")
+    for font_name, font_path in LOCAL_FONTS.items():
+        spec = RenderSpec(font_path=font_path, font_scale=default_font_scale(font_name))
+        cold = measure(spec, args.iterations, cold=True)
+        warm = measure(spec, args.iterations, cold=False)
+        print(f"{font_name:<26} {cold:9.3f} {warm:9.3f} {1 - warm / cold:8.1%}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+ツクモツムギ能力値画像のレンダリングコア
+
+Streamlit に依存せず、バッチ処理やワーカープロセスからも利用できる
+PIL は描画時に遅延インポートするため、このパッケージのインポートは軽量
+"""
+from .fonts import (
+    APP_FONT_PATH,
+    ASSETS_FONTS_DIR,
+    FONT_PATH,
+    FONT_POOL,
+    FONT_SIZE_OVERRIDES,
+    FontPool,
+    LOCAL_FONTS,
+    SAMPLE_TEXT_FOR_MEASURE,
+    TARGET_FONT_SIZES,
+    compute_normalized_size,
+    default_font_scale,
+    font_pool_stats,
+    get_font_height,
+    get_label_advance,
+    get_reference_heights,
+    list_local_fonts,
+    load_font,
+    load_normalized_font,
+    load_specific_font,
+    measure_font_height,
+    warm_up_fonts,
+)
+from .cache import RENDER_FLIGHTS, RenderCache, SingleFlight, load_or_render, render_cache_key
+from .coverage import COVERAGE_INDEX, CoverageIndex, GlyphCoverage, build_coverage, split_font_runs
+from .encode import (
+    ENCODERS,
+    available_encoders,
+    encode_image,
+    encode_report,
+    encoder_for_spec,
+    get_encoder,
+    is_encoder_available,
+)
+from .font_manifest import FONT_MANIFEST, FontManifest, build_manifest
+from .fingerprint import fingerprint_bytes, fingerprint_stream
+from .metrics import (
+    IMAGE_REQUESTS,
+    METRICS,
+    RENDERS,
+    RENDERS_COALESCED,
+    RENDER_SECONDS,
+    UPLOAD_BYTES,
+    MetricsRegistry,
+    register_cache,
+    register_gauge,
+    start_exporter_from_env,
+)
+from .image import GROUPS, create_image, render_encoded, render_image, render_png
+from .portrait import (
+    PORTRAIT_CACHE,
+    PREVIEW_PORTRAIT_BOX,
+    PortraitError,
+    SHEET_PORTRAIT_BOX,
+    compact_portrait,
+    composite_on_background,
+    fit_portrait,
+    portrait_digest,
+    scale_portrait_box,
+)
+from .spec import CHARACTOR_TYPES, GROUP_KEYS, SKILL_KEYS, SPEC_FORMAT_VERSION, RenderSpec
+from .store import DiskRenderStore
+from .timing import RENDER_TIMINGS, STAGE_LABELS, STAGES, RenderTimings
+from .webfonts import build_font_face_css, build_webfont, font_file_digest
+
+def __getattr__(name):
+    # REFERENCE_HEIGHTS はフォント計測を伴うため初回参照時に計算する
+    if name == "REFERENCE_HEIGHTS":
+        return get_reference_heights()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,226 @@
+"""
+キャラクター一覧（CSV / JSON / JSONL）から能力値画像をまとめて出力するバッチ処理
+
+    python -m parameter_render roster.csv -o out/
+
+各行は次の列を持つ（省略した列は Web アプリの初期値になる）
+    name, type (巫覡 / 付喪神), u, v, w, x, a〜t (取得技能: 1 / true / ○ など),
+    portrait (画像ファイルのパス。一覧ファイルからの相対パス可), font (フォント名またはパス),
+    font_scale, swap_layout, bg_color, bg_alpha, text_color, learned_color
+"""
+import argparse
+import csv
+import json
+import os
+import re
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from .fonts import LOCAL_FONTS, default_font_scale, warm_up_fonts
+from .image import MIN_SCALE, render_png
+from .spec import CHARACTOR_TYPES, GROUP_KEYS, SKILL_KEYS, RenderSpec
+
+TRUE_STRINGS = {"1", "true", "yes", "y", "on", "○", "◯", "✓"}
+DEFAULT_FONT_NAME = "NotoSansJP-Regular"
+
+def _is_true(value):
+    if isinstance(value, bool):
+        return value
+    if value is None:
+        return False
+    return str(value).strip().lower() in TRUE_STRINGS
+
+def _iter_json_array(fp, chunk_size=65536):
+    """
+    JSON 配列を先頭から1要素ずつ読み出す（ファイル全体をメモリに載せない）
+    """
+    decoder = json.JSONDecoder()
+    buffer = ""
+    started = False
+    eof = False
+    while True:
+        buffer = buffer.lstrip()
+        if not started:
+            if not buffer and not eof:
+                chunk = fp.read(chunk_size)
+                eof = not chunk
+                buffer += chunk
+                continue
+            if not buffer.startswith("["):
+                raise ValueError("JSON の一覧は配列である必要があります")
+            buffer = buffer[1:]
+            started = True
+            continue
+        if buffer.startswith(","):
+            buffer = buffer[1:]
+            continue
+        if buffer.startswith("]"):
+            return
+        try:
+            item, end = decoder.raw_decode(buffer)
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            chunk = fp.read(chunk_size)
+            eof = not chunk
+            buffer += chunk
+            continue
+        # 数値などが途中で切れている可能性があるため、末尾まで読めた場合は続きを確認する
+        if end == len(buffer) and not eof:
+            chunk = fp.read(chunk_size)
+            eof = not chunk
+            buffer += chunk
+            continue
+        yield item
+        buffer = buffer[end:]
+
+def iter_roster(path):
+    """
+    一覧ファイルの各行を辞書として逐次読み出す
+    """
+    ext = os.path.splitext(path)[1].lower()
+    with open(path, encoding="utf-8-sig", newline="") as fp:
+        if ext == ".csv":
+            yield from csv.DictReader(fp)
+        elif ext in {".jsonl", ".ndjson"}:
+            for line in fp:
+                line = line.strip()
+                if line:
+                    yield json.loads(line)
+        elif ext == ".json":
+            yield from _iter_json_array(fp)
+        else:
+            raise ValueError(f"未対応のファイル形式です: {path}")
+
+def resolve_font_path(font):
+    if not font:
+        font = DEFAULT_FONT_NAME if DEFAULT_FONT_NAME in LOCAL_FONTS else next(iter(LOCAL_FONTS), None)
+    if font in LOCAL_FONTS:
+        return LOCAL_FONTS[font]
+    return font
+
+def row_to_job(row, base_dir):
+    """
+    一覧の1行を (spec の引数, 立ち絵のパス) に変換する
+    """
+    font_path = resolve_font_path(row.get("font"))
+    font_name = os.path.splitext(os.path.basename(font_path))[0] if font_path else ""
+    font_scale = row.get("font_scale")
+    bg_alpha = row.get("bg_alpha")
+    charactor_type = row.get("type", row.get("charactor_type"))
+    if charactor_type in CHARACTOR_TYPES:
+        charactor_type = charactor_type == CHARACTOR_TYPES[1]
+    else:
+        charactor_type = _is_true(charactor_type)
+
+    spec_kwargs = {
+        "values": tuple(str(row.get(key) or "").strip() for key in GROUP_KEYS),
+        "checks": tuple(_is_true(row.get(key)) for key in SKILL_KEYS),
+        "filename": str(row.get("name", row.get("filename")) or ""),
+        "charactor_type": charactor_type,
+        "font_path": font_path,
+        "font_scale": float(font_scale) if font_scale not in (None, "") else default_font_scale(font_name),
+        "swap_layout": _is_true(row.get("swap_layout")),
+        "bg_color_hex": row.get("bg_color") or "#FFFFFF",
+        "bg_alpha": int(bg_alpha) if bg_alpha not in (None, "") else 100,
+        "text_color_hex": row.get("text_color") or "#000000",
+        "learned_color_hex": row.get("learned_color") or "#FFA500",
+    }
+    portrait_path = row.get("portrait")
+    if portrait_path:
+        portrait_path = os.path.join(base_dir, portrait_path)
+    return spec_kwargs, portrait_path or None
+
+def output_filename(index, name):
+    safe_name = re.sub(r'[\\/:*?"<>|\s]+', "_", name).strip("_") or "chara"
+    return f"{index:04d}_{safe_name}.png"
+
+def _render_job(index, spec_kwargs, portrait_path, output_path, scale=1.0):
+    portrait = None
+    if portrait_path:
+        with open(portrait_path, "rb") as fp:
+            portrait = fp.read()
+    spec = RenderSpec(portrait=portrait, **spec_kwargs)
+    data = render_png(spec, scale)
+    tmp_path = output_path + ".tmp"
+    with open(tmp_path, "wb") as fp:
+        fp.write(data)
+    os.replace(tmp_path, output_path)
+    return index, output_path
+
+def run_batch(roster_path, output_dir, jobs=None, warm_fonts=False, scale=1.0):
+    """
+    一覧の全行を出力ディレクトリへ書き出し、(成功数, 失敗数, 経過秒数) を返す
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    base_dir = os.path.dirname(os.path.abspath(roster_path))
+    jobs = jobs or os.cpu_count() or 1
+    max_pending = jobs * 4
+
+    done_count = 0
+    failed_count = 0
+    started = time.perf_counter()
+
+    def collect(finished):
+        nonlocal done_count, failed_count
+        for future in finished:
+            index, name = pending.pop(future)
+            try:
+                future.result()
+                done_count += 1
+            except Exception as e:
+                failed_count += 1
+                print(f"❌ {index}行目 ({name}) の出力に失敗しました: {e}", file=sys.stderr)
+
+    pending = {}
+    # フォントはワーカーごとのフォントプールへ一度だけ読み込まれる
+    initializer = warm_up_fonts if warm_fonts else None
+    with ProcessPoolExecutor(max_workers=jobs, initializer=initializer) as executor:
+        for index, row in enumerate(iter_roster(roster_path), 1):
+            try:
+                spec_kwargs, portrait_path = row_to_job(row, base_dir)
+            except (TypeError, ValueError) as e:
+                failed_count += 1
+                print(f"❌ {index}行目の読み込みに失敗しました: {e}", file=sys.stderr)
+                continue
+            output_path = os.path.join(output_dir, output_filename(index, spec_kwargs["filename"]))
+            future = executor.submit(_render_job, index, spec_kwargs, portrait_path, output_path, scale)
+            pending[future] = (index, spec_kwargs["filename"])
+            # 一覧を先読みしすぎないよう、処理中の件数に上限を設ける
+            if len(pending) >= max_pending:
+                finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                collect(finished)
+        finished, _ = wait(pending)
+        collect(finished)
+
+    return done_count, failed_count, time.perf_counter() - started
+
+def _scale_arg(value):
+    scale = float(value)
+    # NaN は比較が常に偽になるため、範囲の判定で弾かれる
+    if not scale >= MIN_SCALE:
+        raise argparse.ArgumentTypeError(f"{MIN_SCALE:g} 以上の数値を指定してください")
+    return scale
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m parameter_render",
+        description="キャラクター一覧 (CSV / JSON / JSONL) から能力値画像をまとめて出力します"
+    )
+    parser.add_argument("roster", help="キャラクター一覧ファイル (.csv / .json / .jsonl)")
+    parser.add_argument("-o", "--output-dir", required=True, help="画像の出力先ディレクトリ")
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="並列プロセス数 (既定: CPU 数)")
+    parser.add_argument("--warm-fonts", action="store_true", help="各ワーカーの起動時に全フォントを読み込んでおく")
+    parser.add_argument("--scale", type=_scale_arg, default=1.0, help="出力する画像の倍率 (例: 0.5, 2。既定: 1 = 幅 1010px)")
+    args = parser.parse_args(argv)
+
+    done_count, failed_count, elapsed = run_batch(
+        args.roster, args.output_dir, jobs=args.jobs, warm_fonts=args.warm_fonts, scale=args.scale
+    )
+    rate = done_count / elapsed if elapsed > 0 else 0.0
+    print(f"✅ {done_count} 件を {elapsed:.2f} 秒で出力しました（{rate:.1f} 枚/秒）", file=sys.stderr)
+    if failed_count:
+        print(f"⚠️ {failed_count} 件は出力できませんでした", file=sys.stderr)
+        return 1
+    return 0
@@ -0,0 +1,50 @@
+"""
+同梱フォントの事前計測（ビルド手順）
+
+    python -m parameter_render.build_fonts           # マニフェストと収録文字の索引を作り直して保存する
+    python -m parameter_render.build_fonts --check   # 古ければ終了コード 1
+
+収録文字の索引の作成には fontTools が必要（無い場合はマニフェストだけを作る）
+"""
+import argparse
+import os
+import sys
+
+from .coverage import COVERAGE_FILENAME, build_coverage, coverage_stale_reasons, current_digests, read_coverage, write_coverage
+from .font_manifest import DEFAULT_FONTS_DIR, MANIFEST_FILENAME, FontManifest, build_manifest, stale_reasons, write_manifest
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m parameter_render.build_fonts",
+        description="assets/fonts のフォントを計測してマニフェストと収録文字の索引を作ります"
+    )
+    parser.add_argument("--fonts-dir", default=DEFAULT_FONTS_DIR, help="フォントのディレクトリ")
+    parser.add_argument("--check", action="store_true", help="作り直さずに、古いかどうかだけを確認する")
+    args = parser.parse_args(argv)
+
+    path = os.path.join(args.fonts_dir, MANIFEST_FILENAME)
+    coverage_path = os.path.join(args.fonts_dir, COVERAGE_FILENAME)
+    if args.check:
+        current = FontManifest(args.fonts_dir, path, auto_rebuild=False)._read()
+        reasons = stale_reasons(current, args.fonts_dir)
+        reasons += coverage_stale_reasons(read_coverage(coverage_path), current_digests(args.fonts_dir))
+        for reason in reasons:
+            print(f"⚠️ {reason}", file=sys.stderr)
+        print("✅ マニフェストと索引は最新です" if not reasons else "❌ マニフェストか索引が古くなっています", file=sys.stderr)
+        return 1 if reasons else 0
+
+    manifest = build_manifest(args.fonts_dir)
+    write_manifest(manifest, path)
+    print(f"✅ {len(manifest['fonts'])} 個のフォントを計測して {path} に保存しました", file=sys.stderr)
+
+    try:
+        index = build_coverage(args.fonts_dir)
+    except ImportError:
+        print("⚠️ fontTools が無いため、収録文字の索引は作りませんでした", file=sys.stderr)
+        return 0
+    write_coverage(index, coverage_path)
+    print(f"✅ {len(index)} 個のフォントの収録文字の索引を {coverage_path} に保存しました", file=sys.stderr)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
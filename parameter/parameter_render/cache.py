@@ -0,0 +1,219 @@
+"""
+生成済み画像のキャッシュ
+
+バイト数の上限と有効期限（TTL）を持つ LRU キャッシュで、長時間動かしても
+メモリ使用量が上限を超えて増え続けないようにする
+"""
+import contextlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from .encode import encoder_for_spec, get_encoder
+from .metrics import IMAGE_REQUESTS, RENDERS_COALESCED, register_gauge
+
+DEFAULT_RENDER_CACHE_MB = 64
+
+class RenderCache:
+    """
+    キー → 画像のバイト列 を保持する LRU キャッシュ
+    max_bytes を超えると最も長く使われていないものから削除し、ttl 秒を過ぎたものは期限切れとする
+    """
+    def __init__(self, max_bytes=DEFAULT_RENDER_CACHE_MB * 1024 * 1024, ttl=None, clock=time.monotonic):
+        self.max_bytes = max_bytes
+        self.ttl = ttl or None
+        self._clock = clock
+        self._entries = OrderedDict()  # key -> (value, size, expires_at)
+        self._lock = threading.Lock()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @classmethod
+    def from_env(cls):
+        """
+        環境変数 PARAMETER_RENDER_CACHE_MB（上限 MB）と PARAMETER_RENDER_CACHE_TTL（秒, 0 で無期限）から作る
+        """
+        max_mb = float(os.environ.get("PARAMETER_RENDER_CACHE_MB", DEFAULT_RENDER_CACHE_MB))
+        ttl = float(os.environ.get("PARAMETER_RENDER_CACHE_TTL", "0"))
+        return cls(max_bytes=int(max_mb * 1024 * 1024), ttl=ttl)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            value, size, expires_at = entry
+            if expires_at is not None and expires_at <= self._clock():
+                self._remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def peek(self, key):
+        """
+        ヒット / ミスを数えずに値を返す（期限切れなら None）
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, _, expires_at = entry
+            if expires_at is not None and expires_at <= self._clock():
+                return None
+            return value
+
+    def put(self, key, value):
+        size = len(value)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            # 上限より大きいものはキャッシュしない
+            if size > self.max_bytes:
+                return False
+            expires_at = self._clock() + self.ttl if self.ttl else None
+            self._entries[key] = (value, size, expires_at)
+            self.total_bytes += size
+            while self.total_bytes > self.max_bytes:
+                oldest_key = next(iter(self._entries))
+                self._remove(oldest_key)
+                self.evictions += 1
+            return True
+
+    def _remove(self, key):
+        _, size, _ = self._entries.pop(key)
+        self.total_bytes -= size
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.total_bytes = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        with self._lock:
+            requests = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self.total_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / requests if requests else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+def render_cache_key(spec, scale=1.0, encoder="png"):
+    """
+    キャッシュのキー。レンダリング仕様のハッシュに倍率（等倍以外）と形式の拡張子を付ける
+    """
+    scale_suffix = "" if scale == 1.0 else f"-{scale:g}x"
+    format_suffix = "" if encoder == "png" else f"-{encoder}"
+    return f"{spec.digest}{scale_suffix}{format_suffix}{get_encoder(encoder).ext}"
+
+class _Flight:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+class SingleFlight:
+    """
+    同じキーの処理が同時に要求された時、最初の1件だけを実行し、残りはその完了を待って結果を共有する
+    完了したキーは忘れるため、結果の保持はキャッシュに任せる
+    coalesced_counter: 結果を共有した回数を数えるメトリクス（Counter, 省略可）
+    """
+    def __init__(self, coalesced_counter=None):
+        self.coalesced_counter = coalesced_counter
+        self._flights = {}
+        self._lock = threading.Lock()
+        self.leaders = 0
+        self.coalesced = 0
+
+    def do(self, key, fn, wait=None):
+        """
+        (fn() の結果, 他の実行の結果を共有したか) を返す。fn の例外は待っていた側にも送る
+        wait: 他の実行を待つ間に入るコンテキスト（スピナーなど）
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+                self.leaders += 1
+            else:
+                self.coalesced += 1
+        if not leader:
+            if self.coalesced_counter is not None:
+                self.coalesced_counter.inc()
+            with wait or contextlib.nullcontext():
+                flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result, True
+        try:
+            flight.result = fn()
+        except BaseException as exc:
+            flight.error = exc
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+        return flight.result, False
+
+    def stats(self):
+        with self._lock:
+            return {"in_flight": len(self._flights), "leaders": self.leaders, "coalesced": self.coalesced}
+
+# 画像の生成（ディスクの確認を含む）を同じキャッシュのキーでまとめる
+RENDER_FLIGHTS = SingleFlight(RENDERS_COALESCED)
+register_gauge("parameter_renders_in_flight", "生成中の画像の数", lambda: RENDER_FLIGHTS.stats()["in_flight"])
+
+def load_or_render(spec, scale, encoder, render_cache, render_store=None, spinner=None):
+    """
+    メモリ → ディスク → 生成 の順に画像のバイト列を探す（encoder は "auto" なども可）
+    同じ画像を同時に要求された場合は1回だけ生成し、結果を共有する
+    Streamlit のダウンロードボタンからスクリプト実行の外で呼ばれることもあるため、spinner 以外で st.* は使わない
+    """
+    from .image import render_encoded
+
+    encoder = encoder_for_spec(encoder, spec)
+    cache_key = render_cache_key(spec, scale, encoder)
+    img_bytes = render_cache.get(cache_key)
+    if img_bytes is not None:
+        IMAGE_REQUESTS.inc(source="memory")
+        return img_bytes
+
+    def load():
+        # 直前に終わった生成の結果がメモリに入っていればそれを使う
+        img_bytes = render_cache.peek(cache_key)
+        if img_bytes is not None:
+            return img_bytes, "memory"
+        if render_store is not None:
+            img_bytes = render_store.get(cache_key)
+            if img_bytes is not None:
+                render_cache.put(cache_key, img_bytes)
+                return img_bytes, "disk"
+        with spinner or contextlib.nullcontext():
+            img_bytes = render_encoded(spec, scale, encoder)
+        if render_store is not None:
+            render_store.put(cache_key, img_bytes)
+        render_cache.put(cache_key, img_bytes)
+        return img_bytes, "render"
+
+    (img_bytes, source), shared = RENDER_FLIGHTS.do(cache_key, load, wait=spinner)
+    IMAGE_REQUESTS.inc(source="coalesced" if shared else source)
+    return img_bytes
@@ -0,0 +1,324 @@
+"""
+フォントごとの収録文字の索引（assets/fonts/font_coverage.bin）
+
+各フォントの cmap を 256 文字ずつのページに分けたビット列として保存し、
+描画時は「コードポイント → 収録しているか」を辞書参照とビット演算だけで引く
+キャラ名などの文字列は、選択したフォントに無い文字だけを収録している同梱フォントに切り替えて描く
+索引の作成（cmap の読み取り）には fontTools を使う。描画時には不要
+"""
+import os
+import struct
+import tempfile
+import threading
+import unicodedata
+
+COVERAGE_VERSION = 1
+COVERAGE_FILENAME = "font_coverage.bin"
+_MAGIC = b"PCOV"
+# 1ページ 256 文字 = 32 バイト
+_PAGE_BITS = 8
+_PAGE_BYTES = (1 << _PAGE_BITS) // 8
+_HEADER = struct.Struct("<4sBH")
+_FONT_HEADER = struct.Struct("<32sIH")
+_PAGE_INDEX = struct.Struct("<H")
+
+# 切り替え先のフォントの優先順（収録文字数ではなく字形で決める）
+# 標準的な太さのゴシック体を先に試し、太字やドット文字などの装飾的なフォントは最後にする
+FALLBACK_FONT_ORDER = ("NotoSansJP-Regular", "ZenMaruGothic-Regular", "MPLUSRounded1c-Regular", "KosugiMaru-Regular")
+DISPLAY_FONTS = ("DotGothic16-Regular", "ReggaeOne-Regular", "DelaGothicOne-Regular")
+
+class GlyphCoverage:
+    """
+    1つのフォントが収録している文字の集合（ページ番号 → 32 バイトのビット列）
+    """
+    __slots__ = ("pages", "count")
+
+    def __init__(self, pages, count):
+        self.pages = pages
+        self.count = count
+
+    @classmethod
+    def from_code_points(cls, code_points):
+        pages = {}
+        count = 0
+        for code_point in code_points:
+            page = pages.get(code_point >> _PAGE_BITS)
+            if page is None:
+                page = pages[code_point >> _PAGE_BITS] = bytearray(_PAGE_BYTES)
+            low = code_point & 0xFF
+            if not page[low >> 3] & (1 << (low & 7)):
+                page[low >> 3] |= 1 << (low & 7)
+                count += 1
+        return cls({index: bytes(page) for index, page in pages.items()}, count)
+
+    def __contains__(self, code_point):
+        page = self.pages.get(code_point >> _PAGE_BITS)
+        if page is None:
+            return False
+        low = code_point & 0xFF
+        return bool(page[low >> 3] & (1 << (low & 7)))
+
+    def covers(self, text):
+        return all(ord(char) in self for char in text)
+
+def read_cmap(font_path):
+    """
+    フォントの cmap に含まれるコードポイント（fontTools が必要）
+    """
+    from fontTools.ttLib import TTFont
+
+    with TTFont(font_path, lazy=True, fontNumber=0) as font:
+        return set(font.getBestCmap() or {})
+
+def _file_sha256(font_path):
+    from .font_manifest import file_digest
+
+    return file_digest(font_path)
+
+def build_coverage(fonts_dir):
+    """
+    fonts_dir のフォントの索引 {表示名: (SHA-256, GlyphCoverage)} を作る
+    """
+    from .fonts import list_local_fonts
+
+    index = {}
+    for font_name, font_path in list_local_fonts(fonts_dir).items():
+        index[font_name] = (_file_sha256(font_path), GlyphCoverage.from_code_points(read_cmap(font_path)))
+    return index
+
+def _pack_name(name):
+    data = name.encode("utf-8")
+    return struct.pack("<H", len(data)) + data
+
+def pack_coverage(index):
+    """
+    索引をバイト列にする（ヘッダ, フォントごとに 名前・SHA-256・文字数・ページ数・(ページ番号, ビット列) の並び）
+    """
+    parts = [_HEADER.pack(_MAGIC, COVERAGE_VERSION, len(index))]
+    for font_name in sorted(index):
+        sha256, coverage = index[font_name]
+        parts.append(_pack_name(font_name))
+        parts.append(_FONT_HEADER.pack(bytes.fromhex(sha256), coverage.count, len(coverage.pages)))
+        for page_index in sorted(coverage.pages):
+            parts.append(_PAGE_INDEX.pack(page_index))
+            parts.append(coverage.pages[page_index])
+    return b"".join(parts)
+
+def unpack_coverage(data):
+    """
+    pack_coverage の逆。形式が違えば ValueError
+    """
+    try:
+        magic, version, font_count = _HEADER.unpack_from(data, 0)
+    except struct.error as exc:
+        raise ValueError("索引の形式が不正です") from exc
+    if magic != _MAGIC or version != COVERAGE_VERSION:
+        raise ValueError("索引の形式のバージョンが違います")
+    offset = _HEADER.size
+    index = {}
+    try:
+        for _ in range(font_count):
+            (name_length,) = struct.unpack_from("<H", data, offset)
+            offset += 2
+            font_name = data[offset:offset + name_length].decode("utf-8")
+            offset += name_length
+            sha256, count, page_count = _FONT_HEADER.unpack_from(data, offset)
+            offset += _FONT_HEADER.size
+            pages = {}
+            for _ in range(page_count):
+                (page_index,) = _PAGE_INDEX.unpack_from(data, offset)
+                offset += _PAGE_INDEX.size
+                pages[page_index] = data[offset:offset + _PAGE_BYTES]
+                offset += _PAGE_BYTES
+            index[font_name] = (sha256.hex(), GlyphCoverage(pages, count))
+    except (struct.error, UnicodeDecodeError) as exc:
+        raise ValueError("索引の形式が不正です") from exc
+    return index
+
+def write_coverage(index, path):
+    directory = os.path.dirname(path)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as tmp_file:
+            tmp_file.write(pack_coverage(index))
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def read_coverage(path):
+    """
+    保存済みの索引。無い・壊れている場合は None
+    """
+    try:
+        with open(path, "rb") as coverage_file:
+            return unpack_coverage(coverage_file.read())
+    except (OSError, ValueError):
+        return None
+
+def coverage_stale_reasons(index, digests):
+    """
+    索引が古い理由の一覧（空なら最新）。digests は {表示名: 現在の SHA-256}
+    """
+    if index is None:
+        return ["収録文字の索引がありません"]
+    reasons = []
+    for font_name in sorted(set(index) - set(digests)):
+        reasons.append(f"{font_name} の索引が残っています（フォントが削除されています）")
+    for font_name, sha256 in digests.items():
+        if font_name not in index:
+            reasons.append(f"{font_name} の索引がありません")
+        elif index[font_name][0] != sha256:
+            reasons.append(f"{font_name} の索引が古くなっています")
+    return reasons
+
+def current_digests(fonts_dir):
+    """
+    fonts_dir のフォントの SHA-256（ファイルを読んで計算する。ビルド手順の確認用）
+    """
+    from .fonts import list_local_fonts
+
+    return {font_name: _file_sha256(font_path) for font_name, font_path in list_local_fonts(fonts_dir).items()}
+
+def _is_attached(char):
+    # 結合文字・異体字セレクタ・ゼロ幅接合子などは直前の文字と同じフォントで描く
+    return unicodedata.category(char) in ("Mn", "Me", "Cf")
+
+class CoverageIndex:
+    """
+    収録文字の索引を初回参照時に読み込み、フォントの切り替え先を決める
+    フォントの SHA-256 はフォントのマニフェストの値と照合し、古ければ fontTools で作り直す
+    作り直せない（fontTools が無い）フォントは索引なしとして扱い、従来通り切り替えない
+    """
+    def __init__(self, fonts_dir=None, path=None, manifest=None, auto_rebuild=True):
+        from .font_manifest import DEFAULT_FONTS_DIR, FONT_MANIFEST
+
+        self.fonts_dir = fonts_dir or DEFAULT_FONTS_DIR
+        self.path = path or os.path.join(self.fonts_dir, COVERAGE_FILENAME)
+        self.manifest = manifest or FONT_MANIFEST
+        self.auto_rebuild = auto_rebuild
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._by_path = {}
+        self._fallbacks = []
+        self.rebuilt = False
+
+    def _load(self):
+        from .fonts import list_local_fonts
+
+        local_fonts = list_local_fonts(self.fonts_dir)
+        digests = {
+            font_name: entry["sha256"]
+            for font_name, entry in self.manifest.entries().items()
+            if font_name in local_fonts
+        }
+        index = read_coverage(self.path)
+        if digests and coverage_stale_reasons(index, digests) and self.auto_rebuild:
+            try:
+                index = build_coverage(self.fonts_dir)
+            except ImportError:
+                pass
+            else:
+                self.rebuilt = True
+                try:
+                    write_coverage(index, self.path)
+                except OSError:
+                    # 書き込めない環境では、このプロセスの中だけで使う
+                    pass
+
+        by_path = {}
+        for font_name, (sha256, coverage) in (index or {}).items():
+            if font_name in local_fonts and digests.get(font_name) == sha256:
+                by_path[os.path.realpath(local_fonts[font_name])] = coverage
+        self._by_path = by_path
+
+        # 切り替え先は FALLBACK_FONT_ORDER の順、一覧に無いフォントは収録文字数の多い順、装飾的なフォントは最後
+        names = {os.path.realpath(font_path): font_name for font_name, font_path in local_fonts.items()}
+
+        def fallback_rank(path):
+            font_name = names.get(path)
+            if font_name in FALLBACK_FONT_ORDER:
+                return (0, FALLBACK_FONT_ORDER.index(font_name))
+            if font_name in DISPLAY_FONTS:
+                return (2, DISPLAY_FONTS.index(font_name))
+            return (1, -by_path[path].count)
+
+        self._fallbacks = sorted(by_path, key=fallback_rank)
+
+    def _ensure_loaded(self):
+        if self._loaded:
+            return
+        with self._lock:
+            if not self._loaded:
+                self._load()
+                self._loaded = True
+
+    def coverage(self, font_path):
+        """
+        フォントの GlyphCoverage（索引に無いフォントなら None）
+        """
+        if not font_path:
+            return None
+        self._ensure_loaded()
+        return self._by_path.get(os.path.realpath(font_path))
+
+    def fallback_for(self, font_path, code_point):
+        """
+        font_path に無い code_point を収録している同梱フォントのパス（どれにも無ければ None）
+        """
+        self._ensure_loaded()
+        own_path = os.path.realpath(font_path) if font_path else None
+        for fallback_path in self._fallbacks:
+            if fallback_path != own_path and code_point in self._by_path[fallback_path]:
+                return fallback_path
+        return None
+
+    def split_runs(self, font_path, text):
+        """
+        text を描くフォントごとの区間 [(フォントのパス, 文字列), ...] に分ける
+        すべて font_path で描ける（または索引が無い）場合は [(font_path, text)]
+        """
+        coverage = self.coverage(font_path)
+        if coverage is None or not text:
+            return [(font_path, text)]
+        runs = []
+        run_path = font_path
+        run_start = 0
+        for position, char in enumerate(text):
+            code_point = ord(char)
+            if position and _is_attached(char):
+                char_path = run_path
+            elif code_point in coverage:
+                char_path = font_path
+            else:
+                # どのフォントにも無い文字は選択したフォントのまま（従来と同じ表示）
+                char_path = self.fallback_for(font_path, code_point) or font_path
+            if char_path != run_path and position > run_start:
+                runs.append((run_path, text[run_start:position]))
+                run_start = position
+            run_path = char_path
+        runs.append((run_path, text[run_start:]))
+        return runs
+
+    def reload(self):
+        with self._lock:
+            self._loaded = False
+            self._by_path = {}
+            self._fallbacks = []
+
+    def stats(self):
+        self._ensure_loaded()
+        return {
+            "fonts": len(self._by_path),
+            "pages": sum(len(coverage.pages) for coverage in self._by_path.values()),
+            "bytes": sum(len(coverage.pages) * (_PAGE_BYTES + _PAGE_INDEX.size) for coverage in self._by_path.values()),
+        }
+
+COVERAGE_INDEX = CoverageIndex(
+    auto_rebuild=os.environ.get("PARAMETER_FONT_MANIFEST_REBUILD", "1") == "1"
+)
+
+def split_font_runs(font_path, text):
+    return COVERAGE_INDEX.split_runs(font_path, text)
@@ -0,0 +1,125 @@
+"""
+描画した画像の書き出し（エンコード）
+
+形式ごとの設定をまとめ、用途に応じて PNG / パレット PNG / WebP / AVIF を選べるようにする
+WebP と AVIF は Pillow が対応している場合だけ使える
+"""
+import io
+import os
+import statistics
+import time
+from dataclasses import dataclass, field
+from typing import Dict
+
+@dataclass(frozen=True)
+class Encoder:
+    """
+    1つの出力形式（Pillow の保存形式と保存時のオプション）
+    """
+    name: str
+    format: str
+    mime: str
+    ext: str
+    options: Dict[str, object] = field(default_factory=dict)
+    palette: bool = False  # True なら 256 色のパレット画像に減色してから保存する
+    opaque: bool = False   # True なら透過を持てない形式（RGB に変換してから保存する）
+    feature: str = ""      # Pillow の機能名（features.check で対応を確認する）
+
+def _png_compress_level():
+    return int(os.environ.get("PARAMETER_PNG_COMPRESS_LEVEL", "6"))
+
+ENCODERS = {
+    # 従来と同じ PNG（圧縮レベルは PARAMETER_PNG_COMPRESS_LEVEL, 0〜9）
+    "png": Encoder("png", "PNG", "image/png", ".png", {"compress_level": _png_compress_level()}),
+    # 圧縮より速度を優先した PNG（プレビューなど）
+    "png-fast": Encoder("png-fast", "PNG", "image/png", ".png", {"compress_level": 1}),
+    # 256 色に減色した PNG。立ち絵がなければ色数が少ないため見た目はほぼ変わらない
+    "png-palette": Encoder("png-palette", "PNG", "image/png", ".png", {"compress_level": 9}, palette=True),
+    # プレビュー用の JPEG（背景が不透明な場合だけ。文字の色がにじまないよう色差は間引かない）
+    "jpeg": Encoder("jpeg", "JPEG", "image/jpeg", ".jpg", {"quality": 90, "subsampling": 0}, opaque=True),
+    # 可逆圧縮の WebP（method は 0 が速く 6 が小さい）
+    "webp": Encoder("webp", "WEBP", "image/webp", ".webp", {"lossless": True, "quality": 100, "method": 4}, feature="webp"),
+    # AVIF（Pillow からは完全な可逆を指定できないため、最高品質・色差の間引きなしで保存する）
+    "avif": Encoder("avif", "AVIF", "image/avif", ".avif", {"quality": 100, "subsampling": "4:4:4", "speed": 6}, feature="avif"),
+}
+
+def is_encoder_available(name):
+    """
+    その形式を今の Pillow で書き出せるか
+    """
+    encoder = ENCODERS.get(name)
+    if encoder is None:
+        return False
+    if not encoder.feature:
+        return True
+    from PIL import features
+
+    return bool(features.check(encoder.feature))
+
+def available_encoders():
+    return [name for name in ENCODERS if is_encoder_available(name)]
+
+def get_encoder(name):
+    encoder = ENCODERS.get(name)
+    if encoder is None:
+        raise ValueError(f"未対応の出力形式です: {name}（{', '.join(ENCODERS)} から選んでください）")
+    if not is_encoder_available(name):
+        raise ValueError(f"この環境の Pillow は {name} の書き出しに対応していません")
+    return encoder
+
+def to_palette(img):
+    """
+    256 色のパレット画像に減色する（透過も保持する）
+    色数が 256 以下ならそのまま同じ色で変換される
+    """
+    from PIL import Image
+
+    if img.mode == "RGBA":
+        return img.quantize(256, method=Image.Quantize.FASTOCTREE)
+    return img.convert("RGB").quantize(256)
+
+def encode_image(img, name="png", **options):
+    """
+    画像を name の形式で書き出したバイト列を返す。options で保存時の設定を上書きできる
+    """
+    encoder = get_encoder(name)
+    if encoder.palette:
+        img = to_palette(img)
+    elif encoder.opaque and img.mode != "RGB":
+        img = img.convert("RGB")
+    img_bytes = io.BytesIO()
+    img.save(img_bytes, format=encoder.format, **{**encoder.options, **options})
+    return img_bytes.getvalue()
+
+def encoder_for_spec(name, spec):
+    """
+    "auto" / "preview" を実際の形式に置き換える
+    auto: 立ち絵がなければパレット PNG、あれば PNG
+    preview: 背景が不透明なら JPEG、透過があれば速度優先の PNG
+    （Streamlit の st.image は PNG と JPEG 以外を PNG に変換し直すため、プレビューには使わない）
+    """
+    if name == "auto":
+        return "png" if spec.portrait else "png-palette"
+    if name == "preview":
+        return "jpeg" if spec.bg_alpha >= 100 else "png-fast"
+    return name
+
+def encode_report(img, names=None, repeat=5):
+    """
+    形式ごとの書き出し時間（中央値, ミリ秒）とバイト数を返す
+    """
+    report = []
+    for name in names or available_encoders():
+        if not is_encoder_available(name):
+            continue
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            data = encode_image(img, name)
+            timings.append(time.perf_counter() - started)
+        report.append({
+            "format": name,
+            "encode_ms": statistics.median(timings) * 1000,
+            "bytes": len(data),
+        })
+    return report
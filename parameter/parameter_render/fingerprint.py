@@ -0,0 +1,51 @@
+"""
+アップロード画像などの内容ハッシュ（フィンガープリント）
+
+xxhash があれば xxh3_128、無ければ blake2b (128bit) を使う
+ファイル全体を一度に読み込まず、チャンク単位でハッシュ計算する
+"""
+import hashlib
+
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+
+CHUNK_SIZE = 1024 * 1024
+
+def _new_hasher():
+    if xxhash is not None:
+        return xxhash.xxh3_128()
+    return hashlib.blake2b(digest_size=16)
+
+def fingerprint_bytes(data):
+    """
+    bytes / memoryview の内容ハッシュ
+    """
+    hasher = _new_hasher()
+    view = memoryview(data)
+    for start in range(0, len(view), CHUNK_SIZE):
+        hasher.update(view[start:start + CHUNK_SIZE])
+    return hasher.hexdigest()
+
+def fingerprint_stream(fileobj):
+    """
+    ファイルオブジェクトの内容ハッシュ（読み取り位置は元に戻す）
+    BytesIO 系は getbuffer() でコピーせずに、それ以外は固定長バッファに読み込みながら計算する
+    """
+    position = fileobj.tell()
+    try:
+        if hasattr(fileobj, "getbuffer"):
+            with fileobj.getbuffer() as view:
+                return fingerprint_bytes(view)
+        hasher = _new_hasher()
+        buffer = bytearray(CHUNK_SIZE)
+        fileobj.seek(0)
+        while True:
+            read_size = fileobj.readinto(buffer)
+            if not read_size:
+                break
+            hasher.update(memoryview(buffer)[:read_size])
+        return hasher.hexdigest()
+    finally:
+        fileobj.seek(position)
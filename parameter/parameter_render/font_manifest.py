@@ -0,0 +1,262 @@
+"""
+フォント計測結果のマニフェスト（assets/fonts/font_manifest.json）
+
+起動時や初回描画時にフォントを開いて文字の高さを測る代わりに、事前に計測した
+文字高さ・正規化後のサイズ・行の高さ・固定ラベルの幅・ファイルのハッシュを読み込んで引くだけにする
+フォントの追加・差し替えや Pillow の更新でマニフェストが古くなった場合は自動で作り直す
+作り直しは python -m parameter_render.build_fonts で行う
+"""
+import hashlib
+import json
+import os
+import tempfile
+import threading
+
+MANIFEST_VERSION = 1
+MANIFEST_FILENAME = "font_manifest.json"
+DEFAULT_FONTS_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    "assets",
+    "fonts"
+)
+# 固定ラベルの幅を記録しておく画像の倍率（プレビュー 0.75, ダウンロード 0.5 など）
+MANIFEST_SCALES = (0.5, 0.75, 1.0, 2.0)
+
+def file_digest(path):
+    """
+    フォントファイルの SHA-256（環境によらず同じ値になるよう hashlib を使う）
+    """
+    hasher = hashlib.sha256()
+    with open(path, "rb") as font_file:
+        for chunk in iter(lambda: font_file.read(1024 * 1024), b""):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+def _pillow_version():
+    import PIL
+
+    return PIL.__version__
+
+def _fixed_labels():
+    """
+    下地に描く固定ラベル（グループ名「【身体】：」は大きい文字、技能名「★白兵:」は中くらいの文字）
+    """
+    from .image import GROUPS
+
+    group_labels = [f"【{group['name']}】：" for group in GROUPS.values()]
+    skill_labels = [f"{skill_name}:" for group in GROUPS.values() for _, skill_name in group['skills']]
+    return group_labels, skill_labels
+
+def build_manifest(fonts_dir=DEFAULT_FONTS_DIR):
+    """
+    fonts_dir のフォントを計測してマニフェスト（dict）を作る
+    """
+    from .fonts import (
+        FONT_PATH,
+        FONT_SIZE_OVERRIDES,
+        SAMPLE_TEXT_FOR_MEASURE,
+        TARGET_FONT_SIZES,
+        list_local_fonts,
+        load_specific_font,
+        measure_font_height,
+    )
+    from .image import FONT_SIZE_LARGE, FONT_SIZE_MEDIUM
+
+    reference_heights = {size: measure_font_height(FONT_PATH, size) for size in TARGET_FONT_SIZES}
+    group_labels, skill_labels = _fixed_labels()
+
+    fonts = {}
+    for font_name, font_path in list_local_fonts(fonts_dir).items():
+        stat = os.stat(font_path)
+        heights = {size: measure_font_height(font_path, size) for size in TARGET_FONT_SIZES}
+        normalized_sizes = {
+            size: max(1, int(round(size * reference_heights[size] / heights[size])))
+            for size in TARGET_FONT_SIZES
+        }
+        default_size = FONT_SIZE_OVERRIDES.get(font_name, 28)
+        font_scale = default_size / 28
+
+        line_heights = {}
+        for size in TARGET_FONT_SIZES:
+            font = load_specific_font(font_path, max(1, int(round(normalized_sizes[size] * font_scale))))
+            if font is not None:
+                ascent, descent = font.getmetrics()
+                line_heights[size] = ascent + descent
+
+        # 既定の文字サイズ補正で各倍率に描画した時の固定ラベルの幅
+        advances = {}
+        for scale in MANIFEST_SCALES:
+            for base_size, labels in ((FONT_SIZE_LARGE, group_labels), (FONT_SIZE_MEDIUM, skill_labels)):
+                pixel_size = max(1, int(round(normalized_sizes[base_size] * font_scale * scale)))
+                font = load_specific_font(font_path, pixel_size)
+                if font is None:
+                    continue
+                size_advances = advances.setdefault(str(pixel_size), {})
+                for label in labels:
+                    size_advances[label] = font.getlength(label)
+
+        fonts[font_name] = {
+            "file": os.path.basename(font_path),
+            "bytes": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "sha256": file_digest(font_path),
+            "default_size": default_size,
+            "heights": {str(size): height for size, height in heights.items()},
+            "normalized_sizes": {str(size): value for size, value in normalized_sizes.items()},
+            "line_heights": {str(size): value for size, value in line_heights.items()},
+            "label_advances": advances,
+        }
+
+    return {
+        "version": MANIFEST_VERSION,
+        "pillow": _pillow_version(),
+        "sample_text": SAMPLE_TEXT_FOR_MEASURE,
+        "reference": {
+            "font": os.path.basename(FONT_PATH) if FONT_PATH else None,
+            "heights": {str(size): height for size, height in reference_heights.items()},
+        },
+        "fonts": fonts,
+    }
+
+def write_manifest(manifest, path):
+    directory = os.path.dirname(path)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as tmp_file:
+            json.dump(manifest, tmp_file, ensure_ascii=False, indent=1, sort_keys=True)
+            tmp_file.write("\n")
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def stale_reasons(manifest, fonts_dir=DEFAULT_FONTS_DIR):
+    """
+    マニフェストが古い理由の一覧（空なら最新）
+    サイズと更新日時が一致しないファイルだけ、ハッシュを計算して中身を比べる
+    """
+    from .fonts import FONT_SIZE_OVERRIDES, SAMPLE_TEXT_FOR_MEASURE, list_local_fonts
+
+    if manifest is None:
+        return ["マニフェストがありません"]
+    reasons = []
+    if manifest.get("version") != MANIFEST_VERSION:
+        reasons.append("形式のバージョンが違います")
+    if manifest.get("pillow") != _pillow_version():
+        reasons.append(f"Pillow のバージョンが違います（{manifest.get('pillow')}）")
+    if manifest.get("sample_text") != SAMPLE_TEXT_FOR_MEASURE:
+        reasons.append("計測用の文字列が違います")
+
+    entries = manifest.get("fonts", {})
+    local_fonts = list_local_fonts(fonts_dir)
+    for font_name in sorted(set(entries) - set(local_fonts)):
+        reasons.append(f"{font_name} が削除されています")
+    for font_name, font_path in local_fonts.items():
+        entry = entries.get(font_name)
+        if entry is None:
+            reasons.append(f"{font_name} が追加されています")
+            continue
+        if entry.get("default_size") != FONT_SIZE_OVERRIDES.get(font_name, 28):
+            reasons.append(f"{font_name} の既定の文字サイズが変更されています")
+        stat = os.stat(font_path)
+        if stat.st_size != entry.get("bytes"):
+            reasons.append(f"{font_name} が変更されています")
+        elif stat.st_mtime_ns != entry.get("mtime_ns") and file_digest(font_path) != entry.get("sha256"):
+            reasons.append(f"{font_name} が変更されています")
+    return reasons
+
+class FontManifest:
+    """
+    マニフェストを初回参照時に読み込み、古ければ作り直して保持する
+    """
+    def __init__(self, fonts_dir=DEFAULT_FONTS_DIR, path=None, auto_rebuild=True):
+        self.fonts_dir = fonts_dir
+        self.path = path or os.path.join(fonts_dir, MANIFEST_FILENAME)
+        self.auto_rebuild = auto_rebuild
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._manifest = None
+        self._by_path = {}
+        self.rebuilt = False
+
+    def _read(self):
+        try:
+            with open(self.path, encoding="utf-8") as manifest_file:
+                return json.load(manifest_file)
+        except (OSError, ValueError):
+            return None
+
+    def _ensure_loaded(self):
+        if self._loaded:
+            return
+        with self._lock:
+            if self._loaded:
+                return
+            manifest = self._read()
+            if stale_reasons(manifest, self.fonts_dir):
+                if self.auto_rebuild:
+                    manifest = build_manifest(self.fonts_dir)
+                    self.rebuilt = True
+                    try:
+                        write_manifest(manifest, self.path)
+                    except OSError:
+                        # 書き込めない環境では、このプロセスの中だけで使う
+                        pass
+                else:
+                    # 古い計測値は使わず、従来通りその場で計測する
+                    manifest = None
+            self._manifest = manifest
+            if manifest is not None:
+                self._by_path = {
+                    os.path.realpath(os.path.join(self.fonts_dir, entry["file"])): entry
+                    for entry in manifest.get("fonts", {}).values()
+                }
+            self._loaded = True
+
+    def _entry(self, font_path):
+        if not font_path:
+            return None
+        self._ensure_loaded()
+        return self._by_path.get(os.path.realpath(font_path))
+
+    def reference_heights(self):
+        """
+        基準フォントの各サイズの文字高さ（マニフェストが無ければ None）
+        """
+        self._ensure_loaded()
+        if self._manifest is None:
+            return None
+        return {int(size): height for size, height in self._manifest["reference"]["heights"].items()}
+
+    def font_height(self, font_path, size):
+        entry = self._entry(font_path)
+        if entry is None:
+            return None
+        return entry["heights"].get(str(size))
+
+    def label_advance(self, font_path, pixel_size, label):
+        """
+        固定ラベルの幅（記録が無ければ None）
+        """
+        entry = self._entry(font_path)
+        if entry is None:
+            return None
+        return entry["label_advances"].get(str(pixel_size), {}).get(label)
+
+    def entries(self):
+        self._ensure_loaded()
+        if self._manifest is None:
+            return {}
+        return self._manifest.get("fonts", {})
+
+    def reload(self):
+        with self._lock:
+            self._loaded = False
+            self._manifest = None
+            self._by_path = {}
+
+FONT_MANIFEST = FontManifest(
+    auto_rebuild=os.environ.get("PARAMETER_FONT_MANIFEST_REBUILD", "1") == "1"
+)
@@ -0,0 +1,229 @@
+"""
+フォントの探索・読み込み・サイズ正規化
+
+PIL は関数内で遅延インポートし、モジュールの読み込み自体は軽量に保つ
+"""
+import os
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from pathlib import Path
+
+from .cache import SingleFlight
+from .font_manifest import FONT_MANIFEST
+from .metrics import register_cache
+
+ASSETS_FONTS_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    "assets",
+    "fonts"
+)
+APP_FONT_PATH = os.path.join(ASSETS_FONTS_DIR, "NotoSansJP-Regular.ttf")
+FONT_PATH = APP_FONT_PATH if os.path.exists(APP_FONT_PATH) else None
+# assets/fonts に置くフォントの既定の文字サイズ（28px 基準, 記載がなければ 28）
+# 変更したらマニフェストを作り直す（python -m parameter_render.build_fonts）
+FONT_SIZE_OVERRIDES = {
+    "DelaGothicOne-Regular": 20,
+    "DotGothic16-Regular": 23,
+    "KosugiMaru-Regular": 23,
+    "MPLUSRounded1c-Regular": 23,
+    "NotoSansJP-Regular": 26,
+    "ReggaeOne-Regular": 21,
+    "ZenMaruGothic-Regular": 26,
+}
+SAMPLE_TEXT_FOR_MEASURE = "あいうえおアイウエオ漢字"
+TARGET_FONT_SIZES = [40, 35, 28, 20]
+
+def list_local_fonts(fonts_dir):
+    fonts = {}
+    fonts_path = Path(fonts_dir)
+
+    if not fonts_path.is_dir():
+        return fonts
+
+    for font_file in fonts_path.iterdir():
+        if font_file.suffix.lower() in {".ttf", ".otf", ".ttc"}:
+            display_name = font_file.stem
+            fonts[display_name] = str(font_file)
+
+    return dict(sorted(fonts.items(), key=lambda item: item[0].lower()))
+
+LOCAL_FONTS = list_local_fonts(ASSETS_FONTS_DIR)
+
+def default_font_scale(font_name):
+    """
+    フォントごとの既定の文字サイズ補正（28px 基準の倍率）
+    """
+    return FONT_SIZE_OVERRIDES.get(font_name, 28) / 28
+
+class FontPool:
+    """
+    (フォントファイルの実パス, ピクセルサイズ) ごとにフォントオブジェクトを共有するプール
+    上限を超えると最も長く使われていないものから破棄する（スレッドセーフ）
+    フォントファイルの解析はロックの外で行い、同じフォントとサイズの読み込みが重なった場合だけ1回にまとめる
+    """
+    def __init__(self, maxsize=128):
+        self.maxsize = maxsize
+        self._fonts = OrderedDict()
+        self._lock = threading.Lock()
+        self._flights = SingleFlight()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, font_path, size):
+        """
+        フォントを返す。読み込めないファイルの場合は None
+        """
+        if not font_path:
+            return None
+        key = (os.path.realpath(font_path), int(size))
+        with self._lock:
+            if key in self._fonts:
+                self._fonts.move_to_end(key)
+                self.hits += 1
+                return self._fonts[key]
+            self.misses += 1
+        font, _ = self._flights.do(key, lambda: self._load(key))
+        return font
+
+    def _load(self, key):
+        with self._lock:
+            # 直前に終わった読み込みの結果が入っていればそれを使う
+            loaded = key in self._fonts
+            font = self._fonts.get(key)
+        if not loaded:
+            font = self._open(key[0], key[1])
+        with self._lock:
+            self._fonts[key] = font
+            self._fonts.move_to_end(key)
+            while len(self._fonts) > self.maxsize:
+                self._fonts.popitem(last=False)
+                self.evictions += 1
+        return font
+
+    @staticmethod
+    def _open(font_path, size):
+        from PIL import ImageFont
+
+        if not os.path.exists(font_path):
+            return None
+        try:
+            return ImageFont.truetype(font_path, size)
+        except OSError:
+            return None
+
+    def clear(self):
+        with self._lock:
+            self._fonts.clear()
+
+    def stats(self):
+        with self._lock:
+            requests = self.hits + self.misses
+            return {
+                "entries": len(self._fonts),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": self.hits / requests if requests else 0.0,
+            }
+
+FONT_POOL = FontPool(maxsize=int(os.environ.get("PARAMETER_FONT_POOL_SIZE", "128")))
+register_cache("font", FONT_POOL.stats)
+
+def load_font(font_path, size):
+    from PIL import ImageFont
+
+    font = FONT_POOL.get(font_path, size)
+    if font is None and FONT_PATH:
+        font = FONT_POOL.get(FONT_PATH, size)
+    if font is None:
+        font = ImageFont.load_default()
+    return font
+
+def load_specific_font(font_path, size):
+    return FONT_POOL.get(font_path, size)
+
+def font_pool_stats():
+    return FONT_POOL.stats()
+
+def measure_font_height(font_path, size):
+    """
+    フォントを開いて SAMPLE_TEXT_FOR_MEASURE の高さを計測する（マニフェストの作成用）
+    """
+    from PIL import Image, ImageDraw, ImageFont
+
+    font = load_specific_font(font_path, size)
+    if font is None and FONT_PATH and font_path != FONT_PATH:
+        font = load_specific_font(FONT_PATH, size)
+    if font is None:
+        font = ImageFont.load_default()
+    dummy_img = Image.new("RGB", (1, 1))
+    draw = ImageDraw.Draw(dummy_img)
+    bbox = draw.textbbox((0, 0), SAMPLE_TEXT_FOR_MEASURE, font=font)
+    height = bbox[3] - bbox[1]
+    return max(1, height)
+
+@lru_cache(maxsize=256)
+def get_font_height(font_path, size):
+    """
+    文字の高さ。同梱フォントはマニフェストから引き、それ以外は計測する
+    """
+    height = FONT_MANIFEST.font_height(font_path, size)
+    if height is None:
+        height = measure_font_height(font_path, size)
+    return height
+
+@lru_cache(maxsize=1)
+def get_reference_heights():
+    """
+    基準フォントの各サイズの文字高さ（マニフェストから引く。無ければ初回呼び出し時に計測）
+    """
+    reference_heights = FONT_MANIFEST.reference_heights()
+    if reference_heights is None:
+        reference_heights = {size: measure_font_height(FONT_PATH, size) for size in TARGET_FONT_SIZES}
+    return reference_heights
+
+def get_label_advance(font, label):
+    """
+    固定ラベルの幅。同梱フォントの既定サイズならマニフェストから引き、それ以外は font.getlength で測る
+    """
+    font_path = getattr(font, "path", None)
+    if isinstance(font_path, str):
+        advance = FONT_MANIFEST.label_advance(font_path, font.size, label)
+        if advance is not None:
+            return advance
+    return font.getlength(label)
+
+def __getattr__(name):
+    # REFERENCE_HEIGHTS はインポート時ではなく初回参照時に計測する
+    if name == "REFERENCE_HEIGHTS":
+        return get_reference_heights()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def compute_normalized_size(font_path, base_size, target_height):
+    current_height = get_font_height(font_path, base_size)
+    if not current_height:
+        return base_size
+    scale = target_height / current_height
+    return max(1, int(round(base_size * scale)))
+
+def load_normalized_font(font_path, base_size, target_height, font_scale=1.0):
+    normalized_size = compute_normalized_size(font_path, base_size, target_height)
+    normalized_size = max(1, int(round(normalized_size * font_scale)))
+    return load_font(font_path, normalized_size)
+
+def warm_up_fonts(fonts=None, sizes=TARGET_FONT_SIZES):
+    """
+    各フォントを既定の文字サイズ補正で読み込み、フォントプールに載せておく
+    fonts は {表示名: パス}（省略時は LOCAL_FONTS 全体）。読み込んだ件数を返す
+    """
+    fonts = LOCAL_FONTS if fonts is None else fonts
+    reference_heights = get_reference_heights()
+    count = 0
+    for font_name, font_path in fonts.items():
+        for size in sizes:
+            load_normalized_font(font_path, size, reference_heights[size], default_font_scale(font_name))
+            count += 1
+    return count
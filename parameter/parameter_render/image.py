@@ -0,0 +1,415 @@
+"""
+能力値画像の描画
+"""
+import io
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from .cache import SingleFlight
+from .coverage import split_font_runs
+from .encode import encode_image, encoder_for_spec
+from .fonts import get_label_advance, get_reference_heights, load_normalized_font
+from .metrics import RENDER_ERRORS, RENDER_SECONDS, RENDERS, register_cache
+from .portrait import SHEET_PORTRAIT_BOX, composite_on_background, fit_portrait, scale_portrait_box
+from .spec import GROUP_KEYS, RenderSpec
+from .timing import RENDER_TIMINGS
+
+# グループ定義
+GROUPS = {
+    'u': {
+        'name': '身体',
+        'skills': [('a', '★白兵'), ('b', '運動'), ('c', '頑健'), ('d', '操縦'), ('e', '知覚')]
+    },
+    'v': {
+        'name': '技量',
+        'skills': [('f', '★射撃'), ('g', '医療'), ('h', '隠密'), ('i', '工作'), ('j', '捜査')]
+    },
+    'w': {
+        'name': '心魂',
+        'skills': [('k', '★呪法'), ('l', '意志'), ('m', '看破'), ('n', '芸能'), ('o', '伝承')]
+    },
+    'x': {
+        'name': '社会',
+        'skills': [('p', '★策謀'), ('q', '教養'), ('r', '交渉'), ('s', '電脳'), ('t', '容姿')]
+    }
+}
+
+def hex_to_rgba(hex_color, alpha_percent):
+    hex_color = hex_color.lstrip('#')
+    r = int(hex_color[0:2], 16)
+    g = int(hex_color[2:4], 16)
+    b = int(hex_color[4:6], 16)
+    a = max(0, min(255, int(alpha_percent * 255 / 100)))
+    return (r, g, b, a)
+
+def hex_to_rgb(hex_color):
+    hex_color = hex_color.lstrip('#')
+    r = int(hex_color[0:2], 16)
+    g = int(hex_color[2:4], 16)
+    b = int(hex_color[4:6], 16)
+    return (r, g, b)
+
+# 生成する画像の寸法設定（等倍時のピクセル数。scale を掛けて実際の寸法にする）
+IMAGE_AREA_WIDTH = SHEET_PORTRAIT_BOX[0]    # 画像 + キャラ情報の幅
+STATS_AREA_WIDTH = 690    # 能力値情報の幅
+TOTAL_WIDTH = IMAGE_AREA_WIDTH + STATS_AREA_WIDTH
+
+# 各セクションの高さ
+DEFAULT_IMG_HEIGHT = 440    # 画像がない場合の高さ
+CHAR_INFO_HEIGHT = 90       # 分類とキャラ名の高さ
+CONTENT_HEIGHT = 500        # 能力値情報の高さ
+
+STATS_TOP = 20
+LINE_HEIGHT = 60
+STATS_LEFT_MARGIN = 20
+SKILL_SPACING = 20
+
+# 左下のキャラクター情報の配置
+CHAR_INFO_TOP_MARGIN = 10
+CHAR_TYPE_LEFT = 10
+CHAR_NAME_LEFT = 15
+CHAR_NAME_TOP = 40
+CHAR_NAME_MARGIN = 40     # キャラ名の幅に残す余白（これを超えたら小さい文字にする）
+
+# 文字サイズ（等倍時）
+FONT_SIZE_LARGE = 40
+FONT_SIZE_MEDIUM = 35
+FONT_SIZE_SMALL = 28
+FONT_SIZE_TINY = 20
+
+# 描画できる最小の倍率（これより小さいと文字や余白が 0px に丸められ、画像が空になる）
+MIN_SCALE = 0.1
+
+def scale_px(length, scale):
+    """
+    等倍時の長さを scale 倍したピクセル数
+    """
+    if scale == 1.0:
+        return length
+    return int(round(length * scale))
+
+def sheet_size(portrait_height=None, scale=1.0):
+    """
+    立ち絵の高さ（scale 倍済み, 立ち絵なしは None）から画像全体の (幅, 高さ) を求める
+    """
+    if portrait_height is None:
+        portrait_height = scale_px(DEFAULT_IMG_HEIGHT, scale)
+    # 左側全体の高さ = 立ち絵 + キャラ情報、全体の高さ = 左右で大きい方
+    left_total_height = portrait_height + scale_px(CHAR_INFO_HEIGHT, scale)
+    return scale_px(TOTAL_WIDTH, scale), max(left_total_height, scale_px(CONTENT_HEIGHT, scale))
+
+class SheetTemplate:
+    """
+    スタイルごとに変わらない部分（背景・グループ名・技能名）を描画済みの下地
+    値や習得状況、キャラ名、立ち絵だけをリクエストごとに描き足す
+    """
+    def __init__(self, font_path, font_scale, bg_rgba, text_rgb, swap_layout, height, scale=1.0):
+        from PIL import Image, ImageDraw
+
+        self.scale = scale
+        self.font_path = font_path
+        # 文字サイズも画像の倍率に合わせる
+        self.font_multiplier = font_scale * scale
+        with RENDER_TIMINGS.stage("fonts"):
+            reference_heights = get_reference_heights()
+            self.font_large = load_normalized_font(font_path, FONT_SIZE_LARGE, reference_heights[FONT_SIZE_LARGE], self.font_multiplier)
+            self.font_medium = load_normalized_font(font_path, FONT_SIZE_MEDIUM, reference_heights[FONT_SIZE_MEDIUM], self.font_multiplier)
+            self.font_small = load_normalized_font(font_path, FONT_SIZE_SMALL, reference_heights[FONT_SIZE_SMALL], self.font_multiplier)
+            self.font_tiny = load_normalized_font(font_path, FONT_SIZE_TINY, reference_heights[FONT_SIZE_TINY], self.font_multiplier)
+        self.fonts = {
+            FONT_SIZE_LARGE: self.font_large,
+            FONT_SIZE_MEDIUM: self.font_medium,
+            FONT_SIZE_SMALL: self.font_small,
+            FONT_SIZE_TINY: self.font_tiny,
+        }
+
+        # 左右の配置を決定
+        if swap_layout:
+            self.stats_area_x = 0
+            self.image_area_x = self.px(STATS_AREA_WIDTH)
+        else:
+            self.image_area_x = 0
+            self.stats_area_x = self.px(IMAGE_AREA_WIDTH)
+        self.right_start_x = self.stats_area_x + self.px(STATS_LEFT_MARGIN)
+        self.image_area_width = self.px(IMAGE_AREA_WIDTH)
+        self.line_height = self.px(LINE_HEIGHT)
+        self.skill_spacing = self.px(SKILL_SPACING)
+
+        with RENDER_TIMINGS.stage("template"):
+            self.base = Image.new('RGBA', (self.px(TOTAL_WIDTH), height), bg_rgba)
+            draw = ImageDraw.Draw(self.base)
+
+            # グループタイトルの固定部分「【身体】：」を描いておき、数値の描き始め位置を記録する
+            self.group_value_x = {}
+            y_pos = self.px(STATS_TOP)
+            for group_key in GROUP_KEYS:
+                prefix = f"【{GROUPS[group_key]['name']}】："
+                draw.text((self.right_start_x, y_pos), prefix, font=self.font_large, fill=text_rgb)
+                self.group_value_x[group_key] = self.right_start_x + get_label_advance(self.font_large, prefix)
+                y_pos += self.line_height * 2
+
+            # 技能名「★白兵:」は色が習得状況で変わるため、マスクとして保持して色だけ後から指定する
+            self.skill_labels = {}
+            for group_key in GROUP_KEYS:
+                for skill_key, skill_name in GROUPS[group_key]['skills']:
+                    label = f"{skill_name}:"
+                    bbox = self.font_medium.getbbox(label)
+                    mask = Image.new("L", (max(1, bbox[2] - bbox[0]), max(1, bbox[3] - bbox[1])), 0)
+                    ImageDraw.Draw(mask).text((-bbox[0], -bbox[1]), label, font=self.font_medium, fill=255)
+                    self.skill_labels[skill_key] = (mask, bbox[0], bbox[1], get_label_advance(self.font_medium, label))
+
+        # 「技能名:数値」の幅（次の技能の位置計算用）。値の種類は少ないので都度記録する
+        self._skill_text_widths = {}
+        self._draw = draw
+
+    def px(self, length):
+        return scale_px(length, self.scale)
+
+    def run_font(self, font_path, base_size):
+        """
+        代替フォントを、選択したフォントと同じ文字の高さ・倍率で読み込む
+        """
+        if font_path == self.font_path:
+            return self.fonts[base_size]
+        return load_normalized_font(font_path, base_size, get_reference_heights()[base_size], self.font_multiplier)
+
+    def text_width(self, draw, text, base_size):
+        """
+        text の描画幅（選択したフォントに無い文字は代替フォントの幅で数える）
+        """
+        runs = split_font_runs(self.font_path, text)
+        if len(runs) == 1:
+            text_bbox = draw.textbbox((0, 0), text, font=self.fonts[base_size])
+            return text_bbox[2] - text_bbox[0]
+        return sum(self.run_font(run_path, base_size).getlength(run_text) for run_path, run_text in runs)
+
+    def draw_text(self, draw, xy, text, base_size, fill):
+        """
+        text を描く。選択したフォントに無い文字の区間だけ代替フォントに切り替え、ベースラインを揃えて描く
+        """
+        runs = split_font_runs(self.font_path, text)
+        if len(runs) == 1:
+            draw.text(xy, text, font=self.fonts[base_size], fill=fill)
+            return
+        x, y = xy
+        baseline = y + self.fonts[base_size].getmetrics()[0]
+        for run_path, run_text in runs:
+            font = self.run_font(run_path, base_size)
+            draw.text((x, baseline), run_text, font=font, fill=fill, anchor="ls")
+            x += font.getlength(run_text)
+
+    def skill_text_width(self, skill_text):
+        width = self._skill_text_widths.get(skill_text)
+        if width is None:
+            text_bbox = self._draw.textbbox((0, 0), skill_text, font=self.font_medium)
+            width = text_bbox[2] - text_bbox[0]
+            self._skill_text_widths[skill_text] = width
+        return width
+
+class TemplateCache:
+    """
+    SheetTemplate を (フォント, 文字の倍率, 色, 透過率, 左右入れ替え, 高さ, 画像の倍率) ごとに保持する LRU キャッシュ
+    下地の作成はロックの外で行い、同じキーの作成が重なった場合だけ1回にまとめる（他のキーの描画は待たせない）
+    """
+    def __init__(self, maxsize=8):
+        self.maxsize = maxsize
+        self._templates = OrderedDict()
+        self._lock = threading.Lock()
+        self._flights = SingleFlight()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, font_path, font_scale, bg_rgba, text_rgb, swap_layout, height, scale=1.0):
+        key = (font_path, font_scale, bg_rgba, text_rgb, swap_layout, height, scale)
+        with self._lock:
+            template = self._templates.get(key)
+            if template is not None:
+                self._templates.move_to_end(key)
+                self.hits += 1
+                return template
+            self.misses += 1
+        template, _ = self._flights.do(key, lambda: self._build(key))
+        return template
+
+    def _build(self, key):
+        with self._lock:
+            # 直前に終わった作成の結果が入っていればそれを使う
+            template = self._templates.get(key)
+        if template is None:
+            template = SheetTemplate(*key)
+        with self._lock:
+            self._templates[key] = template
+            self._templates.move_to_end(key)
+            while len(self._templates) > self.maxsize:
+                self._templates.popitem(last=False)
+        return template
+
+    def clear(self):
+        with self._lock:
+            self._templates.clear()
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._templates), "maxsize": self.maxsize, "hits": self.hits, "misses": self.misses}
+
+TEMPLATE_CACHE = TemplateCache(maxsize=int(os.environ.get("PARAMETER_TEMPLATE_CACHE_SIZE", "8")))
+register_cache("template", TEMPLATE_CACHE.stats)
+
+def render_image(spec, scale=1.0):
+    """
+    レンダリング仕様から画像（PIL.Image, RGBA）を生成する関数
+    左側：アップロード画像、分類、キャラ名
+    右側：能力値情報
+    scale 倍の寸法・文字サイズで直接描画する（等倍は幅 1010px）
+    """
+    from PIL import ImageDraw
+
+    values = spec.values_dict()
+    checks = spec.checks_dict()
+
+    # アップロード画像の処理（縮小済みの立ち絵は内容ハッシュごとにキャッシュされる）
+    if spec.portrait:
+        uploaded_img = fit_portrait(spec.portrait, scale_portrait_box(SHEET_PORTRAIT_BOX, scale), spec.portrait_digest)
+        img_target_height = uploaded_img.height
+    else:
+        uploaded_img = None
+        img_target_height = None
+
+    _, total_img_height = sheet_size(img_target_height, scale)
+
+    bg_rgba = hex_to_rgba(spec.bg_color_hex, spec.bg_alpha)
+    text_rgb = hex_to_rgb(spec.text_color_hex)
+    learned_rgb = hex_to_rgb(spec.learned_color_hex)
+
+    # 描画済みの下地を複製し、可変部分だけを描く
+    template = TEMPLATE_CACHE.get(spec.font_path, spec.font_scale, bg_rgba, text_rgb, spec.swap_layout, total_img_height, scale)
+    with RENDER_TIMINGS.stage("compose"):
+        img = template.base.copy()
+        draw = ImageDraw.Draw(img)
+        image_area_x = template.image_area_x
+
+        # 画像エリアにアップロード画像を配置（中央揃え）
+        image_area_height = total_img_height - template.px(CHAR_INFO_HEIGHT)
+        if uploaded_img:
+            # 透過PNGは背景色で合成して透過を防ぐ
+            uploaded_img = composite_on_background(uploaded_img, bg_rgba)
+
+            left_x = image_area_x + (template.image_area_width - uploaded_img.width) // 2
+            top_y = max(0, (image_area_height - uploaded_img.height) // 2)
+            img.paste(uploaded_img, (left_x, top_y))
+
+    with RENDER_TIMINGS.stage("text"):
+        # 左側の下部にキャラクター情報を表示
+        info_y = image_area_height + template.px(CHAR_INFO_TOP_MARGIN)
+
+        # キャラクター分類を表示
+        charactor_type_str = "巫覡" if not spec.charactor_type else "付喪神"
+        template.draw_text(draw, (image_area_x + template.px(CHAR_TYPE_LEFT), info_y), f"{charactor_type_str}", FONT_SIZE_SMALL, text_rgb)
+
+        # キャラ名を表示
+        char_name = spec.filename if spec.filename else "No Name"
+        char_name_text = f"{char_name}"
+
+        # テキスト幅をチェック
+        text_width = template.text_width(draw, char_name_text, FONT_SIZE_SMALL)
+
+        # 利用可能な幅（左側のスペース）
+        available_width = template.image_area_width - template.px(CHAR_NAME_MARGIN)
+
+        char_name_xy = (image_area_x + template.px(CHAR_NAME_LEFT), info_y + template.px(CHAR_NAME_TOP))
+        if text_width > available_width:
+            # フォントサイズを縮小
+            template.draw_text(draw, char_name_xy, char_name_text, FONT_SIZE_TINY, text_rgb)
+        else:
+            template.draw_text(draw, char_name_xy, char_name_text, FONT_SIZE_SMALL, text_rgb)
+
+        # 右側に能力値情報を描画
+        y_pos = template.px(STATS_TOP)
+        right_start_x = template.right_start_x
+
+        for group_key in GROUP_KEYS:
+            group_data = GROUPS[group_key]
+            # グループタイトルの数値部分（「【身体】：」は下地に描画済み）
+            group_value = values.get(group_key, '')
+            if group_value:
+                draw.text((template.group_value_x[group_key], y_pos), group_value, font=template.font_large, fill=text_rgb)
+            y_pos += template.line_height
+
+            # スキル一覧を1行で表示（各スキルの数値を含む）
+            x_offset = right_start_x
+            for skill_key, skill_name in group_data['skills']:
+                is_checked = checks.get(skill_key, False)
+                text_color = learned_rgb if is_checked else text_rgb  # 習得済色または指定色
+
+                # 各スキルの数値を計算（グループ値+チェック時+1）
+                base_value = int(group_value) if group_value else 0
+                skill_value = base_value + 1 if is_checked else base_value
+
+                # 技能名は下地のマスクを色付けして貼り、数値だけを描く
+                mask, mask_x, mask_y, label_width = template.skill_labels[skill_key]
+                img.paste(text_color, (x_offset + mask_x, y_pos + mask_y), mask)
+                draw.text((x_offset + label_width, y_pos), str(skill_value), font=template.font_medium, fill=text_color)
+                # 次のスキル位置を計算
+                x_offset += template.skill_text_width(f"{skill_name}:{skill_value}") + template.skill_spacing
+
+            y_pos += template.line_height
+
+    return img
+
+def render_encoded(spec, scale=1.0, encoder="png"):
+    """
+    レンダリング仕様から encoder の形式（encode.ENCODERS のキー, "auto" 可）のバイト列を生成する関数
+    """
+    encoder = encoder_for_spec(encoder, spec)
+    started = time.perf_counter()
+    try:
+        with RENDER_TIMINGS.render(digest=spec.digest[:16], scale=scale, encoder=encoder, portrait=bool(spec.portrait)):
+            img = render_image(spec, scale)
+            with RENDER_TIMINGS.stage("encode"):
+                img_bytes = encode_image(img, encoder)
+    except Exception:
+        RENDER_ERRORS.inc()
+        raise
+    RENDERS.inc(encoder=encoder)
+    RENDER_SECONDS.observe(time.perf_counter() - started, encoder=encoder)
+    return img_bytes
+
+def render_png(spec, scale=1.0):
+    """
+    レンダリング仕様から PNG のバイト列を生成する関数
+    scale を指定すると、その倍率で直接描画する（描画後の拡大・縮小はしない）
+    """
+    return render_encoded(spec, scale, "png")
+
+def create_image(values, checks, filename, charactor_type, uploaded_file, font_path=None, font_scale=1.0, swap_layout=False, bg_color_hex="#FFFFFF", bg_alpha=100, text_color_hex="#000000", learned_color_hex="#FFA500", portrait_digest=None, scale=1.0):
+    """
+    入力された値とチェック状態から画像を生成する関数
+    戻り値は (PNG の BytesIO, ファイル名)
+    """
+    portrait = None
+    if uploaded_file:
+        uploaded_file.seek(0)
+        portrait = uploaded_file.read()
+
+    spec = RenderSpec.from_inputs(
+        values, checks, filename, charactor_type, portrait, portrait_digest,
+        font_path=font_path,
+        font_scale=font_scale,
+        swap_layout=swap_layout,
+        bg_color_hex=bg_color_hex,
+        bg_alpha=bg_alpha,
+        text_color_hex=text_color_hex,
+        learned_color_hex=learned_color_hex
+    )
+
+    # ファイル名がない場合はデフォルト
+    if not filename:
+        filename = "output"
+
+    # メモリ上に画像を保存（BytesIO）
+    img_bytes = io.BytesIO(render_png(spec, scale))
+    img_bytes.seek(0)
+
+    return img_bytes, filename
@@ -0,0 +1,305 @@
+"""
+稼働状況のメトリクス（Prometheus のテキスト形式）
+
+描画回数・描画時間の分布・キャッシュ層ごとのヒット / ミス・アップロードサイズ・接続中のセッション数・
+プロセスの RSS をまとめて出力する
+PARAMETER_METRICS_PORT を指定すると別ポートの HTTP（/metrics）で、
+PARAMETER_METRICS_FILE を指定すると PARAMETER_METRICS_INTERVAL 秒（既定 15）ごとに書き直すファイルで公開する
+"""
+import bisect
+import os
+import tempfile
+import threading
+import time
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+# 描画時間（秒）とアップロードサイズ（バイト）のバケット
+RENDER_SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+UPLOAD_BYTES_BUCKETS = (64 * 1024, 256 * 1024, 1024 * 1024, 2 * 1024 * 1024, 5 * 1024 * 1024, 10 * 1024 * 1024)
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels) + "}"
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer() and abs(value) < 1e15:
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+class Counter:
+    """
+    単調増加のカウンタ（ラベルの組ごと）
+    """
+    type = "counter"
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        # ラベルの無いものは、一度も数えていなくても 0 を出力する
+        self._values = {} if self.labelnames else {(): 0}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        for key, value in sorted(values.items()):
+            yield self.name, tuple(zip(self.labelnames, key)), value
+
+class Histogram:
+    """
+    累積バケット付きのヒストグラム（ラベルの組ごと）
+    """
+    type = "histogram"
+
+    def __init__(self, name, help, buckets, labelnames=()):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(sorted(buckets))
+        self.labelnames = tuple(labelnames)
+        self._values = {} if self.labelnames else {(): [[0] * (len(self.buckets) + 1), 0.0, 0]}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def samples(self):
+        with self._lock:
+            values = {key: (list(counts), total, count) for key, (counts, total, count) in self._values.items()}
+        for key, (counts, total, count) in sorted(values.items()):
+            labels = tuple(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, bucket_count in zip((*self.buckets, float("inf")), counts):
+                cumulative += bucket_count
+                yield f"{self.name}_bucket", labels + (("le", _format_value(float(bound))),), cumulative
+            yield f"{self.name}_sum", labels, total
+            yield f"{self.name}_count", labels, count
+
+class MetricsRegistry:
+    """
+    カウンタ・ヒストグラムと、出力時に値を集める関数（コレクタ）をまとめる
+    コレクタは (名前, 種類, 説明, ラベル, 値) を返す。同じ名前のものは1つの系列にまとめて出力する
+    """
+    def __init__(self):
+        self._metrics = {}
+        self._collectors = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, name, factory):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = factory()
+            return metric
+
+    def counter(self, name, help, labelnames=()):
+        return self._get_or_create(name, lambda: Counter(name, help, labelnames))
+
+    def histogram(self, name, help, buckets, labelnames=()):
+        return self._get_or_create(name, lambda: Histogram(name, help, buckets, labelnames))
+
+    def register_collector(self, key, collect):
+        """
+        出力時に呼ぶ関数を key で登録する（同じ key で登録し直すと置き換える）
+        """
+        with self._lock:
+            self._collectors[key] = collect
+
+    def unregister_collector(self, key):
+        with self._lock:
+            self._collectors.pop(key, None)
+
+    def render(self):
+        """
+        Prometheus のテキスト形式
+        """
+        with self._lock:
+            metrics = list(self._metrics.values())
+            collectors = list(self._collectors.values())
+        families = {}
+        for metric in metrics:
+            family = families.setdefault(metric.name, (metric.type, metric.help, []))
+            family[2].extend(metric.samples())
+        for collect in collectors:
+            try:
+                collected = list(collect())
+            except Exception:
+                # 1つのコレクタの失敗で全体を出力できなくならないようにする
+                continue
+            for name, metric_type, help, labels, value in collected:
+                if value is None:
+                    continue
+                family = families.setdefault(name, (metric_type, help, []))
+                family[2].append((name, tuple(sorted(labels.items())), value))
+        lines = []
+        for name, (metric_type, help, samples) in families.items():
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            for sample_name, labels, value in samples:
+                lines.append(f"{sample_name}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+METRICS = MetricsRegistry()
+
+RENDERS = METRICS.counter("parameter_renders_total", "描画した画像の数", ("encoder",))
+RENDER_ERRORS = METRICS.counter("parameter_render_errors_total", "描画に失敗した回数")
+RENDER_SECONDS = METRICS.histogram(
+    "parameter_render_duration_seconds", "描画（書き出しを含む）にかかった時間", RENDER_SECONDS_BUCKETS, ("encoder",)
+)
+IMAGE_REQUESTS = METRICS.counter(
+    "parameter_image_requests_total", "画像の要求を返した場所（memory / disk / render / coalesced）", ("source",)
+)
+RENDERS_COALESCED = METRICS.counter(
+    "parameter_renders_coalesced_total", "同じ画像の生成中に届き、その結果を共有した要求の数（省けた生成の数）"
+)
+UPLOAD_BYTES = METRICS.histogram("parameter_upload_bytes", "アップロードされた立ち絵のサイズ", UPLOAD_BYTES_BUCKETS)
+
+def register_cache(layer, stats):
+    """
+    キャッシュ層 layer の stats()（hits / misses / evictions / entries / bytes）をメトリクスに載せる
+    """
+    def collect():
+        values = stats()
+        labels = {"layer": layer}
+        yield "parameter_cache_hits_total", "counter", "キャッシュ層ごとのヒット数", labels, values.get("hits")
+        yield "parameter_cache_misses_total", "counter", "キャッシュ層ごとのミス数", labels, values.get("misses")
+        yield "parameter_cache_evictions_total", "counter", "キャッシュ層ごとの追い出し数", labels, values.get("evictions")
+        yield "parameter_cache_entries", "gauge", "キャッシュ層ごとの件数", labels, values.get("entries")
+        yield "parameter_cache_bytes", "gauge", "キャッシュ層ごとの使用量", labels, values.get("bytes")
+
+    METRICS.register_collector(("cache", layer), collect)
+
+def register_gauge(name, help, value):
+    """
+    出力時に value() を呼んで値を得るゲージ（None なら出力しない）
+    """
+    METRICS.register_collector(("gauge", name), lambda: [(name, "gauge", help, {}, value())])
+
+def resident_memory_bytes():
+    """
+    プロセスの現在の RSS（/proc が無い環境では None）
+    """
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+def max_resident_memory_bytes():
+    try:
+        import resource
+    except ImportError:
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS はバイト、Linux などは KiB
+    return max_rss if os.uname().sysname == "Darwin" else max_rss * 1024
+
+_PROCESS_START_TIME = time.time()
+
+def _collect_process():
+    yield "parameter_process_resident_memory_bytes", "gauge", "プロセスの RSS", {}, resident_memory_bytes()
+    yield "parameter_process_max_resident_memory_bytes", "gauge", "プロセスの RSS の最大値", {}, max_resident_memory_bytes()
+    yield "parameter_process_start_time_seconds", "gauge", "プロセスの起動時刻（UNIX 時刻）", {}, _PROCESS_START_TIME
+    yield "parameter_process_threads", "gauge", "プロセスのスレッド数", {}, threading.active_count()
+
+METRICS.register_collector("process", _collect_process)
+
+def write_metrics_file(path, registry=None):
+    registry = registry or METRICS
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as tmp_file:
+            tmp_file.write(registry.render())
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def start_http_server(port, addr="127.0.0.1", registry=None):
+    """
+    別スレッドで /metrics を返す HTTP サーバーを起動する
+    """
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    registry = registry or METRICS
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?", 1)[0] not in ("/metrics", "/"):
+                self.send_error(404)
+                return
+            body = registry.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((addr, port), MetricsHandler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, name="parameter-metrics-http", daemon=True)
+    thread.start()
+    return server
+
+def start_file_writer(path, interval=15.0, registry=None):
+    """
+    別スレッドで interval 秒ごとにメトリクスのファイルを書き直す
+    """
+    stop = threading.Event()
+
+    def run():
+        while True:
+            try:
+                write_metrics_file(path, registry)
+            except OSError:
+                pass
+            if stop.wait(interval):
+                return
+
+    thread = threading.Thread(target=run, name="parameter-metrics-file", daemon=True)
+    thread.start()
+    return stop
+
+_exporter_lock = threading.Lock()
+_exporters = {}
+
+def start_exporter_from_env():
+    """
+    環境変数に従って公開を始める（何度呼んでもプロセスで1回だけ起動する）
+    PARAMETER_METRICS_PORT（と PARAMETER_METRICS_ADDR, 既定 127.0.0.1）, PARAMETER_METRICS_FILE, PARAMETER_METRICS_INTERVAL
+    """
+    with _exporter_lock:
+        port = os.environ.get("PARAMETER_METRICS_PORT", "").strip()
+        if port and "http" not in _exporters:
+            addr = os.environ.get("PARAMETER_METRICS_ADDR", "127.0.0.1")
+            _exporters["http"] = start_http_server(int(port), addr)
+        path = os.environ.get("PARAMETER_METRICS_FILE", "").strip()
+        if path and "file" not in _exporters:
+            interval = float(os.environ.get("PARAMETER_METRICS_INTERVAL", "15"))
+            _exporters["file"] = start_file_writer(path, interval)
+        return dict(_exporters)
@@ -0,0 +1,253 @@
+"""
+立ち絵（アップロード画像）の前処理
+
+アップロード1件につき一度だけデコードし、出力先の枠ごとに縮小した結果を
+内容ハッシュと枠サイズをキーにしてキャッシュする
+背景色との合成は縮小済みの画像に対して最後に行う
+"""
+import io
+import os
+import threading
+from collections import OrderedDict
+
+from .cache import SingleFlight
+from .fingerprint import fingerprint_bytes
+from .metrics import register_cache
+from .timing import RENDER_TIMINGS
+
+# (幅, 高さの上限, リサンプリング方法, RGBA に変換するか)
+# リサンプリング方法が None の場合は Pillow の既定（Image.resize の既定値）を使う
+SHEET_PORTRAIT_BOX = (320, 390, "LANCZOS", True)     # 能力値画像に貼る立ち絵
+PREVIEW_PORTRAIT_BOX = (300, 415, None, False)        # 「アップロードされた画像」の表示用
+PORTRAIT_BOXES = (SHEET_PORTRAIT_BOX, PREVIEW_PORTRAIT_BOX)
+# 一度のデコードで作る枠の数の上限
+MAX_PORTRAIT_BOXES = 8
+
+# 縮小デコードで残す余裕（出力サイズの何倍以上を保つか）
+# Pillow の reducing_gap と同じ意味で、3.0 なら通常の LANCZOS 縮小と見分けがつかない
+REDUCING_GAP = 3.0
+# Image.reduce（reducing_gap を指定したリサイズの内部）が扱えるモード
+REDUCIBLE_MODES = ("L", "LA", "La", "RGB", "RGBA", "RGBa", "RGBX", "CMYK", "YCbCr", "LAB", "HSV", "I", "F")
+# compact_portrait がそのまま保存するモード（それ以外は RGB / RGBA にしてから保存する）
+COMPACT_MODES = ("1", "L", "LA", "P", "RGB", "RGBA", "I", "I;16")
+
+class PortraitError(ValueError):
+    """
+    立ち絵を画像として開けない・デコードできない（壊れたファイルや画素数が大きすぎる画像など）
+    """
+
+def portrait_digest(data):
+    """
+    立ち絵のバイト列から内容ハッシュを計算する
+    """
+    return fingerprint_bytes(data)
+
+def scale_portrait_box(box, scale):
+    """
+    枠の幅と高さの上限を scale 倍した枠
+    """
+    if scale == 1.0:
+        return box
+    return (int(round(box[0] * scale)), int(round(box[1] * scale))) + tuple(box[2:])
+
+def fit_size(width, height, box):
+    """
+    アスペクト比を保持して、枠の幅基準で縮小後のサイズを求める（高さは上限で抑える）
+    極端に細長い画像や小さい倍率の枠でも 1px 未満にはしない
+    """
+    box_width, max_height = box[0], box[1]
+    aspect_ratio = width / height
+    target_width = box_width
+    target_height = int(target_width / aspect_ratio)
+    if target_height > max_height:
+        target_height = max_height
+        target_width = int(target_height * aspect_ratio)
+    return max(1, target_width), max(1, target_height)
+
+def _resize(image, size, box, reducing_gap=None):
+    from PIL import Image
+
+    resample = box[2]
+    if resample is None:
+        resized = image.resize(size, reducing_gap=reducing_gap)
+    else:
+        resized = image.resize(size, getattr(Image.Resampling, resample), reducing_gap=reducing_gap)
+    if box[3]:
+        resized = resized.convert("RGBA")
+    return resized
+
+class PortraitCache:
+    """
+    (内容ハッシュ, 枠) ごとに縮小済みの立ち絵を保持する LRU キャッシュ
+    同じ立ち絵のデコードが同時に要求された場合は1回だけデコードし、結果を共有する
+    """
+    def __init__(self, maxsize=64, reduced_decode=True):
+        self.maxsize = maxsize
+        self.reduced_decode = reduced_decode
+        self._images = OrderedDict()
+        # これまでに要求された枠（倍率違いの枠も、次のデコードからまとめて作る）
+        self._boxes = list(PORTRAIT_BOXES)
+        self._lock = threading.Lock()
+        self._flights = SingleFlight()
+        self.hits = 0
+        self.misses = 0
+        self.decodes = 0
+        self.reduced_decodes = 0
+
+    def get(self, data, box, digest=None):
+        digest = digest or portrait_digest(data)
+        key = (digest, box)
+        with self._lock:
+            image = self._images.get(key)
+            if image is not None:
+                self._images.move_to_end(key)
+                self.hits += 1
+                return image
+            self.misses += 1
+            if box not in self._boxes and len(self._boxes) < MAX_PORTRAIT_BOXES:
+                self._boxes.append(box)
+        while True:
+            resized, _ = self._flights.do(digest, lambda: self._decode(data, digest, box))
+            # 別の枠を要求した側のデコードを共有し、この枠が含まれていなかった場合はやり直す
+            if box in resized:
+                return resized[box]
+
+    def _decode(self, data, digest, box):
+        with self._lock:
+            # 直前に終わったデコードの結果が入っていればそれを使う
+            image = self._images.get((digest, box))
+            if image is not None:
+                return {box: image}
+            boxes = tuple(self._boxes)
+        # 一度のデコードで全ての枠の縮小画像を作っておく
+        resized = self._prepare(data, box, boxes)
+        with self._lock:
+            for resized_box, resized_image in resized.items():
+                self._images[(digest, resized_box)] = resized_image
+                self._images.move_to_end((digest, resized_box))
+            while len(self._images) > self.maxsize:
+                self._images.popitem(last=False)
+        return resized
+
+    def _prepare(self, data, box, boxes):
+        from PIL import Image
+
+        if box not in boxes:
+            boxes = boxes + (box,)
+        try:
+            image = Image.open(io.BytesIO(data))
+        except (OSError, Image.DecompressionBombError) as exc:
+            raise PortraitError(f"立ち絵を画像として読み込めません（{exc.__class__.__name__}）") from exc
+        with image:
+            # 出力サイズは元画像の寸法から決める（縮小デコード後の端数で1px ずれないように）
+            sizes = {target_box: fit_size(image.width, image.height, target_box) for target_box in boxes}
+            reduced = self.reduced_decode and _can_reduce(image, sizes.values())
+            with RENDER_TIMINGS.stage("decode"):
+                if reduced and image.format == "JPEG":
+                    # JPEG は DCT スケーリングで 1/2〜1/8 の解像度のままデコードする
+                    image.draft(image.mode, (
+                        int(max(size[0] for size in sizes.values()) * REDUCING_GAP),
+                        int(max(size[1] for size in sizes.values()) * REDUCING_GAP),
+                    ))
+                try:
+                    image.load()
+                except (OSError, Image.DecompressionBombError) as exc:
+                    raise PortraitError(f"立ち絵を画像として読み込めません（{exc.__class__.__name__}）") from exc
+            with self._lock:
+                self.decodes += 1
+                if reduced:
+                    self.reduced_decodes += 1
+            # PNG などは全体をデコードした後、整数倍の縮小（Image.reduce）を挟んでからリサンプリングする
+            reducing_gap = REDUCING_GAP if reduced else None
+            with RENDER_TIMINGS.stage("resize"):
+                return {
+                    target_box: _resize(image, sizes[target_box], target_box, reducing_gap)
+                    for target_box in boxes
+                }
+
+    def clear(self):
+        with self._lock:
+            self._images.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._images),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "decodes": self.decodes,
+                "reduced_decodes": self.reduced_decodes,
+            }
+
+def _can_reduce(image, sizes):
+    """
+    縮小デコードで画質が落ちないかの判定
+    どの出力サイズに対しても REDUCING_GAP 倍以上の解像度がある場合だけ縮小経路を使う
+    Image.reduce が対応していないモード（パレット画像や 16 ビットの I;16 など）は従来通り全体を処理する
+    """
+    if image.mode not in REDUCIBLE_MODES:
+        return False
+    return all(
+        image.width >= width * REDUCING_GAP and image.height >= height * REDUCING_GAP
+        for width, height in sizes
+    )
+
+PORTRAIT_CACHE = PortraitCache(
+    maxsize=int(os.environ.get("PARAMETER_PORTRAIT_CACHE_SIZE", "64")),
+    reduced_decode=os.environ.get("PARAMETER_REDUCED_DECODE", "1") == "1"
+)
+register_cache("portrait", PORTRAIT_CACHE.stats)
+
+def fit_portrait(data, box=SHEET_PORTRAIT_BOX, digest=None):
+    """
+    立ち絵を枠に合わせて縮小した画像を返す（キャッシュ済みなら再デコードしない）
+    返される画像は共有されるため、呼び出し側で書き換えないこと
+    """
+    return PORTRAIT_CACHE.get(data, box, digest)
+
+def compact_portrait(data, boxes=PORTRAIT_BOXES):
+    """
+    立ち絵を保持用に小さくしたバイト列を返す
+    どの枠に対しても REDUCING_GAP 倍の解像度を残すため、ここから縮小した結果は元の画像からの縮小と見分けがつかない
+    元の画像がその大きさ以内なら、描画結果を変えないよう元のバイト列をそのまま返す
+    小さくした場合は画素が元と異なるため、レンダリング仕様の内容ハッシュは戻り値のバイト列から計算すること
+    """
+    from PIL import Image
+
+    limit = (
+        int(max(box[0] for box in boxes) * REDUCING_GAP),
+        int(max(box[1] for box in boxes) * REDUCING_GAP),
+    )
+    with Image.open(io.BytesIO(data)) as image:
+        if image.width <= limit[0] and image.height <= limit[1]:
+            return bytes(data)
+        image_format = image.format
+        if image_format == "JPEG":
+            image.draft(image.mode, limit)
+        reducing_gap = REDUCING_GAP if image.mode in REDUCIBLE_MODES else None
+        image.thumbnail(limit, Image.Resampling.LANCZOS, reducing_gap=reducing_gap)
+        if image.mode not in COMPACT_MODES:
+            # CMYK などはそのままでは PNG に保存できないため、描画時と同じ変換で RGB(A) にする
+            image = image.convert("RGBA" if "A" in image.getbands() or "transparency" in image.info else "RGB")
+        compact = io.BytesIO()
+        try:
+            if image_format == "JPEG" and image.mode in ("RGB", "L"):
+                # 写真は PNG にすると元より大きくなるため、色差を間引かない高品質の JPEG にする
+                image.save(compact, format="JPEG", quality=95, subsampling=0)
+            else:
+                image.save(compact, format="PNG", compress_level=1)
+        except (OSError, ValueError):
+            # 保存できない場合は小さくせずに元のバイト列を保持する
+            return bytes(data)
+    compact = compact.getvalue()
+    return compact if len(compact) < len(data) else bytes(data)
+
+def composite_on_background(portrait, bg_rgba):
+    """
+    透過PNGは背景色で合成して透過を防ぐ
+    """
+    from PIL import Image
+
+    bg_layer = Image.new("RGBA", portrait.size, bg_rgba)
+    return Image.alpha_composite(bg_layer, portrait)
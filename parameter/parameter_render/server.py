@@ -0,0 +1,375 @@
+"""
+能力値画像の HTTP 描画サービス（チャットボットなどから Streamlit を介さずに画像を作る）
+
+    python -m parameter_render.server [--host 127.0.0.1] [--port 8600] [--workers 4] [--queue 32]
+
+POST /render
+    Content-Type: application/json
+        一括出力の一覧と同じ列名のオブジェクト（name, type, u〜x, a〜t, font, font_scale, swap_layout,
+        bg_color, bg_alpha, text_color, learned_color）。立ち絵は portrait_base64 に Base64 で指定する
+    Content-Type: multipart/form-data
+        spec（上と同じ JSON）と portrait（画像ファイル）のパート
+    倍率と出力形式はクエリ文字列または JSON の scale, format（png, webp, auto など）で指定する
+    応答は画像のバイト列。ETag と X-Render-Digest にレンダリング仕様のハッシュを付ける
+GET /healthz … 稼働状況（JSON）
+GET /metrics … Prometheus 形式のメトリクス
+
+描画は上限付きのスレッドプールで行い、処理中と待ちの合計が上限を超えたら 503 を返す
+生成した画像はメモリ（PARAMETER_RENDER_CACHE_MB）と、設定されていればディスク（PARAMETER_RENDER_STORE_DIR）に保存され、
+同じ保存先を使う Web アプリとも共有される
+"""
+import argparse
+import base64
+import binascii
+import json
+import math
+import os
+import re
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from .batch import row_to_job
+from .cache import RENDER_FLIGHTS, RenderCache, load_or_render
+from .encode import ENCODERS, encoder_for_spec, get_encoder, is_encoder_available
+from .fonts import LOCAL_FONTS
+from .image import MIN_SCALE
+from .metrics import CONTENT_TYPE, METRICS, register_cache
+from .portrait import PortraitError
+from .spec import GROUP_KEYS, SKILL_KEYS, RenderSpec
+from .store import DiskRenderStore
+
+# Base64 にした 10MB の立ち絵（約 13.4MB）が収まる大きさ
+MAX_BODY_BYTES = 16 * 1024 * 1024
+MAX_PORTRAIT_BYTES = 10 * 1024 * 1024
+MAX_SCALE = 4.0
+# 能力値（u〜x）の上限。Web アプリの入力欄と同じく数字だけを受け付ける
+MAX_STAT_VALUE = 99
+# 文字サイズの倍率の範囲（Web アプリの文字サイズ入力欄の 10〜80px を 28px 基準にしたもの）
+FONT_SCALE_RANGE = (10 / 28, 80 / 28)
+# キャラ名の文字数の上限（名前欄は幅 320px のため、小さい文字サイズでもこれ以上は表示しきれない）
+MAX_NAME_LENGTH = 64
+# 値として受け付ける型（一覧の CSV / JSON の1セルに入るもの）
+SCALAR_TYPES = (str, int, float, bool)
+COLOR_KEYS = {"bg_color_hex": "bg_color", "text_color_hex": "text_color", "learned_color_hex": "learned_color"}
+_STAT_VALUE_PATTERN = re.compile(r"[0-9]{1,3}")
+_HEX_COLOR_PATTERN = re.compile(r"#[0-9A-Fa-f]{6}")
+
+SERVICE_REQUESTS = METRICS.counter("parameter_service_requests_total", "描画サービスへのリクエスト数（応答のステータス別）", ("status",))
+
+class RequestError(Exception):
+    """
+    クライアントに返すエラー（ステータスコードとメッセージ）
+    """
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+def _parse_multipart(content_type, body):
+    """
+    multipart/form-data を {パート名: バイト列} にする
+    """
+    message = BytesParser(policy=HTTP).parsebytes(
+        f"Content-Type: {content_type}\r\nMIME-Version: 1.0\r\n\r\n".encode("latin-1") + body
+    )
+    if not message.is_multipart():
+        raise RequestError(400, "multipart の形式が不正です")
+    parts = {}
+    for part in message.iter_parts():
+        name = part.get_param("name", header="content-disposition")
+        if name:
+            parts[name] = part.get_payload(decode=True) or b""
+    return parts
+
+def validate_row(row):
+    """
+    JSON の行の各列の型を検証する。配列やオブジェクトなどは RequestError(400)
+    """
+    for key in ("name", "filename", "font"):
+        value = row.get(key)
+        if value is not None and not isinstance(value, str):
+            raise RequestError(400, f"{key} は文字列で指定してください")
+    for key in ("type", "charactor_type", "swap_layout", "font_scale", "bg_alpha", *GROUP_KEYS, *SKILL_KEYS):
+        value = row.get(key)
+        if value is not None and not isinstance(value, SCALAR_TYPES):
+            raise RequestError(400, f"{key} は文字列・数値・真偽値のいずれかで指定してください")
+    font = row.get("font")
+    if font and font not in LOCAL_FONTS:
+        raise RequestError(400, f"未対応のフォントです: {font}（{', '.join(LOCAL_FONTS)} から選んでください）")
+    return row
+
+def validate_spec_kwargs(spec_kwargs):
+    """
+    一覧の行から作った spec の引数を検証する。不正な場合は RequestError(400)、文字サイズの倍率は範囲内に収める
+    描画に時間のかかる指定（極端な文字サイズなど）で描画スレッドを占有させないため
+    """
+    if len(spec_kwargs["filename"]) > MAX_NAME_LENGTH:
+        raise RequestError(400, f"name は {MAX_NAME_LENGTH} 文字以内で指定してください")
+    for key, value in zip(GROUP_KEYS, spec_kwargs["values"]):
+        if value and (not _STAT_VALUE_PATTERN.fullmatch(value) or int(value) > MAX_STAT_VALUE):
+            raise RequestError(400, f"{key} は 0〜{MAX_STAT_VALUE} の整数で指定してください")
+    for field_name, key in COLOR_KEYS.items():
+        value = spec_kwargs[field_name]
+        if not isinstance(value, str) or not _HEX_COLOR_PATTERN.fullmatch(value):
+            raise RequestError(400, f"{key} は #RRGGBB の形式で指定してください")
+    if not 0 <= spec_kwargs["bg_alpha"] <= 100:
+        raise RequestError(400, "bg_alpha は 0〜100 で指定してください")
+    font_scale = spec_kwargs["font_scale"]
+    if not math.isfinite(font_scale):
+        raise RequestError(400, "font_scale は有限の数値で指定してください")
+    spec_kwargs["font_scale"] = min(max(font_scale, FONT_SCALE_RANGE[0]), FONT_SCALE_RANGE[1])
+    return spec_kwargs
+
+def parse_render_request(content_type, body, query):
+    """
+    リクエストから (RenderSpec, 倍率, 出力形式) を作る（auto などは実際の形式に置き換える）。不正な場合は RequestError
+    """
+    media_type = (content_type or "").split(";", 1)[0].strip().lower()
+    portrait = None
+    if media_type == "application/json":
+        try:
+            row = json.loads(body)
+        except ValueError:
+            raise RequestError(400, "JSON を読み込めません") from None
+        if not isinstance(row, dict):
+            raise RequestError(400, "JSON はオブジェクトである必要があります")
+        portrait_base64 = row.pop("portrait_base64", None)
+        if portrait_base64:
+            try:
+                portrait = base64.b64decode(portrait_base64, validate=True)
+            except (binascii.Error, TypeError, ValueError):
+                raise RequestError(400, "portrait_base64 を Base64 として読み込めません") from None
+    elif media_type == "multipart/form-data":
+        parts = _parse_multipart(content_type, body)
+        try:
+            row = json.loads(parts.get("spec") or b"{}")
+        except ValueError:
+            raise RequestError(400, "spec の JSON を読み込めません") from None
+        if not isinstance(row, dict):
+            raise RequestError(400, "spec はオブジェクトである必要があります")
+        portrait = parts.get("portrait") or None
+    else:
+        raise RequestError(415, "Content-Type は application/json か multipart/form-data にしてください")
+
+    if portrait is not None and len(portrait) > MAX_PORTRAIT_BYTES:
+        raise RequestError(413, "立ち絵は 10MB 以下にしてください")
+    # サーバー上のファイルは読ませない（立ち絵はリクエストに含め、フォントは同梱のものだけ）
+    row.pop("portrait", None)
+    validate_row(row)
+
+    try:
+        spec_kwargs, _ = row_to_job(row, "")
+    except (TypeError, ValueError) as exc:
+        raise RequestError(400, f"レンダリング仕様が不正です: {exc}") from None
+    spec_kwargs = validate_spec_kwargs(spec_kwargs)
+    try:
+        spec = RenderSpec(portrait=portrait, **spec_kwargs)
+        spec.digest
+    except (TypeError, ValueError) as exc:
+        raise RequestError(400, f"レンダリング仕様が不正です: {exc}") from None
+
+    try:
+        scale = float(query.get("scale", row.get("scale", 1.0)))
+    except (TypeError, ValueError):
+        raise RequestError(400, "scale は数値で指定してください") from None
+    # NaN は比較が常に偽になるため、範囲の判定で弾かれる
+    if not MIN_SCALE <= scale <= MAX_SCALE:
+        raise RequestError(400, f"scale は {MIN_SCALE:g} 以上 {MAX_SCALE:g} 以下にしてください")
+
+    encoder = encoder_for_spec(str(query.get("format", row.get("format", "png"))).strip().lower(), spec)
+    if not is_encoder_available(encoder):
+        raise RequestError(400, f"未対応の出力形式です: {encoder}（{', '.join(ENCODERS)}, auto, preview）")
+    return spec, scale, encoder
+
+class RenderService:
+    """
+    描画を上限付きのスレッドプールで実行する（処理中 + 待ちが workers + queue を超えたら受け付けない）
+    """
+    def __init__(self, workers=4, queue=32, timeout=30.0, render_cache=None, render_store=None):
+        self.workers = workers
+        self.queue = queue
+        self.timeout = timeout
+        self.render_cache = render_cache or RenderCache.from_env()
+        self.render_store = render_store
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="parameter-render")
+        self._slots = threading.BoundedSemaphore(workers + queue)
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.rejected = 0
+        register_cache("memory", self.render_cache.stats)
+        if render_store is not None:
+            register_cache("disk", render_store.stats)
+
+    def _release(self, _future):
+        with self._lock:
+            self.in_flight -= 1
+        self._slots.release()
+
+    def render(self, spec, scale, encoder):
+        """
+        画像のバイト列を返す。混雑時は RequestError(503)、時間切れは RequestError(504)、
+        立ち絵を読み込めない場合は RequestError(400)。それ以外の描画の失敗はそのまま送出する
+        """
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise RequestError(503, "混み合っています。しばらくしてから再度お試しください")
+        with self._lock:
+            self.in_flight += 1
+        try:
+            future = self._executor.submit(load_or_render, spec, scale, encoder, self.render_cache, self.render_store)
+        except RuntimeError:
+            self._release(None)
+            raise RequestError(503, "停止中です") from None
+        # 時間切れでも描画自体は続くため、枠は描画が終わった時に返す
+        future.add_done_callback(self._release)
+        try:
+            return future.result(self.timeout)
+        except FutureTimeoutError:
+            raise RequestError(504, "描画が時間内に終わりませんでした") from None
+        except PortraitError as exc:
+            raise RequestError(400, str(exc)) from None
+
+    def stats(self):
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "queue": self.queue,
+                "in_flight": self.in_flight,
+                "rejected": self.rejected,
+            }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
+
+class RenderRequestHandler(BaseHTTPRequestHandler):
+    # Keep-Alive（HTTP/1.1 の持続接続）に対応するため、応答には必ず Content-Length を付ける
+    protocol_version = "HTTP/1.1"
+    server_version = "ParameterRender/1"
+
+    def _send(self, status, body, content_type, headers=None):
+        SERVICE_REQUESTS.inc(status=str(status))
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(body)
+
+    def _send_json(self, status, payload, headers=None):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self._send(status, body, "application/json; charset=utf-8", headers)
+
+    def _send_error(self, error):
+        headers = {"Retry-After": "1"} if error.status == 503 else None
+        self._send_json(error.status, {"error": error.message}, headers)
+
+    def _read_body(self):
+        if "chunked" in self.headers.get("Transfer-Encoding", "").lower():
+            self.close_connection = True
+            raise RequestError(411, "Content-Length を指定してください")
+        try:
+            length = int(self.headers.get("Content-Length", "0"))
+        except ValueError:
+            self.close_connection = True
+            raise RequestError(400, "Content-Length が不正です") from None
+        if length > MAX_BODY_BYTES:
+            # 本文を読まずに返すため、この接続は閉じる
+            self.close_connection = True
+            raise RequestError(413, "リクエストが大きすぎます")
+        return self.rfile.read(length) if length > 0 else b""
+
+    def do_GET(self):
+        path = urlsplit(self.path).path
+        if path == "/healthz":
+            service = self.server.service
+            self._send_json(200, {
+                "status": "ok", **service.stats(), "cache": service.render_cache.stats(), "flights": RENDER_FLIGHTS.stats()
+            })
+        elif path == "/metrics":
+            self._send(200, METRICS.render().encode("utf-8"), CONTENT_TYPE)
+        else:
+            self._send_error(RequestError(404, "見つかりません"))
+
+    do_HEAD = do_GET
+
+    def do_POST(self):
+        started = time.perf_counter()
+        url = urlsplit(self.path)
+        try:
+            body = self._read_body()
+            if url.path != "/render":
+                raise RequestError(404, "見つかりません")
+            query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+            spec, scale, encoder = parse_render_request(self.headers.get("Content-Type"), body, query)
+            etag = f'"{spec.digest}-{scale:g}-{encoder}"'
+            if self.headers.get("If-None-Match") == etag:
+                self._send(304, b"", get_encoder(encoder).mime, {"ETag": etag})
+                return
+            img_bytes = self.server.service.render(spec, scale, encoder)
+        except RequestError as error:
+            self._send_error(error)
+            return
+        except Exception as exc:
+            self._send_json(500, {"error": f"描画に失敗しました: {exc.__class__.__name__}"})
+            return
+        self._send(200, img_bytes, get_encoder(encoder).mime, {
+            "ETag": etag,
+            "X-Render-Digest": spec.digest,
+            "X-Render-Time-Ms": f"{(time.perf_counter() - started) * 1000:.1f}",
+        })
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+class RenderHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # 同時接続が多いボットからの接続を取りこぼさないよう、待ち行列を長めにする
+    request_queue_size = 128
+
+    def __init__(self, address, service, verbose=False):
+        super().__init__(address, RenderRequestHandler)
+        self.service = service
+        self.verbose = verbose
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m parameter_render.server",
+        description="能力値画像を HTTP で描画するサービスを起動します"
+    )
+    parser.add_argument("--host", default=os.environ.get("PARAMETER_SERVICE_HOST", "127.0.0.1"))
+    parser.add_argument("--port", type=int, default=int(os.environ.get("PARAMETER_SERVICE_PORT", "8600")))
+    parser.add_argument("--workers", type=int, default=int(os.environ.get("PARAMETER_SERVICE_WORKERS", os.cpu_count() or 1)),
+                        help="描画スレッド数 (既定: CPU 数)")
+    parser.add_argument("--queue", type=int, default=int(os.environ.get("PARAMETER_SERVICE_QUEUE", "32")),
+                        help="描画待ちの上限。超えたら 503 を返す (既定: 32)")
+    parser.add_argument("--timeout", type=float, default=30.0, help="1件の描画を待つ秒数 (既定: 30)")
+    parser.add_argument("-v", "--verbose", action="store_true", help="リクエストごとのログを出力する")
+    args = parser.parse_args(argv)
+
+    service = RenderService(
+        workers=args.workers, queue=args.queue, timeout=args.timeout, render_store=DiskRenderStore.from_env()
+    )
+    server = RenderHTTPServer((args.host, args.port), service, verbose=args.verbose)
+    print(f"✅ http://{args.host}:{server.server_address[1]}/render で待ち受けています（描画スレッド {args.workers}）", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.shutdown()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
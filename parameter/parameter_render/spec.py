@@ -0,0 +1,142 @@
+"""
+画像生成の入力をまとめたレンダリング仕様
+
+仕様は正規化したうえで短いバイト列に詰めることができ、そのハッシュ（spec.digest）を
+メモリ・ディスク・HTTP の各キャッシュ層で共通のキーとして使う
+"""
+import os
+import struct
+from dataclasses import dataclass, field, replace
+from functools import cached_property
+from typing import Optional, Tuple
+
+from .fingerprint import fingerprint_bytes
+from .portrait import portrait_digest
+
+GROUP_KEYS = "uvwx"
+SKILL_KEYS = "abcdefghijklmnopqrst"
+CHARACTOR_TYPES = ("巫覡", "付喪神")
+
+# pack() の形式や描画結果が変わったら上げる（ディスクなどに残った古い画像と衝突させないため）
+# 2: 縮小版を描画後のリサイズではなく、その倍率で直接描画するようにした
+# 3: フォントに無い文字を同梱の別フォントに切り替えて描くようにした
+# 4: 切り替え先のフォントを収録文字数ではなく固定の優先順で選ぶようにした
+SPEC_FORMAT_VERSION = 4
+
+# 形式番号, フラグ, 取得技能のビットマスク(a が最下位ビット), 背景RGBA, 文字色RGB, 取得技能の色RGB, フォント倍率
+_SPEC_HEADER = struct.Struct("<BBI4B3B3Bd")
+_FLAG_TSUKUMOGAMI = 0x01
+_FLAG_SWAP_LAYOUT = 0x02
+
+def _parse_hex_color(hex_color):
+    value = int(hex_color.lstrip('#')[:6], 16)
+    return (value >> 16) & 0xFF, (value >> 8) & 0xFF, value & 0xFF
+
+def _pack_text(text):
+    """
+    長さ(2バイト) + UTF-8 の形で文字列を詰める
+    """
+    data = text.encode("utf-8")
+    if len(data) > 0xFFFF:
+        raise ValueError("文字列が長すぎます")
+    return struct.pack("<H", len(data)) + data
+
+@dataclass(frozen=True)
+class RenderSpec:
+    """
+    1枚の能力値画像を生成するための入力一式
+    values は u, v, w, x の順、checks は a〜t の順に並べる
+    """
+    values: Tuple[str, ...] = ("",) * len(GROUP_KEYS)
+    checks: Tuple[bool, ...] = (False,) * len(SKILL_KEYS)
+    filename: str = ""
+    charactor_type: bool = False  # False: 巫覡, True: 付喪神
+    portrait: Optional[bytes] = field(default=None, repr=False)
+    portrait_digest: Optional[str] = None  # 省略時は portrait から計算する
+    font_path: Optional[str] = None
+    font_scale: float = 1.0
+    swap_layout: bool = False
+    bg_color_hex: str = "#FFFFFF"
+    bg_alpha: int = 100
+    text_color_hex: str = "#000000"
+    learned_color_hex: str = "#FFA500"
+
+    def __post_init__(self):
+        if len(self.values) != len(GROUP_KEYS):
+            raise ValueError(f"values には {len(GROUP_KEYS)} 個の値が必要です")
+        if len(self.checks) != len(SKILL_KEYS):
+            raise ValueError(f"checks には {len(SKILL_KEYS)} 個の値が必要です")
+        if self.portrait and not self.portrait_digest:
+            object.__setattr__(self, "portrait_digest", portrait_digest(self.portrait))
+
+    @classmethod
+    def from_inputs(cls, values, checks, filename="", charactor_type=False, portrait=None, portrait_digest=None, **style):
+        """
+        create_image と同じ形式（キーごとの辞書）の入力から仕様を作る
+        """
+        return cls(
+            values=tuple(str(values.get(key, '') or '') for key in GROUP_KEYS),
+            checks=tuple(bool(checks.get(key, False)) for key in SKILL_KEYS),
+            filename=filename or "",
+            charactor_type=bool(charactor_type),
+            portrait=portrait,
+            portrait_digest=portrait_digest,
+            **style
+        )
+
+    def check_mask(self):
+        """
+        取得技能を a〜t の順に 20 ビットのマスクにまとめる
+        """
+        mask = 0
+        for bit, checked in enumerate(self.checks):
+            if checked:
+                mask |= 1 << bit
+        return mask
+
+    def pack(self):
+        """
+        描画結果に影響する項目だけを正規化して短いバイト列に詰める
+        立ち絵は内容ハッシュ、背景の不透明度は描画時と同じ 0〜255 の値で表す
+        """
+        flags = 0
+        if self.charactor_type:
+            flags |= _FLAG_TSUKUMOGAMI
+        if self.swap_layout:
+            flags |= _FLAG_SWAP_LAYOUT
+        bg_alpha = max(0, min(255, int(self.bg_alpha * 255 / 100)))
+        header = _SPEC_HEADER.pack(
+            SPEC_FORMAT_VERSION,
+            flags,
+            self.check_mask(),
+            *_parse_hex_color(self.bg_color_hex), bg_alpha,
+            *_parse_hex_color(self.text_color_hex),
+            *_parse_hex_color(self.learned_color_hex),
+            float(self.font_scale)
+        )
+        font_path = os.path.realpath(self.font_path) if self.font_path else ""
+        portrait = bytes.fromhex(self.portrait_digest) if self.portrait_digest else b""
+        return b"".join((
+            header,
+            *(_pack_text(value) for value in self.values),
+            _pack_text(self.filename),
+            _pack_text(font_path),
+            struct.pack("<B", len(portrait)),
+            portrait,
+        ))
+
+    @cached_property
+    def digest(self):
+        """
+        pack() の内容ハッシュ。各キャッシュ層のキーとして使う
+        """
+        return fingerprint_bytes(self.pack())
+
+    def values_dict(self):
+        return dict(zip(GROUP_KEYS, self.values))
+
+    def checks_dict(self):
+        return dict(zip(SKILL_KEYS, self.checks))
+
+    def replace(self, **changes):
+        return replace(self, **changes)
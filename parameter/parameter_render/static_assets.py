@@ -0,0 +1,92 @@
+"""
+Streamlit の静的ファイル配信（server.enableStaticServing）向けのフォント出力
+
+プレビュー用フォントをファイル名に内容のハッシュを含めて static/generated/ に書き出し、
+ページには小さな @font-face だけを送る（フォント本体は再実行のたびに送らず、ブラウザが一度だけ取得する）
+スタイルシートは静的配信しない。Tornado 版の Streamlit は .css を text/plain（nosniff 付き）で返し、
+ブラウザに読み込まれないため。フォントはどちらの版でも font/* として配信される
+"""
+import hashlib
+import os
+import tempfile
+import threading
+from functools import lru_cache
+
+from .webfonts import build_webfont, font_file_digest
+
+STATIC_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    "static"
+)
+GENERATED_DIR = os.path.join(STATIC_DIR, "generated")
+# Streamlit は static/ 以下を app/static/ で配信する（ページからの相対 URL）
+STATIC_URL_PREFIX = "app/static/generated"
+
+FONT_EXTENSIONS = {
+    "woff2": ".woff2",
+    "woff": ".woff",
+    "truetype": ".ttf",
+    "opentype": ".otf",
+}
+
+_write_lock = threading.Lock()
+
+def _write_atomic(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as tmp_file:
+            tmp_file.write(data)
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def _publish(data, name, ext):
+    content_hash = hashlib.sha256(data).hexdigest()[:16]
+    filename = f"{name}.{content_hash}{ext}"
+    path = os.path.join(GENERATED_DIR, filename)
+    with _write_lock:
+        if not os.path.exists(path):
+            _write_atomic(path, data)
+    return filename, content_hash
+
+@lru_cache(maxsize=256)
+def publish_static_asset(data, name, ext):
+    """
+    data を内容ハッシュ付きのファイル名で書き出し、ページから参照する URL を返す
+    内容が変わればファイル名も変わるため、ブラウザのキャッシュ（ETag などによる再検証）で古い内容が使われることはない
+    """
+    filename, _ = _publish(data, name, ext)
+    return f"{STATIC_URL_PREFIX}/{filename}"
+
+@lru_cache(maxsize=64)
+def _publish_font_face(digest, font_path, font_family, text):
+    webfont = build_webfont(font_path, text)
+    if webfont is None:
+        return ""
+    font_data, _, format_name = webfont
+    font_stem = os.path.splitext(os.path.basename(font_path))[0]
+    font_url = publish_static_asset(font_data, f"font-{font_stem}", FONT_EXTENSIONS[format_name])
+    return f"""@font-face {{
+    font-family: '{font_family}';
+    src: url('{font_url}') format('{format_name}');
+    font-weight: normal;
+    font-style: normal;
+}}
+"""
+
+def publish_font_face_css(font_path, font_family, text=None):
+    """
+    プレビュー用フォントを静的ファイルとして書き出し、それを参照する @font-face の CSS を返す
+    出力できないフォントの場合は空文字列
+    """
+    if not font_path or not os.path.exists(font_path):
+        return ""
+    try:
+        digest = font_file_digest(font_path)
+        return _publish_font_face(digest, font_path, font_family, "".join(sorted(set(text or ""))))
+    except OSError:
+        return ""
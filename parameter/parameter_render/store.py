@@ -0,0 +1,155 @@
+"""
+生成済み画像のディスク保存（内容アドレス方式）
+
+画像をレンダリング仕様のハッシュ（spec.digest）と拡張子をファイル名にして保存する
+プロセスの再起動後や、同じマシン上の別プロセスからも同じ画像を再利用できる
+"""
+import os
+import re
+import tempfile
+import threading
+
+DEFAULT_RENDER_STORE_MB = 256
+# 上限を超えたら、この割合まで古いものから削除する
+SWEEP_TARGET_RATIO = 0.9
+
+_KEY_PATTERN = re.compile(r"^[0-9A-Za-z._-]+$")
+
+class DiskRenderStore:
+    """
+    キー（"<ハッシュ>.png" などのファイル名）→ 画像 を root 以下に保存する、容量上限付きのストア
+    読み出し時に更新日時を更新し、上限を超えたら更新日時の古いものから削除する（LRU）
+    """
+    def __init__(self, root, max_bytes=DEFAULT_RENDER_STORE_MB * 1024 * 1024):
+        self.root = os.path.abspath(root)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+        os.makedirs(self.root, exist_ok=True)
+        self.total_bytes = sum(size for _, _, size in self._scan())
+
+    @classmethod
+    def from_env(cls):
+        """
+        環境変数 PARAMETER_RENDER_STORE_DIR（保存先）が設定されていれば作る。未設定なら None
+        容量上限は PARAMETER_RENDER_STORE_MB（既定 256）
+        """
+        root = os.environ.get("PARAMETER_RENDER_STORE_DIR", "").strip()
+        if not root:
+            return None
+        max_mb = float(os.environ.get("PARAMETER_RENDER_STORE_MB", DEFAULT_RENDER_STORE_MB))
+        return cls(root, max_bytes=int(max_mb * 1024 * 1024))
+
+    def path_for(self, key):
+        """
+        キーに対応するファイルのパス（先頭2文字でディレクトリを分ける）
+        """
+        if not _KEY_PATTERN.match(key):
+            raise ValueError(f"不正なキーです: {key!r}")
+        return os.path.join(self.root, key[:2], key)
+
+    def get(self, key):
+        path = self.path_for(key)
+        try:
+            with open(path, "rb") as stored_file:
+                data = stored_file.read()
+            os.utime(path)
+        except FileNotFoundError:
+            # 未保存、または別プロセスの掃除で削除された
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return data
+
+    def put(self, key, data):
+        path = self.path_for(key)
+        if len(data) > self.max_bytes:
+            return False
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        # 同じディレクトリの一時ファイルに書いてから置き換える（読み手が書きかけを見ないように）
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as tmp_file:
+                tmp_file.write(data)
+            os.chmod(tmp_path, 0o644)
+            # 同じキーを書き直す場合は、置き換えられるファイルの分を合計から引く
+            try:
+                replaced_size = os.path.getsize(path)
+            except FileNotFoundError:
+                replaced_size = 0
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        with self._lock:
+            self.writes += 1
+            self.total_bytes += len(data) - replaced_size
+            if self.total_bytes > self.max_bytes:
+                self._sweep()
+        return True
+
+    def _scan(self):
+        """
+        保存済みファイルの (更新日時, パス, サイズ) を列挙する
+        """
+        for directory in os.scandir(self.root):
+            if not directory.is_dir():
+                continue
+            for entry in os.scandir(directory.path):
+                if entry.name.endswith(".tmp"):
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                yield stat.st_mtime, entry.path, stat.st_size
+
+    def _sweep(self):
+        # 他のプロセスも書き込むため、合計サイズはディスクを走査して数え直す
+        entries = sorted(self._scan())
+        total = sum(size for _, _, size in entries)
+        target = self.max_bytes * SWEEP_TARGET_RATIO
+        for _, path, size in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            self.evictions += 1
+        self.total_bytes = total
+
+    def sweep(self):
+        with self._lock:
+            self._sweep()
+
+    def clear(self):
+        with self._lock:
+            for _, path, _ in list(self._scan()):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            self.total_bytes = 0
+
+    def stats(self):
+        with self._lock:
+            requests = self.hits + self.misses
+            return {
+                "root": self.root,
+                "bytes": self.total_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / requests if requests else 0.0,
+                "writes": self.writes,
+                "evictions": self.evictions,
+            }
@@ -0,0 +1,171 @@
+"""
+描画の段階ごとの所要時間の計測
+
+環境変数 PARAMETER_RENDER_TIMINGS=1 で有効にすると、render_encoded の1回ごとに
+立ち絵のデコード・縮小、フォントの読み込み、下地の作成、合成、文字の描画、書き出しの時間を記録する
+記録は直近の一覧と段階ごとの p50 / p95 にまとめ、ロガー parameter_render.timing に JSON 1行で出力する
+（PARAMETER_RENDER_TIMINGS_LOG にファイルを指定すると JSON Lines で追記する）
+無効の時、各段階の計測は共有の何もしないコンテキストを返すだけ
+"""
+import contextlib
+import json
+import logging
+import math
+import os
+import threading
+import time
+from collections import deque
+
+STAGES = ("decode", "resize", "fonts", "template", "compose", "text", "encode")
+STAGE_LABELS = {
+    "decode": "立ち絵のデコード",
+    "resize": "立ち絵の縮小",
+    "fonts": "フォントの読み込み",
+    "template": "下地の作成",
+    "compose": "下地の複製・立ち絵の合成",
+    "text": "文字の描画",
+    "encode": "書き出し",
+    "total": "合計",
+}
+
+logger = logging.getLogger("parameter_render.timing")
+
+_NULL_CONTEXT = contextlib.nullcontext()
+
+def percentile(sorted_values, percent):
+    """
+    昇順に並んだ値の percent パーセンタイル（最近傍順位）
+    """
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, math.ceil(percent / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+class _Stage:
+    __slots__ = ("stages", "name", "started")
+
+    def __init__(self, stages, name):
+        self.stages = stages
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        elapsed = (time.perf_counter() - self.started) * 1000
+        self.stages[self.name] = self.stages.get(self.name, 0.0) + elapsed
+        return False
+
+class _Render:
+    __slots__ = ("timings", "record", "started")
+
+    def __init__(self, timings, fields):
+        self.timings = timings
+        self.record = {**fields, "stages": {}}
+
+    def __enter__(self):
+        self.timings._local.record = self.record
+        self.started = time.perf_counter()
+        return self.record
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.record["total_ms"] = (time.perf_counter() - self.started) * 1000
+        self.timings._local.record = None
+        if exc_type is not None:
+            self.record["error"] = exc_type.__name__
+        self.timings._finish(self.record)
+        return False
+
+class RenderTimings:
+    """
+    描画1回ごとの段階別の所要時間を集める（スレッドごとに描画中の記録を持つ）
+    history: 保持する直近の記録の件数, window: p50 / p95 の計算に使う直近の件数
+    """
+    def __init__(self, enabled=False, history=20, window=200):
+        self.enabled = enabled
+        self.window = window
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._recent = deque(maxlen=history)
+        self._samples = {}
+        self.renders = 0
+
+    def render(self, **fields):
+        """
+        描画1回分の記録を始める（入れ子の呼び出しは外側の記録にまとめる）
+        """
+        if not self.enabled or getattr(self._local, "record", None) is not None:
+            return _NULL_CONTEXT
+        return _Render(self, fields)
+
+    def stage(self, name):
+        """
+        段階 name の所要時間を計測する。描画の記録中でなければ何もしない
+        """
+        if not self.enabled:
+            return _NULL_CONTEXT
+        record = getattr(self._local, "record", None)
+        if record is None:
+            return _NULL_CONTEXT
+        return _Stage(record["stages"], name)
+
+    def _finish(self, record):
+        record["at"] = time.time()
+        with self._lock:
+            self.renders += 1
+            self._recent.append(record)
+            for name, elapsed in (*record["stages"].items(), ("total", record["total_ms"])):
+                samples = self._samples.get(name)
+                if samples is None:
+                    samples = self._samples[name] = deque(maxlen=self.window)
+                samples.append(elapsed)
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(json.dumps(record, ensure_ascii=False, default=str))
+
+    def recent(self):
+        """
+        直近の記録（新しい順）
+        """
+        with self._lock:
+            return [dict(record, stages=dict(record["stages"])) for record in reversed(self._recent)]
+
+    def summary(self):
+        """
+        段階ごとの {count, p50_ms, p95_ms}（STAGES の順, 最後に total）
+        """
+        with self._lock:
+            samples = {name: sorted(values) for name, values in self._samples.items()}
+        summary = {}
+        for name in (*STAGES, "total"):
+            values = samples.get(name)
+            if values:
+                summary[name] = {
+                    "count": len(values),
+                    "p50_ms": percentile(values, 50),
+                    "p95_ms": percentile(values, 95),
+                }
+        return summary
+
+    def clear(self):
+        with self._lock:
+            self._recent.clear()
+            self._samples.clear()
+            self.renders = 0
+
+def log_to_file(path):
+    """
+    記録を path に JSON Lines で追記する
+    """
+    handler = logging.FileHandler(path, encoding="utf-8")
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    return handler
+
+RENDER_TIMINGS = RenderTimings(
+    enabled=os.environ.get("PARAMETER_RENDER_TIMINGS", "0") == "1",
+    history=int(os.environ.get("PARAMETER_RENDER_TIMINGS_HISTORY", "20"))
+)
+if RENDER_TIMINGS.enabled and os.environ.get("PARAMETER_RENDER_TIMINGS_LOG"):
+    log_to_file(os.environ["PARAMETER_RENDER_TIMINGS_LOG"])
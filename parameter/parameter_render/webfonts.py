@@ -0,0 +1,138 @@
+"""
+ブラウザでのフォントプレビュー用 Web フォント
+
+プレビュー文字列に含まれるグリフだけを抜き出したサブセットを WOFF2 で作り、
+フォントファイルのダイジェストごとにプロセス内でキャッシュする
+fontTools（WOFF2 には brotli も）が無い環境では従来通りフォント全体を埋め込む（その旨を一度だけ警告する）
+"""
+import base64
+import hashlib
+import io
+import logging
+import os
+import threading
+from functools import lru_cache
+
+WEBFONT_EXTENSIONS = {".ttf", ".otf"}
+
+logger = logging.getLogger("parameter_render.webfonts")
+_warned = set()
+
+def _warn_once(key, message):
+    with _digest_lock:
+        if key in _warned:
+            return
+        _warned.add(key)
+    logger.warning(message)
+
+_digest_lock = threading.Lock()
+_digests = {}
+
+def font_file_digest(font_path):
+    """
+    フォントファイルの SHA-256（サイズと更新時刻が変わらない限り再計算しない）
+    """
+    stat = os.stat(font_path)
+    key = (os.path.realpath(font_path), stat.st_size, stat.st_mtime_ns)
+    with _digest_lock:
+        digest = _digests.get(key)
+    if digest is None:
+        hasher = hashlib.sha256()
+        with open(font_path, "rb") as font_file:
+            for chunk in iter(lambda: font_file.read(1024 * 1024), b""):
+                hasher.update(chunk)
+        digest = hasher.hexdigest()
+        with _digest_lock:
+            _digests[key] = digest
+    return digest
+
+def _webfont_flavor():
+    try:
+        import brotli  # noqa: F401
+        return "woff2"
+    except ImportError:
+        _warn_once("brotli", "brotli が無いため、プレビュー用フォントを WOFF2 ではなく WOFF で出力します（pip install brotli）")
+        return "woff"
+
+@lru_cache(maxsize=64)
+def _build_webfont(digest, font_path, text):
+    """
+    (フォントデータ, MIME, format 名) を返す。digest はキャッシュキーとしてのみ使う
+    """
+    ext = os.path.splitext(font_path)[1].lower()
+    try:
+        from fontTools import subset
+    except ImportError:
+        subset = None
+        _warn_once(
+            "fonttools",
+            "fontTools が無いため、プレビュー用フォントをサブセット化せずにフォント全体を送ります（pip install fonttools brotli）"
+        )
+
+    if subset is not None and text:
+        flavor = _webfont_flavor()
+        options = subset.Options()
+        options.flavor = flavor
+        options.name_IDs = ["*"]
+        options.notdef_outline = True
+        font = subset.load_font(font_path, options)
+        try:
+            subsetter = subset.Subsetter(options)
+            subsetter.populate(text=text)
+            subsetter.subset(font)
+            buffer = io.BytesIO()
+            subset.save_font(font, buffer, options)
+        finally:
+            font.close()
+        return buffer.getvalue(), f"font/{flavor}", flavor
+
+    with open(font_path, "rb") as font_file:
+        font_data = font_file.read()
+    mime = "font/ttf" if ext == ".ttf" else "font/otf"
+    format_name = "truetype" if ext == ".ttf" else "opentype"
+    return font_data, mime, format_name
+
+def build_webfont(font_path, text):
+    """
+    text の表示に必要なグリフだけを含む Web フォントを返す
+    戻り値は (フォントデータ, MIME, format 名)。対象外のファイルなら None
+    """
+    if not font_path or not os.path.exists(font_path):
+        return None
+    if os.path.splitext(font_path)[1].lower() not in WEBFONT_EXTENSIONS:
+        return None
+    text = "".join(sorted(set(text or "")))
+    return _build_webfont(font_file_digest(font_path), font_path, text)
+
+@lru_cache(maxsize=64)
+def _font_face_css(digest, font_path, font_family, text):
+    try:
+        webfont = build_webfont(font_path, text)
+    except OSError:
+        return ""
+    if webfont is None:
+        return ""
+    font_data, mime, format_name = webfont
+    encoded = base64.b64encode(font_data).decode("utf-8")
+    return f"""
+        @font-face {{
+            font-family: '{font_family}';
+            src: url(data:{mime};base64,{encoded}) format('{format_name}');
+            font-weight: normal;
+            font-style: normal;
+        }}
+        """
+
+def build_font_face_css(font_path, font_family, text=None):
+    """
+    プレビュー用の @font-face を返す（text を指定するとそのグリフだけのサブセットになる）
+    """
+    if not font_path or not os.path.exists(font_path):
+        return ""
+    if os.path.splitext(font_path)[1].lower() not in WEBFONT_EXTENSIONS:
+        return ""
+    try:
+        digest = font_file_digest(font_path)
+    except OSError:
+        return ""
+    return _font_face_css(digest, font_path, font_family, "".join(sorted(set(text or ""))))
@@ -1,11 +1,15 @@
 import streamlit as st
-from PIL import Image, ImageDraw, ImageFont
-import os
+from PIL import Image
 import re
 import io
-import base64
-from functools import lru_cache
-from pathlib import Path
+
+from parameter_render import (
+    FONT_PATH,
+    FONT_SIZE_OVERRIDES,
+    LOCAL_FONTS,
+    build_font_face_css,
+    create_image,
+)
 
 st.set_page_config(layout="wide")
 
@@ -90,117 +94,6 @@ st.markdown(
     unsafe_allow_html=True
 )
 
-ASSETS_FONTS_DIR = os.path.join(
-    os.path.dirname(os.path.abspath(__file__)),
-    "assets",
-    "fonts"
-)
-APP_FONT_PATH = os.path.join(ASSETS_FONTS_DIR, "NotoSansJP-Regular.ttf")
-FONT_PATH = APP_FONT_PATH if os.path.exists(APP_FONT_PATH) else None
-FONT_SIZE_OVERRIDES = {
-    "DelaGothicOne-Regular": 20,
-    "DotGothic16-Regular": 23,
-    "HachiMaruPop-Regular": 22,
-    "KaiseiTokumin-Regular": 24,
-    "KosugiMaru-Regular": 23,
-    "MPLUSRounded1c-Regular": 23,
-    "NotoSansJP-Regular": 26,
-    "NotoSerifJP-Regular": 26,
-    "ReggaeOne-Regular": 21,
-    "WDXLLubrifontJPN-Regular": 30,
-    "YujiMai-Regular": 22,
-    "ZenKurenaido-Regular": 26,
-    "ZenMaruGothic-Regular": 26,
-}
-SAMPLE_TEXT_FOR_MEASURE = "あいうえおアイウエオ漢字"
-TARGET_FONT_SIZES = [40, 35, 28, 20]
-
-def list_local_fonts(fonts_dir):
-    fonts = {}
-    fonts_path = Path(fonts_dir)
-
-    if not fonts_path.is_dir():
-        return fonts
-    
-    for font_file in fonts_path.iterdir():
-        if font_file.suffix.lower() in {".ttf", ".otf", ".ttc"}:
-            display_name = font_file.stem
-            fonts[display_name] = str(font_file)
-
-    return dict(sorted(fonts.items(), key=lambda item: item[0].lower()))
-
-LOCAL_FONTS = list_local_fonts(ASSETS_FONTS_DIR)
-
-def load_font(font_path, size):
-    if font_path and os.path.exists(font_path):
-        try:
-            return ImageFont.truetype(font_path, size)
-        except OSError:
-            pass
-    if FONT_PATH:
-        try:
-            return ImageFont.truetype(FONT_PATH, size)
-        except OSError:
-            pass
-    return ImageFont.load_default()
-
-def load_specific_font(font_path, size):
-    if not font_path or not os.path.exists(font_path):
-        return None
-    try:
-        return ImageFont.truetype(font_path, size)
-    except OSError:
-        return None
-
-@lru_cache(maxsize=256)
-def get_font_height(font_path, size):
-    font = load_specific_font(font_path, size)
-    if font is None and FONT_PATH and font_path != FONT_PATH:
-        font = load_specific_font(FONT_PATH, size)
-    if font is None:
-        font = ImageFont.load_default()
-    dummy_img = Image.new("RGB", (1, 1))
-    draw = ImageDraw.Draw(dummy_img)
-    bbox = draw.textbbox((0, 0), SAMPLE_TEXT_FOR_MEASURE, font=font)
-    height = bbox[3] - bbox[1]
-    return max(1, height)
-
-REFERENCE_HEIGHTS = {size: get_font_height(FONT_PATH, size) for size in TARGET_FONT_SIZES}
-
-def compute_normalized_size(font_path, base_size, target_height):
-    current_height = get_font_height(font_path, base_size)
-    if not current_height:
-        return base_size
-    scale = target_height / current_height
-    return max(1, int(round(base_size * scale)))
-
-def load_normalized_font(font_path, base_size, target_height, font_scale=1.0):
-    normalized_size = compute_normalized_size(font_path, base_size, target_height)
-    normalized_size = max(1, int(round(normalized_size * font_scale)))
-    return load_font(font_path, normalized_size)
-
-def build_font_face_css(font_path, font_family):
-    if not font_path or not os.path.exists(font_path):
-        return ""
-    ext = os.path.splitext(font_path)[1].lower()
-    if ext not in {".ttf", ".otf"}:
-        return ""
-    try:
-        with open(font_path, "rb") as font_file:
-            font_data = base64.b64encode(font_file.read()).decode("utf-8")
-        mime = "font/ttf" if ext == ".ttf" else "font/otf"
-        format_name = "truetype" if ext == ".ttf" else "opentype"
-        return f"""
-        @font-face {{
-            font-family: '{font_family}';
-            src: url(data:{mime};base64,{font_data}) format('{format_name}');
-            font-weight: normal;
-            font-style: normal;
-        }}
-        """
-    except OSError:
-        return ""
-
 def hex_to_rgba_css(hex_color, alpha_percent):
     hex_color = hex_color.lstrip('#')
     if len(hex_color) != 6:
@@ -221,184 +114,6 @@ def validate_input(input_string):
     else:
         return False
 
-def create_image(values, checks, filename, charactor_type, uploaded_file, font_path=None, font_scale=1.0, swap_layout=False, bg_color_hex="#FFFFFF", bg_alpha=100, text_color_hex="#000000", learned_color_hex="#FFA500"):
-    """
-    入力された値とチェック状態から画像を生成する関数
-    左側：アップロード画像、分類、キャラ名
-    右側：能力値情報
-    """
-    # グループ定義
-    groups = {
-        'u': {
-            'name': '身体',
-            'skills': [('a', '★白兵'), ('b', '運動'), ('c', '頑健'), ('d', '操縦'), ('e', '知覚')]
-        },
-        'v': {
-            'name': '技量',
-            'skills': [('f', '★射撃'), ('g', '医療'), ('h', '隠密'), ('i', '工作'), ('j', '捜査')]
-        },
-        'w': {
-            'name': '心魂',
-            'skills': [('k', '★呪法'), ('l', '意志'), ('m', '看破'), ('n', '芸能'), ('o', '伝承')]
-        },
-        'x': {
-            'name': '社会',
-            'skills': [('p', '★策謀'), ('q', '教養'), ('r', '交渉'), ('s', '電脳'), ('t', '容姿')]
-        }
-    }
-    
-    # 生成する画像の寸法設定
-    image_area_width = 320    # 画像 + キャラ情報の幅
-    stats_area_width = 690    # 能力値情報の幅
-    total_width = image_area_width + stats_area_width
-    
-    # 各セクションの高さ
-    default_img_height = 440    # 画像がない場合の高さ
-    char_info_height = 90       # 分類とキャラ名の高さ
-    content_height = 500        # 能力値情報の高さ
-    
-    # アップロード画像の処理
-    if uploaded_file:
-        uploaded_file.seek(0)
-        uploaded_img = Image.open(uploaded_file)
-        # アスペクト比を保持して、幅300px基準でリサイズ（高さ上限415px）
-        aspect_ratio = uploaded_img.width / uploaded_img.height
-        target_width = image_area_width
-        target_height = int(target_width / aspect_ratio)
-        max_height = 390
-        if target_height > max_height:
-            target_height = max_height
-            target_width = int(target_height * aspect_ratio)
-        uploaded_img = uploaded_img.resize((target_width, target_height), Image.Resampling.LANCZOS)
-        img_target_height = target_height
-    else:
-        uploaded_img = None
-        img_target_height = default_img_height
-    
-    # 左側全体の高さ
-    left_total_height = img_target_height + char_info_height
-
-    # 全体の高さ = 左右で大きい方
-    total_img_height = max(left_total_height, content_height)
-
-    def hex_to_rgba(hex_color, alpha_percent):
-        hex_color = hex_color.lstrip('#')
-        r = int(hex_color[0:2], 16)
-        g = int(hex_color[2:4], 16)
-        b = int(hex_color[4:6], 16)
-        a = max(0, min(255, int(alpha_percent * 255 / 100)))
-        return (r, g, b, a)
-
-    def hex_to_rgb(hex_color):
-        hex_color = hex_color.lstrip('#')
-        r = int(hex_color[0:2], 16)
-        g = int(hex_color[2:4], 16)
-        b = int(hex_color[4:6], 16)
-        return (r, g, b)
-
-    bg_rgba = hex_to_rgba(bg_color_hex, bg_alpha)
-    text_rgb = hex_to_rgb(text_color_hex)
-    learned_rgb = hex_to_rgb(learned_color_hex)
-
-    # 全体の画像を作成
-    img = Image.new('RGBA', (total_width, total_img_height), bg_rgba)
-    draw = ImageDraw.Draw(img)
-
-    # フォント設定
-    font_large = load_normalized_font(font_path, 40, REFERENCE_HEIGHTS[40], font_scale)
-    font_medium = load_normalized_font(font_path, 35, REFERENCE_HEIGHTS[35], font_scale)
-    font_small = load_normalized_font(font_path, 28, REFERENCE_HEIGHTS[28], font_scale)
-    font_tiny = load_normalized_font(font_path, 20, REFERENCE_HEIGHTS[20], font_scale)
-    
-    # 左右の配置を決定
-    if swap_layout:
-        stats_area_x = 0
-        image_area_x = stats_area_width
-    else:
-        image_area_x = 0
-        stats_area_x = image_area_width
-
-    # ここでは折り返し計算は行わない
-
-    # 画像エリアにアップロード画像を配置（中央揃え）
-    image_area_height = total_img_height - char_info_height
-    if uploaded_img:
-        # 透過PNGは背景色で合成して透過を防ぐ
-        uploaded_img = uploaded_img.convert("RGBA")
-        bg_layer = Image.new("RGBA", uploaded_img.size, bg_rgba)
-        uploaded_img = Image.alpha_composite(bg_layer, uploaded_img)
-
-        left_x = image_area_x + (image_area_width - uploaded_img.width) // 2
-        top_y = max(0, (image_area_height - uploaded_img.height) // 2)
-        img.paste(uploaded_img, (left_x, top_y))
-    
-    # 左側の下部にキャラクター情報を表示
-    info_y = image_area_height + 10
-
-    # キャラクター分類を表示
-    charactor_type_str = "巫覡" if not charactor_type else "付喪神"
-    draw.text((image_area_x + 10, info_y), f"{charactor_type_str}", font=font_small, fill=text_rgb)
-
-    # キャラ名を表示
-    char_name = filename if filename else "No Name"
-    char_name_text = f"{char_name}"
-
-    # テキスト幅をチェック
-    text_bbox = draw.textbbox((0, 0), char_name_text, font=font_small)
-    text_width = text_bbox[2] - text_bbox[0]
-
-    # 利用可能な幅（左側のスペース）
-    available_width = image_area_width - 40
-
-    if text_width > available_width:
-        # フォントサイズを縮小
-        draw.text((image_area_x + 15, info_y + 40), char_name_text, font=font_tiny, fill=text_rgb)
-    else:
-        draw.text((image_area_x + 15, info_y + 40), char_name_text, font=font_small, fill=text_rgb)
-    
-    # 右側に能力値情報を描画
-    y_pos = 20
-    line_height = 60
-    right_start_x = stats_area_x + 20
-    
-    for group_key in ['u', 'v', 'w', 'x']:
-        group_data = groups[group_key]
-        # グループタイトル: 【身体】：数値
-        group_value = values.get(group_key, '')
-        group_title = f"【{group_data['name']}】：{group_value}"
-        draw.text((right_start_x, y_pos), group_title, font=font_large, fill=text_rgb)
-        y_pos += line_height
-        
-        # スキル一覧を1行で表示（各スキルの数値を含む）
-        x_offset = right_start_x
-        for skill_key, skill_name in group_data['skills']:
-            is_checked = checks.get(skill_key, False)
-            text_color = learned_rgb if is_checked else text_rgb  # 習得済色または指定色
-            
-            # 各スキルの数値を計算（グループ値+チェック時+1）
-            base_value = int(group_value) if group_value else 0
-            skill_value = base_value + 1 if is_checked else base_value
-            skill_text = f"{skill_name}:{skill_value}"
-            
-            draw.text((x_offset, y_pos), skill_text, font=font_medium, fill=text_color)
-            # 次のスキル位置を計算
-            text_bbox = draw.textbbox((0, 0), skill_text, font=font_medium)
-            text_width = text_bbox[2] - text_bbox[0]
-            x_offset += text_width + 20
-        
-        y_pos += line_height
-    
-    # ファイル名がない場合はデフォルト
-    if not filename:
-        filename = "output"
-    
-    # メモリ上に画像を保存（BytesIO）
-    img_bytes = io.BytesIO()
-    img.save(img_bytes, format='PNG')
-    img_bytes.seek(0)
-    
-    return img_bytes, filename
-
 # Streamlitアプリ
 st.title("ツクモツムギ-能力値画像ジェネレーター")
 
@@ -554,13 +269,14 @@ with col_stats:
         selected_font_name = st.session_state.get('font_name', font_options[0])
         selected_font_path = st.session_state.get('font_path') or LOCAL_FONTS.get(selected_font_name)
         preview_font_family = f"preview-{selected_font_name}"
-        font_face_css = build_font_face_css(selected_font_path, preview_font_family)
+        preview_text = "巫覡と付喪神"
+        # プレビュー文字列のグリフだけを含むサブセットを埋め込む（プロセス内でキャッシュ）
+        font_face_css = build_font_face_css(selected_font_path, preview_font_family, preview_text)
         if font_face_css:
             st.markdown(f"<style>{font_face_css}</style>", unsafe_allow_html=True)
         else:
             preview_font_family = selected_font_name
 
-        preview_text = "巫覡と付喪神"
         preview_html = preview_text.replace("付喪", f"<span style='color:{learned_color_hex};'>付喪</span>")
         preview_bg_rgba = hex_to_rgba_css(bg_color_hex, bg_alpha)
         preview_font_size = st.session_state.get('font_css_sizes', {}).get(
@@ -1,12 +1,46 @@
 import streamlit as st
-from PIL import Image, ImageDraw, ImageFont
 import os
 import re
-import io
-import base64
-import hashlib
-from functools import lru_cache
-from pathlib import Path
+import sys
+import time
+
+from parameter_render import (
+    FONT_PATH,
+    FONT_SIZE_OVERRIDES,
+    LOCAL_FONTS,
+    DiskRenderStore,
+    GROUP_KEYS,
+    PREVIEW_PORTRAIT_BOX,
+    RENDER_FLIGHTS,
+    RENDER_TIMINGS,
+    RenderCache,
+    RenderSpec,
+    SHEET_PORTRAIT_BOX,
+    SKILL_KEYS,
+    STAGE_LABELS,
+    STAGES,
+    UPLOAD_BYTES,
+    build_font_face_css,
+    compact_portrait,
+    fit_portrait,
+    load_or_render,
+    font_pool_stats,
+    encode_image,
+    encoder_for_spec,
+    get_encoder,
+    is_encoder_available,
+    portrait_digest,
+    register_cache,
+    register_gauge,
+    scale_portrait_box,
+    start_exporter_from_env,
+    warm_up_fonts,
+)
+from parameter_render.static_assets import (
+    publish_font_face_css,
+)
+from streamlit.errors import StreamlitAPIException
+from streamlit.runtime.scriptrunner import get_script_run_ctx
 
 st.set_page_config(layout="wide")
 
@@ -15,14 +49,7 @@ MAX_WIDTH_PX = 1200
 standard_fonts = ["Noto Sans JP"]
 all_fonts = standard_fonts
 
-st.markdown(
-    f"""
-    <style>
-    @font-face {{
-        font-family: 'Noto Sans JP';
-        src: url('assets/fonts/NotoSansJP-Regular.ttf');
-    }}
-
+GLOBAL_CSS = f"""
     /* 全体を囲むラッパーの最大幅を固定し、中央寄せする */
     .main-tool-wrapper {{
         max-width: {MAX_WIDTH_PX}px;
@@ -86,121 +113,22 @@ st.markdown(
         padding: 0 10px !important;
         width: 100%;
     }}
-    </style>
-    """,
-    unsafe_allow_html=True
-)
-
-ASSETS_FONTS_DIR = os.path.join(
-    os.path.dirname(os.path.abspath(__file__)),
-    "assets",
-    "fonts"
-)
-APP_FONT_PATH = os.path.join(ASSETS_FONTS_DIR, "NotoSansJP-Regular.ttf")
-FONT_PATH = APP_FONT_PATH if os.path.exists(APP_FONT_PATH) else None
-FONT_SIZE_OVERRIDES = {
-    "DelaGothicOne-Regular": 20,
-    "DotGothic16-Regular": 23,
-    "HachiMaruPop-Regular": 22,
-    "KaiseiTokumin-Regular": 24,
-    "KosugiMaru-Regular": 23,
-    "MPLUSRounded1c-Regular": 23,
-    "NotoSansJP-Regular": 26,
-    "NotoSerifJP-Regular": 26,
-    "ReggaeOne-Regular": 21,
-    "WDXLLubrifontJPN-Regular": 30,
-    "YujiMai-Regular": 22,
-    "ZenKurenaido-Regular": 26,
-    "ZenMaruGothic-Regular": 26,
-}
-SAMPLE_TEXT_FOR_MEASURE = "あいうえおアイウエオ漢字"
-TARGET_FONT_SIZES = [40, 35, 28, 20]
-
-def list_local_fonts(fonts_dir):
-    fonts = {}
-    fonts_path = Path(fonts_dir)
-
-    if not fonts_path.is_dir():
-        return fonts
-    
-    for font_file in fonts_path.iterdir():
-        if font_file.suffix.lower() in {".ttf", ".otf", ".ttc"}:
-            display_name = font_file.stem
-            fonts[display_name] = str(font_file)
-
-    return dict(sorted(fonts.items(), key=lambda item: item[0].lower()))
+    """
 
-LOCAL_FONTS = list_local_fonts(ASSETS_FONTS_DIR)
+def use_static_assets():
+    """
+    静的ファイル配信でプレビュー用フォントを渡すかどうか
+    環境変数 PARAMETER_STATIC_ASSETS（1/0）が優先され、未指定なら server.enableStaticServing に従う
+    """
+    env_value = os.environ.get("PARAMETER_STATIC_ASSETS")
+    if env_value is not None:
+        return env_value == "1"
+    return bool(st.get_option("server.enableStaticServing"))
 
-def load_font(font_path, size):
-    if font_path and os.path.exists(font_path):
-        try:
-            return ImageFont.truetype(font_path, size)
-        except OSError:
-            pass
-    if FONT_PATH:
-        try:
-            return ImageFont.truetype(FONT_PATH, size)
-        except OSError:
-            pass
-    return ImageFont.load_default()
+STATIC_ASSETS_ENABLED = use_static_assets()
 
-def load_specific_font(font_path, size):
-    if not font_path or not os.path.exists(font_path):
-        return None
-    try:
-        return ImageFont.truetype(font_path, size)
-    except OSError:
-        return None
-
-@lru_cache(maxsize=256)
-def get_font_height(font_path, size):
-    font = load_specific_font(font_path, size)
-    if font is None and FONT_PATH and font_path != FONT_PATH:
-        font = load_specific_font(FONT_PATH, size)
-    if font is None:
-        font = ImageFont.load_default()
-    dummy_img = Image.new("RGB", (1, 1))
-    draw = ImageDraw.Draw(dummy_img)
-    bbox = draw.textbbox((0, 0), SAMPLE_TEXT_FOR_MEASURE, font=font)
-    height = bbox[3] - bbox[1]
-    return max(1, height)
-
-REFERENCE_HEIGHTS = {size: get_font_height(FONT_PATH, size) for size in TARGET_FONT_SIZES}
-
-def compute_normalized_size(font_path, base_size, target_height):
-    current_height = get_font_height(font_path, base_size)
-    if not current_height:
-        return base_size
-    scale = target_height / current_height
-    return max(1, int(round(base_size * scale)))
-
-def load_normalized_font(font_path, base_size, target_height, font_scale=1.0):
-    normalized_size = compute_normalized_size(font_path, base_size, target_height)
-    normalized_size = max(1, int(round(normalized_size * font_scale)))
-    return load_font(font_path, normalized_size)
-
-def build_font_face_css(font_path, font_family):
-    if not font_path or not os.path.exists(font_path):
-        return ""
-    ext = os.path.splitext(font_path)[1].lower()
-    if ext not in {".ttf", ".otf"}:
-        return ""
-    try:
-        with open(font_path, "rb") as font_file:
-            font_data = base64.b64encode(font_file.read()).decode("utf-8")
-        mime = "font/ttf" if ext == ".ttf" else "font/otf"
-        format_name = "truetype" if ext == ".ttf" else "opentype"
-        return f"""
-        @font-face {{
-            font-family: '{font_family}';
-            src: url(data:{mime};base64,{font_data}) format('{format_name}');
-            font-weight: normal;
-            font-style: normal;
-        }}
-        """
-    except OSError:
-        return ""
+# 全体のスタイルは小さいためインラインで送る（静的配信の .css は Streamlit の版によって text/plain で返され、読み込まれない）
+st.markdown(f"<style>{GLOBAL_CSS}</style>", unsafe_allow_html=True)
 
 def hex_to_rgba_css(hex_color, alpha_percent):
     hex_color = hex_color.lstrip('#')
@@ -222,226 +150,304 @@ def validate_input(input_string):
     else:
         return False
 
-def hash_uploaded_file(uploaded_file):
+def release_upload(uploaded_file):
+    """
+    Streamlit が保持しているアップロードのバイト列を解放し、アップロード欄を空に戻す
+    remove_file は Streamlit の内部 API（メモリ上の保存先だけが実装）のため、使えない版では解放を Streamlit に任せる
+    """
+    ctx = get_script_run_ctx()
+    remove_file = getattr(getattr(ctx, "uploaded_file_mgr", None), "remove_file", None)
+    if remove_file is not None:
+        try:
+            remove_file(session_id=ctx.session_id, file_id=uploaded_file.file_id)
+        except (AttributeError, KeyError, TypeError):
+            pass
+    st.session_state['upload_generation'] += 1
+
+def rerun_editor():
+    """
+    入力欄の領域だけを再実行する（ページ全体の実行中なら全体を再実行する）
+    """
+    try:
+        st.rerun(scope="fragment")
+    except StreamlitAPIException:
+        st.rerun()
+
+def estimate_size(value, seen=None):
+    """
+    オブジェクトが保持しているメモリの概算（コンテナは中身も数える。共有されているものは1回だけ）
+    """
+    seen = set() if seen is None else seen
+    if id(value) in seen:
+        return 0
+    seen.add(id(value))
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(estimate_size(key, seen) + estimate_size(item, seen) for key, item in value.items())
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        size += sum(estimate_size(item, seen) for item in value)
+    elif isinstance(value, memoryview):
+        size += value.nbytes
+    elif hasattr(value, "getbuffer"):
+        # UploadedFile などのバッファを持つオブジェクト
+        size += value.getbuffer().nbytes
+    return size
+
+def session_memory_report():
+    """
+    このセッションが保持しているデータの概算
+    戻り値は ([(キー, バイト数)]（大きい順）, Streamlit が保持しているアップロードのバイト数)
+    """
+    sizes = sorted(
+        ((str(key), estimate_size(value)) for key, value in st.session_state.items()),
+        key=lambda item: item[1], reverse=True
+    )
+    upload_bytes = 0
+    ctx = get_script_run_ctx()
+    # file_storage は Streamlit の内部 API（メモリ上の保存先だけが持つ）。使えない版では 0 とする
+    file_storage = getattr(getattr(ctx, "uploaded_file_mgr", None), "file_storage", None)
+    if file_storage is not None:
+        try:
+            files = file_storage.get(ctx.session_id, {})
+            upload_bytes = sum(len(file.data) for file in list(files.values()))
+        except (AttributeError, TypeError):
+            upload_bytes = 0
+    return sizes, upload_bytes
+
+@st.cache_resource(show_spinner=False)
+def warm_up_font_pool():
+    """
+    プロセス起動時に一度だけ全フォントをフォントプールへ読み込む
+    環境変数 PARAMETER_FONT_WARMUP=1 のときのみ有効
+    """
+    return warm_up_fonts()
+
+if os.environ.get("PARAMETER_FONT_WARMUP") == "1":
+    warm_up_font_pool()
+
+@st.cache_resource(show_spinner=False)
+def get_render_cache():
+    """
+    全セッションで共有する生成画像のキャッシュ（上限バイト数・TTL付き）
+    """
+    render_cache = RenderCache.from_env()
+    register_cache("memory", render_cache.stats)
+    return render_cache
+
+@st.cache_resource(show_spinner=False)
+def get_portrait_store():
+    """
+    全セッションで共有する立ち絵の保存先（内容ハッシュ → 縮小済みのバイト列）
+    セッションには内容ハッシュだけを持たせ、同じ立ち絵を使うセッション同士は同じバイト列を共有する
+    上限は PARAMETER_PORTRAIT_STORE_MB（既定 64）で、使われていないものから削除する
+    """
+    max_mb = float(os.environ.get("PARAMETER_PORTRAIT_STORE_MB", "64"))
+    portrait_store = RenderCache(max_bytes=int(max_mb * 1024 * 1024))
+    register_cache("portrait_source", portrait_store.stats)
+    return portrait_store
+
+@st.cache_resource(show_spinner=False)
+def get_render_store():
     """
-    アップロードされたファイルのハッシュ値を計算する関数
-    キャッシュのキーとして使用
+    再起動後や別プロセスとも共有するディスク上の画像保存先（PARAMETER_RENDER_STORE_DIR 未設定なら None）
     """
-    if uploaded_file is None:
+    render_store = DiskRenderStore.from_env()
+    if render_store is not None:
+        register_cache("disk", render_store.stats)
+    return render_store
+
+def render_store_for(spec):
+    """
+    その仕様の画像を保存してよいディスクの保存先（立ち絵を含む画像はディスクに書かず、メモリ上だけで扱う）
+    """
+    if spec.portrait_digest:
         return None
-    uploaded_file.seek(0)
-    file_hash = hashlib.md5(uploaded_file.read()).hexdigest()
-    uploaded_file.seek(0)  # ハッシュ計算後にシークを戻す
-    return file_hash
-
-def create_image(values, checks, filename, charactor_type, uploaded_file, font_path=None, font_scale=1.0, swap_layout=False, bg_color_hex="#FFFFFF", bg_alpha=100, text_color_hex="#000000", learned_color_hex="#FFA500"):
-    """
-    入力された値とチェック状態から画像を生成する関数
-    左側：アップロード画像、分類、キャラ名
-    右側：能力値情報
-    """
-    # グループ定義
-    groups = {
-        'u': {
-            'name': '身体',
-            'skills': [('a', '★白兵'), ('b', '運動'), ('c', '頑健'), ('d', '操縦'), ('e', '知覚')]
-        },
-        'v': {
-            'name': '技量',
-            'skills': [('f', '★射撃'), ('g', '医療'), ('h', '隠密'), ('i', '工作'), ('j', '捜査')]
-        },
-        'w': {
-            'name': '心魂',
-            'skills': [('k', '★呪法'), ('l', '意志'), ('m', '看破'), ('n', '芸能'), ('o', '伝承')]
-        },
-        'x': {
-            'name': '社会',
-            'skills': [('p', '★策謀'), ('q', '教養'), ('r', '交渉'), ('s', '電脳'), ('t', '容姿')]
-        }
-    }
-    
-    # 生成する画像の寸法設定
-    image_area_width = 320    # 画像 + キャラ情報の幅
-    stats_area_width = 690    # 能力値情報の幅
-    total_width = image_area_width + stats_area_width
-    
-    # 各セクションの高さ
-    default_img_height = 440    # 画像がない場合の高さ
-    char_info_height = 90       # 分類とキャラ名の高さ
-    content_height = 500        # 能力値情報の高さ
-    
-    # アップロード画像の処理
-    if uploaded_file:
-        uploaded_file.seek(0)
-        uploaded_img = Image.open(uploaded_file)
-        # アスペクト比を保持して、幅300px基準でリサイズ（高さ上限415px）
-        aspect_ratio = uploaded_img.width / uploaded_img.height
-        target_width = image_area_width
-        target_height = int(target_width / aspect_ratio)
-        max_height = 390
-        if target_height > max_height:
-            target_height = max_height
-            target_width = int(target_height * aspect_ratio)
-        uploaded_img = uploaded_img.resize((target_width, target_height), Image.Resampling.LANCZOS)
-        img_target_height = target_height
-    else:
-        uploaded_img = None
-        img_target_height = default_img_height
-    
-    # 左側全体の高さ
-    left_total_height = img_target_height + char_info_height
-
-    # 全体の高さ = 左右で大きい方
-    total_img_height = max(left_total_height, content_height)
-
-    def hex_to_rgba(hex_color, alpha_percent):
-        hex_color = hex_color.lstrip('#')
-        r = int(hex_color[0:2], 16)
-        g = int(hex_color[2:4], 16)
-        b = int(hex_color[4:6], 16)
-        a = max(0, min(255, int(alpha_percent * 255 / 100)))
-        return (r, g, b, a)
-
-    def hex_to_rgb(hex_color):
-        hex_color = hex_color.lstrip('#')
-        r = int(hex_color[0:2], 16)
-        g = int(hex_color[2:4], 16)
-        b = int(hex_color[4:6], 16)
-        return (r, g, b)
-
-    bg_rgba = hex_to_rgba(bg_color_hex, bg_alpha)
-    text_rgb = hex_to_rgb(text_color_hex)
-    learned_rgb = hex_to_rgb(learned_color_hex)
-
-    # 全体の画像を作成
-    img = Image.new('RGBA', (total_width, total_img_height), bg_rgba)
-    draw = ImageDraw.Draw(img)
-
-    # フォント設定
-    font_large = load_normalized_font(font_path, 40, REFERENCE_HEIGHTS[40], font_scale)
-    font_medium = load_normalized_font(font_path, 35, REFERENCE_HEIGHTS[35], font_scale)
-    font_small = load_normalized_font(font_path, 28, REFERENCE_HEIGHTS[28], font_scale)
-    font_tiny = load_normalized_font(font_path, 20, REFERENCE_HEIGHTS[20], font_scale)
-    
-    # 左右の配置を決定
-    if swap_layout:
-        stats_area_x = 0
-        image_area_x = stats_area_width
-    else:
-        image_area_x = 0
-        stats_area_x = image_area_width
-
-    # ここでは折り返し計算は行わない
-
-    # 画像エリアにアップロード画像を配置（中央揃え）
-    image_area_height = total_img_height - char_info_height
-    if uploaded_img:
-        # 透過PNGは背景色で合成して透過を防ぐ
-        uploaded_img = uploaded_img.convert("RGBA")
-        bg_layer = Image.new("RGBA", uploaded_img.size, bg_rgba)
-        uploaded_img = Image.alpha_composite(bg_layer, uploaded_img)
-
-        left_x = image_area_x + (image_area_width - uploaded_img.width) // 2
-        top_y = max(0, (image_area_height - uploaded_img.height) // 2)
-        img.paste(uploaded_img, (left_x, top_y))
-    
-    # 左側の下部にキャラクター情報を表示
-    info_y = image_area_height + 10
+    return get_render_store()
 
-    # キャラクター分類を表示
-    charactor_type_str = "巫覡" if not charactor_type else "付喪神"
-    draw.text((image_area_x + 10, info_y), f"{charactor_type_str}", font=font_small, fill=text_rgb)
+def active_session_count():
+    """
+    接続中のセッション数（Streamlit の実行環境の外や、内部 API の _session_mgr が使えない版では None）
+    """
+    try:
+        from streamlit.runtime import Runtime
 
-    # キャラ名を表示
-    char_name = filename if filename else "No Name"
-    char_name_text = f"{char_name}"
+        if not Runtime.exists():
+            return None
+        return Runtime.instance()._session_mgr.num_active_sessions()
+    except (ImportError, AttributeError):
+        return None
 
-    # テキスト幅をチェック
-    text_bbox = draw.textbbox((0, 0), char_name_text, font=font_small)
-    text_width = text_bbox[2] - text_bbox[0]
+@st.cache_resource(show_spinner=False)
+def start_metrics_exporter():
+    """
+    PARAMETER_METRICS_PORT / PARAMETER_METRICS_FILE が設定されていれば、プロセスで一度だけメトリクスの公開を始める
+    """
+    register_gauge("parameter_active_sessions", "接続中のセッション数", active_session_count)
+    get_render_cache()
+    get_portrait_store()
+    get_render_store()
+    return start_exporter_from_env()
 
-    # 利用可能な幅（左側のスペース）
-    available_width = image_area_width - 40
+start_metrics_exporter()
 
-    if text_width > available_width:
-        # フォントサイズを縮小
-        draw.text((image_area_x + 15, info_y + 40), char_name_text, font=font_tiny, fill=text_rgb)
-    else:
-        draw.text((image_area_x + 15, info_y + 40), char_name_text, font=font_small, fill=text_rgb)
-    
-    # 右側に能力値情報を描画
-    y_pos = 20
-    line_height = 60
-    right_start_x = stats_area_x + 20
-    
-    for group_key in ['u', 'v', 'w', 'x']:
-        group_data = groups[group_key]
-        # グループタイトル: 【身体】：数値
-        group_value = values.get(group_key, '')
-        group_title = f"【{group_data['name']}】：{group_value}"
-        draw.text((right_start_x, y_pos), group_title, font=font_large, fill=text_rgb)
-        y_pos += line_height
-        
-        # スキル一覧を1行で表示（各スキルの数値を含む）
-        x_offset = right_start_x
-        for skill_key, skill_name in group_data['skills']:
-            is_checked = checks.get(skill_key, False)
-            text_color = learned_rgb if is_checked else text_rgb  # 習得済色または指定色
-            
-            # 各スキルの数値を計算（グループ値+チェック時+1）
-            base_value = int(group_value) if group_value else 0
-            skill_value = base_value + 1 if is_checked else base_value
-            skill_text = f"{skill_name}:{skill_value}"
-            
-            draw.text((x_offset, y_pos), skill_text, font=font_medium, fill=text_color)
-            # 次のスキル位置を計算
-            text_bbox = draw.textbbox((0, 0), skill_text, font=font_medium)
-            text_width = text_bbox[2] - text_bbox[0]
-            x_offset += text_width + 20
-        
-        y_pos += line_height
-    
-    # ファイル名がない場合はデフォルト
-    if not filename:
-        filename = "output"
-    
-    # メモリ上に画像を保存（BytesIO）
-    img_bytes = io.BytesIO()
-    img.save(img_bytes, format='PNG')
-    img_bytes.seek(0)
-    
-    return img_bytes, filename
-
-@st.cache_data(show_spinner="🎨 画像を生成中...")
-def create_image_cached(
-    _values_tuple,
-    _checks_tuple,
-    filename,
-    charactor_type,
-    _uploaded_file_hash,
-    font_path,
-    font_scale,
-    swap_layout,
-    bg_color_hex,
-    bg_alpha,
-    text_color_hex,
-    learned_color_hex
-):
+# ダウンロード用画像の倍率（プレビューの50%）
+DOWNLOAD_SCALE = 0.5
+
+def download_encoder_name():
+    """
+    ダウンロード用画像の形式（PARAMETER_DOWNLOAD_FORMAT, 既定 png）。"auto" は立ち絵なしならパレット PNG
+    使えない形式が指定された場合は PNG にする
+    """
+    name = os.environ.get("PARAMETER_DOWNLOAD_FORMAT", "png").strip().lower()
+    if name == "auto" or is_encoder_available(name):
+        return name
+    return "png"
+
+DOWNLOAD_ENCODER = download_encoder_name()
+
+# プレビューの倍率（表示する列の幅に合わせる。等倍 1010px のままだと縮小表示される）
+PREVIEW_SCALE = float(os.environ.get("PARAMETER_PREVIEW_SCALE", "0.75"))
+
+# 保持する立ち絵の大きさを決める枠（このアプリで描画する立ち絵の最大の枠と、表示用の枠）
+PORTRAIT_SOURCE_BOXES = (
+    scale_portrait_box(SHEET_PORTRAIT_BOX, max(PREVIEW_SCALE, DOWNLOAD_SCALE)),
+    PREVIEW_PORTRAIT_BOX,
+)
+
+def store_upload(uploaded_file):
+    """
+    アップロードを一度だけ前処理し、縮小したバイト列を全セッション共有の保存先に入れる
+    戻り値はセッションに残す参照 (内容ハッシュ, ファイル名, 元のバイト数)
+    内容ハッシュは縮小後のバイト列から計算する（描画に使うバイト列とキャッシュのキーを一致させるため）
+    """
+    UPLOAD_BYTES.observe(uploaded_file.size)
+    portrait = compact_portrait(uploaded_file.getbuffer(), PORTRAIT_SOURCE_BOXES)
+    digest = portrait_digest(portrait)
+    # 読み込めない画像はここで例外にする（表示用の縮小は内容ハッシュごとに共有される）
+    fit_portrait(portrait, PREVIEW_PORTRAIT_BOX, digest)
+    get_portrait_store().put(digest, portrait)
+    return digest, uploaded_file.name, uploaded_file.size
+
+def create_image_cached(spec, scale=1.0, encoder="png"):
     """
     キャッシュ対応版の画像生成関数
-    辞書をタプルに変換して、キャッシュ可能な形式にする
+    レンダリング仕様のハッシュ（spec.digest）と倍率・形式だけをキーにする
+    戻り値は (画像のバイト列, ファイル名)。バイト列はキャッシュと共有される
     """
-    # タプルを辞書に戻す
-    values = dict(_values_tuple)
-    checks = dict(_checks_tuple)
-    
-    # 元のcreate_image()を呼び出し
-    return create_image(
-        values, checks, filename, charactor_type,
-        st.session_state.get('uploaded_file'),
-        font_path, font_scale, swap_layout,
-        bg_color_hex, bg_alpha, text_color_hex, learned_color_hex
+    img_bytes = load_or_render(
+        spec, scale, encoder, get_render_cache(), render_store_for(spec),
+        spinner=st.spinner("🎨 画像を生成中...")
     )
+    return img_bytes, spec.filename if spec.filename else "output"
+
+def download_loader(spec, encoder):
+    """
+    ダウンロード用（50%）の画像を、ボタンが押された時にだけ用意する関数を返す
+    """
+    render_cache = get_render_cache()
+    render_store = render_store_for(spec)
+    return lambda: load_or_render(spec, DOWNLOAD_SCALE, encoder, render_cache, render_store)
+
+@st.cache_data(max_entries=32, show_spinner=False)
+def portrait_preview_bytes(portrait_digest, _image):
+    """
+    「アップロードされた画像」の表示用バイト列（立ち絵の内容ハッシュごとに一度だけ書き出す）
+    st.image に PIL 画像を渡すと再実行のたびに書き出し直されるため
+    """
+    if "A" in _image.getbands() or "transparency" in _image.info:
+        return encode_image(_image, "png")
+    return encode_image(_image, "jpeg", quality=100)
+
+@st.fragment
+def render_performance_stats():
+    """
+    サイドバーの ⚡ パフォーマンス欄に各キャッシュの状態を表示する
+    入力欄の変更では更新されないため、更新ボタンで表示し直す
+    """
+    st.button("🔄 統計を更新", key="refresh_performance_stats")
+    cache_stats = get_render_cache().stats()
+    font_stats = font_pool_stats()
+    flight_stats = RENDER_FLIGHTS.stats()
+    st.caption(
+        f"画像キャッシュ: {cache_stats['entries']} 件 / "
+        f"{cache_stats['bytes'] / 1024 / 1024:.1f} MB（上限 {cache_stats['max_bytes'] / 1024 / 1024:.0f} MB）  \n"
+        f"ヒット率 {cache_stats['hit_ratio']:.0%}（ヒット {cache_stats['hits']} / ミス {cache_stats['misses']}）、"
+        f"追い出し {cache_stats['evictions'] + cache_stats['expirations']} 件  \n"
+        f"フォントプール: {font_stats['entries']}/{font_stats['maxsize']} 件"
+        f"（ヒット {font_stats['hits']} / ミス {font_stats['misses']}）  \n"
+        f"同時要求の共有: {flight_stats['coalesced']} 件（生成 {flight_stats['leaders']} 回、生成中 {flight_stats['in_flight']} 件）"
+    )
+    render_store = get_render_store()
+    if render_store is not None:
+        store_stats = render_store.stats()
+        st.caption(
+            f"ディスク保存: {store_stats['bytes'] / 1024 / 1024:.1f} MB（上限 {store_stats['max_bytes'] / 1024 / 1024:.0f} MB）、"
+            f"ヒット {store_stats['hits']} / ミス {store_stats['misses']}、削除 {store_stats['evictions']} 件"
+        )
+    render_session_memory_panel()
+    if RENDER_TIMINGS.enabled:
+        render_timing_panel()
+
+def render_session_memory_panel():
+    """
+    このセッションが保持しているデータの概算（セッションステートと、Streamlit が保持しているアップロード）
+    立ち絵の本体は全セッション共有の保存先にあるため、ここでは別に表示する
+    """
+    sizes, upload_bytes = session_memory_report()
+    session_bytes = sum(size for _, size in sizes)
+    with st.expander(f"🧠 このセッションのメモリ（{(session_bytes + upload_bytes) / 1024:.1f} KB）"):
+        portrait_ref = st.session_state.get('portrait')
+        shared_portrait = get_portrait_store().peek(portrait_ref[0]) if portrait_ref else None
+        portrait_store_stats = get_portrait_store().stats()
+        st.caption(
+            f"セッションステート: {session_bytes / 1024:.1f} KB（{len(sizes)} 件）、"
+            f"保持中のアップロード: {upload_bytes / 1024:.1f} KB  \n"
+            f"参照している立ち絵: {len(shared_portrait) / 1024 if shared_portrait else 0:.1f} KB"
+            f"（元 {portrait_ref[2] / 1024 if portrait_ref else 0:.1f} KB、全セッション共有 "
+            f"{portrait_store_stats['entries']} 件 / {portrait_store_stats['bytes'] / 1024 / 1024:.1f} MB）"
+        )
+        st.dataframe(
+            [{"キー": key, "バイト数": size} for key, size in sizes[:10]],
+            hide_index=True,
+        )
+
+def render_timing_panel():
+    """
+    描画の段階ごとの所要時間（PARAMETER_RENDER_TIMINGS=1 の時だけ表示する）
+    キャッシュから返した画像は含まれない
+    """
+    summary = RENDER_TIMINGS.summary()
+    with st.expander(f"⏱ 描画の内訳（{RENDER_TIMINGS.renders} 回）"):
+        if not summary:
+            st.caption("まだ描画していません")
+            return
+        st.caption("段階ごとの所要時間（直近の描画）")
+        st.dataframe(
+            [
+                {
+                    "段階": STAGE_LABELS[name],
+                    "p50 ms": round(row["p50_ms"], 1),
+                    "p95 ms": round(row["p95_ms"], 1),
+                    "回数": row["count"],
+                }
+                for name, row in summary.items()
+            ],
+            hide_index=True,
+        )
+        st.caption("描画ごとの内訳（ms, 新しい順）")
+        st.dataframe(
+            [
+                {
+                    "時刻": time.strftime("%H:%M:%S", time.localtime(record["at"])),
+                    "倍率": record["scale"],
+                    "形式": record["encoder"],
+                    "合計": round(record["total_ms"], 1),
+                    **{STAGE_LABELS[name]: round(record["stages"].get(name, 0.0), 1) for name in STAGES},
+                }
+                for record in RENDER_TIMINGS.recent()
+            ],
+            hide_index=True,
+        )
 
 # Streamlitアプリ
 st.title("ツクモツムギ-能力値画像出力-WebAppβテスト版 [⚡キャッシュ版]")
@@ -462,7 +468,7 @@ with st.sidebar:
     7. ダウンロードボタンで保存
     
     ### 🔒 プライバシー
-    - アップロードされた画像はサーバーに保存されません
+    - アップロードされた画像はサーバーに保存されません（立ち絵を含む画像もディスクには書き出しません）
     - すべての処理はメモリ上で完了します
     - 個人情報は一切収集しません
     - このアプリはオープンソースであり、コードはGitHubで公開されています
@@ -472,15 +478,19 @@ with st.sidebar:
     
     st.markdown("### ⚡ パフォーマンス")
     if st.button("🗑️ キャッシュをクリア", help="画像生成のキャッシュをクリアします"):
+        get_render_cache().clear()
         st.cache_data.clear()
         st.success("キャッシュをクリアしました！")
         st.rerun()
-    
+
+    # 統計は画像生成の後（スクリプトの最後）に書き込む
+    performance_stats = st.container()
+
     st.markdown("""
     ### ℹ️ キャッシュについて
     - 同じ設定で画像を生成する場合、キャッシュから高速表示されます
     - 設定を変更すると新しく生成されます
-    - メモリ使用量が増える場合は、キャッシュをクリアしてください
+    - キャッシュが上限に達すると、古いものから自動で削除されます
     """)
     
     st.markdown("---")
@@ -501,8 +511,7 @@ with st.sidebar:
     # """)
 
 # セッションステートの初期化
-st.session_state.setdefault('values', {key: '' for key in 'abcdefghijklmnopqrstuvwx'})
-st.session_state.setdefault('checks', {key: False for key in 'abcdefghijklmnopqrst'})
+st.session_state.setdefault('upload_generation', 0)
 st.session_state.setdefault('filename', '')
 st.session_state.setdefault('charactor_type', "巫覡")  # 初期値: 巫覡
 st.session_state.setdefault('font_css_sizes', {})
@@ -539,10 +548,10 @@ def render_group_header(title, value_key):
     with col_value:
         st.text_input(title, key=value_key, label_visibility="collapsed")
 
-# メインコンテンツ
-col_stats, col_img = st.columns([1.2, 0.9])
-
-with col_stats:
+def render_stat_inputs():
+    """
+    能力値と取得技能の入力欄
+    """
     col1, col2, col3, col4 = st.columns([0.4, 0.4, 0.4, 0.4])
 
     with col1:
@@ -577,7 +586,11 @@ with col_stats:
         render_skill_row("電脳", "check_s", "s")
         render_skill_row("容姿", "check_t", "t")
 
-    
+def render_style_controls():
+    """
+    分類・キャラ名・色・フォントの入力欄
+    戻り値は色の設定 (背景色, 文字色, 習得済色, 背景透過率)
+    """
     col_char_type, col_char_name = st.columns([0.3, 0.7], gap="small")
     with col_char_type:
         st.radio("キャラクター分類", ["巫覡", "付喪神"], key="charactor_type", horizontal=True)
@@ -604,13 +617,18 @@ with col_stats:
         selected_font_name = st.session_state.get('font_name', font_options[0])
         selected_font_path = st.session_state.get('font_path') or LOCAL_FONTS.get(selected_font_name)
         preview_font_family = f"preview-{selected_font_name}"
-        font_face_css = build_font_face_css(selected_font_path, preview_font_family)
+        preview_text = "巫覡と付喪神"
+        if STATIC_ASSETS_ENABLED:
+            # フォントは静的ファイルとして配信し、ここでは参照する @font-face だけを送る
+            font_face_css = publish_font_face_css(selected_font_path, preview_font_family, preview_text)
+        else:
+            # プレビュー文字列のグリフだけを含むサブセットを埋め込む（プロセス内でキャッシュ）
+            font_face_css = build_font_face_css(selected_font_path, preview_font_family, preview_text)
         if font_face_css:
             st.markdown(f"<style>{font_face_css}</style>", unsafe_allow_html=True)
         else:
             preview_font_family = selected_font_name
 
-        preview_text = "巫覡と付喪神"
         preview_html = preview_text.replace("付喪", f"<span style='color:{learned_color_hex};'>付喪</span>")
         preview_bg_rgba = hex_to_rgba_css(bg_color_hex, bg_alpha)
         preview_font_size = st.session_state.get('font_css_sizes', {}).get(
@@ -628,112 +646,155 @@ with col_stats:
             unsafe_allow_html=True
         )
 
-with col_img:
-    # 画像アップロード
-    uploaded_file = st.file_uploader("使用するキャラ立ち絵※一時表示用のためネットワーク上には保存されません。\nまた、300x500以内の10MB以下の画像に限ります。", type=["png", "jpg", "jpeg"], help="PNG, JPG, JPEG形式の画像を選択してください (推奨: 5MB以下)")
-    
-    # ファイルサイズチェック
+    return bg_color_hex, text_color_hex, learned_color_hex, bg_alpha
+
+def render_upload():
+    """
+    立ち絵のアップロード欄
+    戻り値は (立ち絵のバイト列, 内容ハッシュ)。未アップロードなら (None, None)
+    アップロードは最初の実行で縮小して共有の保存先に移し、セッションには参照だけを残す
+    """
+    # 画像アップロード（受け取ったらアップロード欄を空に戻すため、キーを世代ごとに変える）
+    uploaded_file = st.file_uploader(
+        "使用するキャラ立ち絵※一時表示用のためネットワーク上には保存されません。\nまた、300x500以内の10MB以下の画像に限ります。",
+        type=["png", "jpg", "jpeg"], help="PNG, JPG, JPEG形式の画像を選択してください (推奨: 5MB以下)",
+        key=f"portrait_upload_{st.session_state['upload_generation']}"
+    )
+
     if uploaded_file is not None:
+        # ファイルサイズチェック
         file_size_mb = uploaded_file.size / (1024 * 1024)
         if file_size_mb > 10:
-            st.error(f"⚠️ ファイルサイズが大きすぎます（{file_size_mb:.1f}MB）。10MB以下の画像をアップロードしてください。")
-            uploaded_file = None
-            st.session_state['uploaded_file'] = None
+            st.session_state['upload_error'] = f"⚠️ ファイルサイズが大きすぎます（{file_size_mb:.1f}MB）。10MB以下の画像をアップロードしてください。"
         else:
-            st.session_state['uploaded_file'] = uploaded_file
-    else:
-        st.session_state['uploaded_file'] = uploaded_file
-    
-    if uploaded_file is not None:
-        try:
-            uploaded_file.seek(0)
-            image = Image.open(uploaded_file)
-            # 幅300px基準でアスペクト比を保持（高さ上限415px）
-            target_width = 300
-            aspect_ratio = image.width / image.height
-            new_height = int(target_width / aspect_ratio)
-            max_height = 415
-            if new_height > max_height:
-                new_height = max_height
-                target_width = int(new_height * aspect_ratio)
-            image = image.resize((target_width, new_height))
-            st.image(image, caption="アップロードされた画像")
-        except Exception as e:
-            st.error(f"❌ 画像の読み込みに失敗しました: {str(e)}")
-            st.session_state['uploaded_file'] = None
-
-
+            try:
+                st.session_state['portrait'] = store_upload(uploaded_file)
+            except Exception as e:
+                st.session_state['upload_error'] = f"❌ 画像の読み込みに失敗しました: {str(e)}"
+        release_upload(uploaded_file)
+        rerun_editor()
+
+    upload_error = st.session_state.pop('upload_error', None)
+    if upload_error:
+        st.error(upload_error)
+
+    portrait_ref = st.session_state.get('portrait')
+    if portrait_ref is None:
+        return None, None
+    portrait_hash, portrait_name, _ = portrait_ref
+    portrait = get_portrait_store().get(portrait_hash)
+    if portrait is None:
+        st.warning("⚠️ 立ち絵の保持期限が切れました。もう一度アップロードしてください。")
+        del st.session_state['portrait']
+        return None, None
+
+    # 幅300px基準でアスペクト比を保持（高さ上限415px）。縮小結果は内容ハッシュごとに共有される
+    image = fit_portrait(portrait, PREVIEW_PORTRAIT_BOX, portrait_hash)
+    st.image(portrait_preview_bytes(portrait_hash, image), caption=f"アップロードされた画像（{portrait_name}）")
+    if st.button("🗑 立ち絵を外す", key="remove_portrait"):
+        del st.session_state['portrait']
+        rerun_editor()
+
+    return portrait, portrait_hash
+
+def render_preview(portrait, portrait_hash, bg_color_hex, text_color_hex, learned_color_hex, bg_alpha):
+    """
+    プレビュー画像の表示
+    戻り値は (レンダリング仕様, プレビュー画像のバイト列)。生成に失敗した場合はバイト列が None
+    （仕様を作れなかった場合は仕様も None）
+    """
     # プレビュー（キャッシュ版で画像を生成）
-    preview_values = {group_key: st.session_state.get(group_key, '') for group_key in 'uvwx'}
-    preview_checks = {key: st.session_state.get(f'check_{key}', False) for key in 'abcdefghijklmnopqrst'}
     preview_charactor_type = st.session_state.get('charactor_type') == "付喪神"
     preview_font_name = st.session_state.get('font_name', font_options[0])
     preview_font_scale = st.session_state.get('font_css_sizes', {}).get(
         preview_font_name,
         FONT_SIZE_OVERRIDES.get(preview_font_name, 28)
     ) / 28
-    
-    # アップロードファイルのハッシュを計算
-    uploaded_file_hash = hash_uploaded_file(st.session_state.get('uploaded_file'))
-    
+
+    preview_spec = None
     try:
-        # キャッシュ対応関数を呼び出し
+        # 能力値と取得技能は入力欄の値から直接タプルにする（再実行ごとに辞書を作らない）
+        # 立ち絵は共有の保存先のバイト列をそのまま渡す
+        preview_spec = RenderSpec(
+            values=tuple(str(st.session_state.get(key, '') or '') for key in GROUP_KEYS),
+            checks=tuple(bool(st.session_state.get(f'check_{key}', False)) for key in SKILL_KEYS),
+            filename=st.session_state.get('filename', '') or '',
+            charactor_type=preview_charactor_type,
+            portrait=portrait,
+            portrait_digest=portrait_hash,  # 保持している立ち絵の内容ハッシュ
+            font_path=st.session_state.get('font_path'),
+            font_scale=preview_font_scale,
+            swap_layout=st.session_state.get('swap_layout', False),
+            bg_color_hex=bg_color_hex,
+            bg_alpha=bg_alpha,
+            text_color_hex=text_color_hex,
+            learned_color_hex=learned_color_hex
+        )
+        # プレビューは表示サイズで描画し、速い形式で書き出す（等倍の PNG はダウンロード時だけ）
+        # 同じ内容なら同じバイト列になるため、Streamlit のメディア URL（内容ハッシュ）も変わらない
         preview_img_bytes, _ = create_image_cached(
-            tuple(preview_values.items()),  # 辞書 → タプル
-            tuple(preview_checks.items()),  # 辞書 → タプル
-            st.session_state.get('filename', ''),
-            preview_charactor_type,
-            uploaded_file_hash,  # ファイルのハッシュ値
-            st.session_state.get('font_path'),
-            preview_font_scale,
-            st.session_state.get('swap_layout', False),
-            bg_color_hex,
-            bg_alpha,
-            text_color_hex,
-            learned_color_hex
+            preview_spec, PREVIEW_SCALE, encoder_for_spec("preview", preview_spec)
         )
-        preview_img_bytes.seek(0)
         st.image(preview_img_bytes, caption="プレビュー ⚡")
     except Exception as e:
         st.error(f"❌ プレビュー生成に失敗しました: {str(e)}")
-        preview_img_bytes = None
+        return preview_spec, None
+
+    return preview_spec, preview_img_bytes
 
-st.checkbox("画像と能力値を左右入れ替え画像生成(デフォルト：画像|能力値)", key="swap_layout")
+def render_download(preview_spec, preview_img_bytes):
+    """
+    ダウンロードボタン
+    """
+    # ダウンロードボタンを常に表示（50%縮小版）
+    if preview_img_bytes:
+        download_filename = st.session_state.get('filename', '').strip()
+        if not download_filename:
+            download_filename = "chara"
+
+        try:
+            # 50%縮小した画像は、ボタンが押された時に初めて生成する（生成済みならキャッシュから返す）
+            download_encoder = get_encoder(encoder_for_spec(DOWNLOAD_ENCODER, preview_spec))
+            st.download_button(
+                label="📥 画像をダウンロード",
+                data=download_loader(preview_spec, download_encoder.name),
+                file_name=f"{download_filename}{download_encoder.ext}",
+                mime=download_encoder.mime
+            )
+        except Exception as e:
+            st.error(f"❌ ダウンロード用画像の生成に失敗しました: {str(e)}")
+    else:
+        st.info("プレビュー画像を生成してからダウンロードできます。")
 
+@st.fragment
+def render_editor():
+    """
+    入力欄・プレビュー・ダウンロードの領域
+    どの入力もプレビューに影響するため、まとめて1つのフラグメントにする
+    入力を変更した時はこの領域だけが再実行され、ページ全体の CSS やサイドバーは作り直さない
+    """
+    col_stats, col_img = st.columns([1.2, 0.9])
 
-# ダウンロードボタンを常に表示（50%縮小版）
-if preview_img_bytes:
-    preview_img_bytes.seek(0)
-    download_filename = st.session_state.get('filename', '').strip()
-    if not download_filename:
-        download_filename = "chara"
+    with col_stats:
+        render_stat_inputs()
+        bg_color_hex, text_color_hex, learned_color_hex, bg_alpha = render_style_controls()
 
-    try:
-        # ダウンロード用に50%縮小した画像を作成
-        preview_img_bytes.seek(0)
-        preview_image = Image.open(preview_img_bytes)
-        original_width, original_height = preview_image.size
-        new_width = int(original_width * 0.5)
-        new_height = int(original_height * 0.5)
-        resized_image = preview_image.resize((new_width, new_height), Image.Resampling.LANCZOS)
-
-        # BytesIOに保存
-        download_img_bytes = io.BytesIO()
-        resized_image.save(download_img_bytes, format='PNG')
-        download_img_bytes.seek(0)
-
-        st.download_button(
-            label="📥 画像をダウンロード",
-            data=download_img_bytes,
-            file_name=f"{download_filename}.png",
-            mime="image/png"
+    with col_img:
+        portrait, portrait_hash = render_upload()
+        preview_spec, preview_img_bytes = render_preview(
+            portrait, portrait_hash,
+            bg_color_hex, text_color_hex, learned_color_hex, bg_alpha
         )
-    except Exception as e:
-        st.error(f"❌ ダウンロード用画像の生成に失敗しました: {str(e)}")
-else:
-    st.info("プレビュー画像を生成してからダウンロードできます。")
 
+    st.checkbox("画像と能力値を左右入れ替え画像生成(デフォルト：画像|能力値)", key="swap_layout")
+
+    render_download(preview_spec, preview_img_bytes)
+
+# メインコンテンツ
+render_editor()
 
+with performance_stats:
+    render_performance_stats()
 
 # フッター
 st.markdown("---")
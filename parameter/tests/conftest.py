@@ -0,0 +1,5 @@
+import os
+import sys
+
+# テストは parameter/ から parameter_render を読み込む
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
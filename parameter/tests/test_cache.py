@@ -0,0 +1,202 @@
+import threading
+import time
+
+import pytest
+
+from parameter_render.cache import RENDER_FLIGHTS, RenderCache, SingleFlight, load_or_render
+from parameter_render.spec import RenderSpec
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+def test_get_and_put():
+    cache = RenderCache(max_bytes=100)
+    assert cache.get("a") is None
+    assert cache.put("a", b"x" * 10)
+    assert cache.get("a") == b"x" * 10
+    stats = cache.stats()
+    assert (stats["entries"], stats["bytes"], stats["hits"], stats["misses"]) == (1, 10, 1, 1)
+    assert stats["hit_ratio"] == 0.5
+
+def test_evicts_least_recently_used_over_byte_budget():
+    cache = RenderCache(max_bytes=100)
+    cache.put("a", b"a" * 40)
+    cache.put("b", b"b" * 40)
+    cache.get("a")
+    cache.put("c", b"c" * 40)
+    assert cache.peek("b") is None
+    assert cache.peek("a") is not None and cache.peek("c") is not None
+    assert cache.stats()["bytes"] == 80
+    assert cache.stats()["evictions"] == 1
+
+def test_does_not_cache_values_over_budget():
+    cache = RenderCache(max_bytes=100)
+    cache.put("a", b"a" * 40)
+    assert not cache.put("big", b"x" * 101)
+    assert cache.peek("big") is None
+    assert cache.peek("a") is not None
+    assert cache.stats()["evictions"] == 0
+
+def test_replacing_a_key_keeps_byte_total():
+    cache = RenderCache(max_bytes=100)
+    cache.put("a", b"a" * 40)
+    cache.put("b", b"b" * 40)
+    cache.put("a", b"A" * 30)
+    assert cache.get("a") == b"A" * 30
+    assert len(cache) == 2
+    assert cache.stats()["bytes"] == 70
+    assert cache.stats()["evictions"] == 0
+    # 置き換えた値が大きすぎる場合は古い値も残さない
+    assert not cache.put("a", b"x" * 101)
+    assert cache.peek("a") is None
+    assert cache.stats()["bytes"] == 40
+
+def test_ttl_expiry():
+    clock = FakeClock()
+    cache = RenderCache(max_bytes=100, ttl=10, clock=clock)
+    cache.put("a", b"a" * 10)
+    clock.now += 9.9
+    assert cache.get("a") == b"a" * 10
+    clock.now += 0.1
+    assert cache.peek("a") is None
+    assert cache.get("a") is None
+    stats = cache.stats()
+    assert (stats["entries"], stats["bytes"], stats["expirations"], stats["hits"], stats["misses"]) == (0, 0, 1, 1, 1)
+
+def test_ttl_zero_never_expires():
+    clock = FakeClock()
+    cache = RenderCache(max_bytes=100, ttl=0, clock=clock)
+    cache.put("a", b"a")
+    clock.now += 10 ** 9
+    assert cache.get("a") == b"a"
+
+def test_peek_does_not_count():
+    cache = RenderCache(max_bytes=100)
+    cache.put("a", b"a")
+    cache.peek("a")
+    cache.peek("b")
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["hit_ratio"]) == (0, 0, 0.0)
+
+def test_clear():
+    cache = RenderCache(max_bytes=100)
+    cache.put("a", b"a" * 10)
+    cache.clear()
+    assert len(cache) == 0
+    assert cache.stats()["bytes"] == 0
+
+@pytest.mark.parametrize("env, max_bytes, ttl", [
+    ({}, 64 * 1024 * 1024, None),
+    ({"PARAMETER_RENDER_CACHE_MB": "0.5", "PARAMETER_RENDER_CACHE_TTL": "30"}, 512 * 1024, 30.0),
+])
+def test_from_env(monkeypatch, env, max_bytes, ttl):
+    monkeypatch.delenv("PARAMETER_RENDER_CACHE_MB", raising=False)
+    monkeypatch.delenv("PARAMETER_RENDER_CACHE_TTL", raising=False)
+    for key, value in env.items():
+        monkeypatch.setenv(key, value)
+    cache = RenderCache.from_env()
+    assert (cache.max_bytes, cache.ttl) == (max_bytes, ttl)
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.001)
+
+def run_concurrently(count, target):
+    """
+    count 本のスレッドで target() を呼び、(結果, 例外) の一覧を返す
+    """
+    outcomes = []
+    lock = threading.Lock()
+
+    def call():
+        try:
+            outcome = (target(), None)
+        except Exception as exc:
+            outcome = (None, exc)
+        with lock:
+            outcomes.append(outcome)
+
+    threads = [threading.Thread(target=call) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    return threads, outcomes
+
+def test_single_flight_runs_once_for_concurrent_callers():
+    flights = SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def work():
+        calls.append(1)
+        release.wait(5)
+        return object()
+
+    threads, outcomes = run_concurrently(8, lambda: flights.do("key", work))
+    wait_for(lambda: flights.stats()["coalesced"] == 7)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+    assert len(calls) == 1
+    results = [result for result, _ in outcomes]
+    assert all(result[0] is results[0][0] for result in results)
+    assert sorted(shared for _, shared in results) == [False] + [True] * 7
+    assert flights.stats() == {"in_flight": 0, "leaders": 1, "coalesced": 7}
+
+def test_single_flight_shares_the_leaders_exception():
+    flights = SingleFlight()
+    release = threading.Event()
+    error = ValueError("描画に失敗")
+
+    def work():
+        release.wait(5)
+        raise error
+
+    threads, outcomes = run_concurrently(4, lambda: flights.do("key", work))
+    wait_for(lambda: flights.stats()["coalesced"] == 3)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+    assert [exc for _, exc in outcomes] == [error] * 4
+
+def test_single_flight_key_is_reusable_after_failure():
+    flights = SingleFlight()
+
+    def fail():
+        raise ValueError("描画に失敗")
+
+    with pytest.raises(ValueError):
+        flights.do("key", fail)
+    assert flights.do("key", lambda: "ok") == ("ok", False)
+    assert flights.stats()["in_flight"] == 0
+
+def test_load_or_render_coalesces_concurrent_renders(monkeypatch):
+    from parameter_render import image
+
+    release = threading.Event()
+    calls = []
+
+    def fake_render(spec, scale, encoder):
+        calls.append((spec.digest, scale, encoder))
+        release.wait(5)
+        return b"rendered"
+
+    monkeypatch.setattr(image, "render_encoded", fake_render)
+    render_cache = RenderCache()
+    spec = RenderSpec(filename="同時要求")
+    coalesced = RENDER_FLIGHTS.stats()["coalesced"]
+    threads, outcomes = run_concurrently(6, lambda: load_or_render(spec, 0.5, "png", render_cache))
+    wait_for(lambda: RENDER_FLIGHTS.stats()["coalesced"] - coalesced == 5)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+    assert calls == [(spec.digest, 0.5, "png")]
+    assert outcomes == [(b"rendered", None)] * 6
+    # 終わった後の要求はキャッシュから返る
+    assert load_or_render(spec, 0.5, "png", render_cache) == b"rendered"
+    assert len(calls) == 1
@@ -0,0 +1,24 @@
+import os
+
+import pytest
+
+from parameter_render.coverage import COVERAGE_INDEX, DISPLAY_FONTS
+from parameter_render.fonts import LOCAL_FONTS
+
+def font_name(font_path):
+    return os.path.splitext(os.path.basename(font_path))[0]
+
+@pytest.fixture
+def index():
+    if COVERAGE_INDEX.coverage(LOCAL_FONTS.get("MPLUSRounded1c-Regular")) is None:
+        pytest.skip("収録文字の索引がありません")
+    return COVERAGE_INDEX
+
+def test_fallback_prefers_regular_weight_fonts(index):
+    # 「覡」は M PLUS Rounded 1c に無く、収録文字数が最も多いのは Dela Gothic One
+    runs = index.split_runs(LOCAL_FONTS["MPLUSRounded1c-Regular"], "巫覡")
+    assert [font_name(path) for path, _ in runs] == ["MPLUSRounded1c-Regular", "ZenMaruGothic-Regular"]
+
+def test_display_fonts_are_tried_last(index):
+    names = [font_name(path) for path in index._fallbacks]
+    assert names[-len(DISPLAY_FONTS):] == [name for name in DISPLAY_FONTS if name in names]
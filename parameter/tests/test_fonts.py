@@ -0,0 +1,37 @@
+import threading
+
+from parameter_render.fonts import LOCAL_FONTS, FontPool
+
+def test_cold_load_does_not_block_other_fonts(monkeypatch):
+    pool = FontPool()
+    font_path = next(iter(LOCAL_FONTS.values()))
+    warm = pool.get(font_path, 20)
+    started = threading.Event()
+    release = threading.Event()
+    opened = []
+
+    def slow_open(path, size):
+        opened.append(size)
+        started.set()
+        release.wait(5)
+        return object()
+
+    monkeypatch.setattr(pool, "_open", slow_open)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(pool.get(font_path, 40))) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    assert started.wait(5)
+    # 別のサイズの読み込み中でも、読み込み済みのフォントはすぐに返る
+    assert pool.get(font_path, 20) is warm
+    release.set()
+    for thread in threads:
+        thread.join(5)
+    assert len(results) == 4 and all(result is results[0] for result in results)
+    assert opened == [40]
+
+def test_unreadable_font_is_remembered(tmp_path):
+    pool = FontPool()
+    assert pool.get(str(tmp_path / "missing.ttf"), 20) is None
+    assert pool.get(str(tmp_path / "missing.ttf"), 20) is None
+    assert pool.stats()["hits"] == 1
@@ -0,0 +1,105 @@
+import io
+import threading
+import time
+
+from PIL import Image
+
+from parameter_render.portrait import (
+    PREVIEW_PORTRAIT_BOX,
+    SHEET_PORTRAIT_BOX,
+    PortraitCache,
+    compact_portrait,
+    fit_size,
+)
+from parameter_render.spec import RenderSpec
+from parameter_render.image import render_encoded
+
+def png_bytes(image):
+    data = io.BytesIO()
+    image.save(data, format="PNG")
+    return data.getvalue()
+
+def test_large_16bit_png_uses_full_decode():
+    # Image.reduce は I;16 に対応していないため、縮小デコードを使わずに処理する
+    data = png_bytes(Image.new("I;16", (4000, 5000), 300))
+    cache = PortraitCache()
+    resized = cache.get(data, SHEET_PORTRAIT_BOX)
+    assert resized.size == fit_size(4000, 5000, SHEET_PORTRAIT_BOX)
+    assert resized.mode == "RGBA"
+    assert cache.get(data, PREVIEW_PORTRAIT_BOX).size == fit_size(4000, 5000, PREVIEW_PORTRAIT_BOX)
+    assert cache.stats()["reduced_decodes"] == 0
+
+def test_large_16bit_png_renders():
+    data = png_bytes(Image.new("I;16", (4000, 5000), 300))
+    img_bytes = render_encoded(RenderSpec(portrait=data), 0.5, "png")
+    assert Image.open(io.BytesIO(img_bytes)).format == "PNG"
+
+def test_large_rgb_png_uses_reduced_decode():
+    data = png_bytes(Image.new("RGB", (4000, 5000), (10, 20, 30)))
+    cache = PortraitCache()
+    assert cache.get(data, SHEET_PORTRAIT_BOX).size == fit_size(4000, 5000, SHEET_PORTRAIT_BOX)
+    assert cache.stats()["reduced_decodes"] == 1
+
+def test_compact_portrait_converts_large_cmyk_jpeg():
+    data = io.BytesIO()
+    Image.new("CMYK", (3000, 4000), (0, 80, 160, 20)).save(data, format="JPEG")
+    compact = compact_portrait(data.getvalue())
+    with Image.open(io.BytesIO(compact)) as image:
+        assert image.mode == "RGB"
+        assert image.width <= SHEET_PORTRAIT_BOX[0] * 3 and image.height <= PREVIEW_PORTRAIT_BOX[1] * 3
+    assert len(compact) < len(data.getvalue())
+    assert render_encoded(RenderSpec(portrait=compact), 0.5, "png")
+
+def test_compact_portrait_keeps_large_16bit_png():
+    compact = compact_portrait(png_bytes(Image.new("I;16", (4000, 5000), 300)))
+    with Image.open(io.BytesIO(compact)) as image:
+        assert image.mode == "I;16"
+
+def test_compact_portrait_keeps_small_upload():
+    data = png_bytes(Image.new("RGB", (300, 500), (1, 2, 3)))
+    assert compact_portrait(data) == data
+
+def test_fit_size_keeps_at_least_one_pixel():
+    assert fit_size(30000, 10, SHEET_PORTRAIT_BOX) == (320, 1)
+    assert fit_size(10, 30000, (3, 4, None, False)) == (1, 4)
+
+def test_very_wide_portrait_at_small_scale():
+    data = png_bytes(Image.new("RGB", (30000, 10), "red"))
+    cache = PortraitCache()
+    assert cache.get(data, (32, 39, "LANCZOS", True)).size == (32, 1)
+    # 小さい枠を登録した後も、同じ画像の別の枠を作れる
+    assert cache.get(data, (3, 4, "LANCZOS", True)).size == (3, 1)
+    assert cache.get(data, SHEET_PORTRAIT_BOX).size == (320, 1)
+
+def test_concurrent_requests_decode_once(monkeypatch):
+    data = png_bytes(Image.new("RGB", (600, 800), "blue"))
+    cache = PortraitCache()
+    prepare = cache._prepare
+    started = threading.Event()
+    release = threading.Event()
+
+    def slow_prepare(*args):
+        started.set()
+        release.wait(5)
+        return prepare(*args)
+
+    monkeypatch.setattr(cache, "_prepare", slow_prepare)
+    results = []
+    boxes = [SHEET_PORTRAIT_BOX, PREVIEW_PORTRAIT_BOX] * 4
+    threads = [threading.Thread(target=lambda box=box: results.append((box, cache.get(data, box)))) for box in boxes]
+    for thread in threads:
+        thread.start()
+    assert started.wait(5)
+    # 全員がデコードの完了を待つ状態になってから進める
+    deadline = time.monotonic() + 5
+    while cache._flights.stats()["coalesced"] < len(boxes) - 1:
+        assert time.monotonic() < deadline
+        time.sleep(0.001)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+    assert len(results) == len(boxes)
+    assert all(image is cache.get(data, box) for box, image in results)
+    stats = cache.stats()
+    assert stats["decodes"] == 1
+    assert stats["misses"] == len(boxes)
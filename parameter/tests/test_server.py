@@ -0,0 +1,95 @@
+import json
+
+import pytest
+
+from parameter_render.server import FONT_SCALE_RANGE, MAX_NAME_LENGTH, RequestError, parse_render_request
+from parameter_render.spec import RenderSpec
+
+def parse(row, query=None):
+    return parse_render_request("application/json", json.dumps(row).encode("utf-8"), query or {})
+
+def assert_bad_request(row):
+    with pytest.raises(RequestError) as excinfo:
+        parse(row)
+    assert excinfo.value.status == 400
+
+def test_valid_request():
+    spec, scale, encoder = parse({"name": "テスト", "u": 3, "v": "2", "a": True, "bg_color": "#336699"})
+    assert spec.values == ("3", "2", "", "")
+    assert spec.checks[0]
+    assert (scale, encoder) == (1.0, "png")
+
+@pytest.mark.parametrize("value", ["abc", "3.5", "-1", "100", "１", True, 2.5])
+def test_rejects_non_integer_values(value):
+    assert_bad_request({"u": value})
+
+@pytest.mark.parametrize("key", ["bg_color", "text_color", "learned_color"])
+@pytest.mark.parametrize("value", ["#FFF", "#GGGGGG", "336699", "#3366990", 123])
+def test_rejects_invalid_colors(key, value):
+    assert_bad_request({key: value})
+
+@pytest.mark.parametrize("value", ["nan", "inf", "-inf", "abc"])
+def test_rejects_non_finite_font_scale(value):
+    assert_bad_request({"font_scale": value})
+
+@pytest.mark.parametrize("value", [-10, 101, "x"])
+def test_rejects_invalid_bg_alpha(value):
+    assert_bad_request({"bg_alpha": value})
+
+def test_clamps_font_scale():
+    assert parse({"font_scale": 200})[0].font_scale == FONT_SCALE_RANGE[1]
+    assert parse({"font_scale": 0})[0].font_scale == FONT_SCALE_RANGE[0]
+
+@pytest.mark.parametrize("key", ["font", "name", "type", "swap_layout", "u", "a", "t"])
+@pytest.mark.parametrize("value", [["x"], {"x": 1}])
+def test_rejects_non_scalar_values(key, value):
+    assert_bad_request({key: value})
+
+def test_rejects_non_string_name():
+    assert_bad_request({"name": 123})
+
+def test_rejects_long_name():
+    assert parse({"name": "あ" * MAX_NAME_LENGTH})[0].filename == "あ" * MAX_NAME_LENGTH
+    assert_bad_request({"name": "あ" * (MAX_NAME_LENGTH + 1)})
+
+@pytest.mark.parametrize("query", [
+    {"scale": "nan"}, {"scale": "0"}, {"scale": "0.001"}, {"scale": "0.01"}, {"scale": "5"}, {"format": "gif"},
+])
+def test_rejects_invalid_query(query):
+    with pytest.raises(RequestError) as excinfo:
+        parse({}, query)
+    assert excinfo.value.status == 400
+
+def test_rejects_unknown_font():
+    assert_bad_request({"font": "/etc/passwd"})
+
+@pytest.fixture
+def service():
+    from parameter_render.cache import RenderCache
+    from parameter_render.server import RenderService
+
+    service = RenderService(workers=1, queue=1, render_cache=RenderCache())
+    yield service
+    service.shutdown()
+
+def test_unreadable_portrait_is_bad_request(service):
+    spec = RenderSpec(portrait=b"not an image")
+    with pytest.raises(RequestError) as excinfo:
+        service.render(spec, 0.5, "png")
+    assert excinfo.value.status == 400
+
+def test_renders_at_minimum_scale(service):
+    from parameter_render.image import MIN_SCALE
+
+    spec, scale, encoder = parse({"name": "最小"}, {"scale": str(MIN_SCALE)})
+    assert service.render(spec, scale, encoder).startswith(b"\x89PNG")
+
+def test_render_errors_are_not_reported_as_portrait_errors(service, monkeypatch):
+    from parameter_render import image
+
+    def fail(*args):
+        raise OSError("invalid pixel size")
+
+    monkeypatch.setattr(image, "render_encoded", fail)
+    with pytest.raises(OSError):
+        service.render(RenderSpec(filename="フォントの失敗"), 0.5, "png")
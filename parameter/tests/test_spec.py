@@ -0,0 +1,71 @@
+import dataclasses
+
+import pytest
+
+from parameter_render.fonts import LOCAL_FONTS
+from parameter_render.portrait import portrait_digest
+from parameter_render.spec import SKILL_KEYS, SPEC_FORMAT_VERSION, RenderSpec
+
+# pack() の形式や描画結果を変えたら SPEC_FORMAT_VERSION を上げ、ここも更新する
+PINNED_FORMAT_VERSION = 4
+PINNED_PACK = (
+    "040001000800ffffff7f000000ffa500000000000000f03f01003301003200000100310900"
+    "e38386e382b9e38388000000"
+)
+
+def sample_spec(**changes):
+    spec = RenderSpec(
+        values=("3", "2", "", "1"),
+        checks=(True,) + (False,) * (len(SKILL_KEYS) - 2) + (True,),
+        filename="テスト",
+        bg_alpha=50,
+    )
+    return spec.replace(**changes)
+
+def test_format_version_is_pinned():
+    assert SPEC_FORMAT_VERSION == PINNED_FORMAT_VERSION
+    assert sample_spec().pack()[0] == SPEC_FORMAT_VERSION
+
+def test_pack_is_stable():
+    assert sample_spec().pack().hex() == PINNED_PACK
+
+def test_equal_specs_have_equal_digests():
+    assert sample_spec().digest == sample_spec().digest
+    assert sample_spec().digest == RenderSpec.from_inputs(
+        {"u": "3", "v": "2", "x": "1"}, {"a": True, "t": True}, "テスト", bg_alpha=50
+    ).digest
+
+@pytest.mark.parametrize("changes", [
+    {"values": ("3", "2", "", "2")},
+    {"values": ("3", "2", "0", "1")},
+    {"checks": (True,) * len(SKILL_KEYS)},
+    {"filename": "テスト2"},
+    {"charactor_type": True},
+    {"portrait_digest": "00" * 16},
+    {"font_path": next(iter(LOCAL_FONTS.values()), "font.ttf")},
+    {"font_scale": 1.5},
+    {"swap_layout": True},
+    {"bg_color_hex": "#000000"},
+    {"bg_alpha": 49},
+    {"text_color_hex": "#333333"},
+    {"learned_color_hex": "#00FF00"},
+], ids=lambda changes: next(iter(changes)))
+def test_each_field_changes_the_digest(changes):
+    assert sample_spec(**changes).digest != sample_spec().digest
+
+def test_every_field_is_covered_by_the_digest_test():
+    covered = {"values", "checks", "filename", "charactor_type", "portrait_digest", "font_path", "font_scale",
+               "swap_layout", "bg_color_hex", "bg_alpha", "text_color_hex", "learned_color_hex"}
+    # portrait は portrait_digest を通してだけ digest に入る
+    assert {field.name for field in dataclasses.fields(RenderSpec)} - covered == {"portrait"}
+
+def test_portrait_digest():
+    portrait = b"\x89PNG portrait bytes"
+    spec = sample_spec(portrait=portrait)
+    assert spec.portrait_digest == portrait_digest(portrait)
+    assert spec.digest == sample_spec(portrait=bytes(portrait)).digest
+    # 内容ハッシュを渡した場合はバイト列から計算し直さず、同じ digest になる
+    assert spec.digest == sample_spec(portrait_digest=portrait_digest(portrait)).digest
+    assert spec.digest != sample_spec(portrait=portrait + b"!").digest
+    assert spec.digest != sample_spec().digest
+    assert "portrait bytes" not in repr(spec)
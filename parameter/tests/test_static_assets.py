@@ -0,0 +1,27 @@
+import os
+import re
+
+import pytest
+
+from parameter_render import LOCAL_FONTS, static_assets
+
+@pytest.fixture
+def generated_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(static_assets, "GENERATED_DIR", str(tmp_path))
+    static_assets.publish_static_asset.cache_clear()
+    static_assets._publish_font_face.cache_clear()
+    yield tmp_path
+    static_assets.publish_static_asset.cache_clear()
+    static_assets._publish_font_face.cache_clear()
+
+def test_font_face_css_references_published_font(generated_dir):
+    font_path = LOCAL_FONTS["DotGothic16-Regular"]
+    css = static_assets.publish_font_face_css(font_path, "preview-test", "巫覡と付喪神")
+    url = re.search(r"url\('([^']+)'\)", css).group(1)
+    assert url.startswith(static_assets.STATIC_URL_PREFIX + "/")
+    filename = url.rsplit("/", 1)[1]
+    assert os.path.exists(generated_dir / filename)
+
+    # Streamlit の静的配信がフォントとして返す拡張子であること（.css は版によって text/plain になる）
+    starlette_routes = pytest.importorskip("streamlit.web.server.starlette.starlette_routes")
+    assert starlette_routes.guess_content_type(filename).startswith("font/")
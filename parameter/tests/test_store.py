@@ -0,0 +1,24 @@
+from parameter_render.store import DiskRenderStore
+
+def test_overwriting_a_key_does_not_inflate_usage(tmp_path):
+    store = DiskRenderStore(tmp_path, max_bytes=1000)
+    for _ in range(20):
+        assert store.put("abcdef.png", b"x" * 300)
+    assert store.stats()["bytes"] == 300
+    assert store.stats()["evictions"] == 0
+    assert store.get("abcdef.png") == b"x" * 300
+
+def test_overwriting_with_a_different_size(tmp_path):
+    store = DiskRenderStore(tmp_path, max_bytes=1000)
+    store.put("abcdef.png", b"x" * 300)
+    store.put("abcdef.png", b"y" * 100)
+    store.put("123456.png", b"z" * 200)
+    assert store.stats()["bytes"] == 300
+    assert DiskRenderStore(tmp_path, max_bytes=1000).stats()["bytes"] == 300
+
+def test_sweep_removes_least_recently_used(tmp_path):
+    store = DiskRenderStore(tmp_path, max_bytes=1000)
+    for index in range(4):
+        store.put(f"key{index}.png", b"x" * 300)
+    assert store.stats()["bytes"] <= 900
+    assert store.get("key3.png") is not None
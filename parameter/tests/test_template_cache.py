@@ -0,0 +1,45 @@
+import threading
+
+from parameter_render import image
+from parameter_render.image import TemplateCache
+
+class SlowTemplate:
+    """
+    作成中に止められる SheetTemplate の代わり
+    """
+    release = None
+    started = None
+    built = []
+
+    def __init__(self, *key):
+        SlowTemplate.built.append(key)
+        SlowTemplate.started.set()
+        SlowTemplate.release.wait(5)
+
+def template_key(font_path):
+    return (font_path, 1.0, (255, 255, 255, 255), (0, 0, 0), False, 530, 1.0)
+
+def test_cold_build_does_not_block_other_keys(monkeypatch):
+    monkeypatch.setattr(image, "SheetTemplate", SlowTemplate)
+    monkeypatch.setattr(SlowTemplate, "release", threading.Event())
+    monkeypatch.setattr(SlowTemplate, "started", threading.Event())
+    monkeypatch.setattr(SlowTemplate, "built", [])
+    cache = TemplateCache()
+    SlowTemplate.release.set()
+    warm = cache.get(*template_key("warm"))
+    SlowTemplate.release.clear()
+    SlowTemplate.started.clear()
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get(*template_key("cold")))) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    assert SlowTemplate.started.wait(5)
+    # 別のキーの作成中でも、作成済みの下地はすぐに返る
+    assert cache.get(*template_key("warm")) is warm
+    SlowTemplate.release.set()
+    for thread in threads:
+        thread.join(5)
+    assert len(results) == 4 and all(result is results[0] for result in results)
+    assert [key[0] for key in SlowTemplate.built] == ["warm", "cold"]
+    assert cache.stats()["entries"] == 2